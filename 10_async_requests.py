@@ -0,0 +1,239 @@
+"""
+- Why an async HTTP client?
+  requests is synchronous: while it waits for the server, the whole thread waits.
+  To have 1000 requests in flight with requests we need 1000 threads
+  (see 8_concurrent_requests.py), and every thread costs memory and scheduling time.
+
+  asyncio runs many "coroutines" in ONE thread. When a coroutine waits for the
+  network (await ...), the event loop runs another one. So thousands of requests
+  can wait at the same time without a thread per request.
+
+- requests doesn't support asyncio, so we use aiohttp
+  Install it: python -m pip install aiohttp
+
+- AsyncHTTPClient below mirrors what we learned in 3_request.py:
+
+    async with AsyncHTTPClient(max_concurrency=100) as client:
+        response = await client.get(url, params={"key1": "value1"})
+        response.status_code, response.content, response.text, response.json(),
+        response.headers, response.url, response.raise_for_status()
+
+  - same method names: get / post / put / patch / delete / head
+  - same arguments: params, headers, data, json, files, auth=(user, password)
+    (basic auth only: HTTPDigestAuth and other auth objects raise TypeError)
+  - retries with backoff for the same status codes as the Retry() example
+  - max_concurrency: an asyncio.Semaphore, so we never have more than N requests in
+    flight, even if we start 10000 tasks at once
+"""
+
+import asyncio
+import base64
+import json as jsonlib
+
+import aiohttp
+from requests.auth import HTTPBasicAuth, HTTPProxyAuth
+from requests.exceptions import HTTPError  # same exception as requests, so 3_request.py error handling still works
+
+
+class Response:
+    """The parts of requests.Response we use, filled from an aiohttp response."""
+
+    def __init__(self, status_code, content, headers, url, reason="", encoding=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.url = url
+        self.reason = reason
+        self.encoding = encoding
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+    def json(self, **kwargs):
+        return jsonlib.loads(self.content, **kwargs)
+
+    def raise_for_status(self):
+        if 400 <= self.status_code < 600:
+            kind = "Client" if self.status_code < 500 else "Server"
+            raise HTTPError(f"{self.status_code} {kind} Error: {self.reason} for url: {self.url}", response=self)
+
+    def __repr__(self):
+        return f"<Response [{self.status_code}]>"
+
+
+def _basic_auth_header(auth):
+    # accepts ("user", "password") or requests.auth.HTTPBasicAuth, like requests does
+    if isinstance(auth, tuple) and len(auth) == 2:
+        username, password = auth
+    elif isinstance(auth, HTTPBasicAuth) and not isinstance(auth, HTTPProxyAuth):
+        username, password = auth.username, auth.password
+    else:
+        # HTTPDigestAuth, OAuth helpers, ...: sending them as Basic would leak the password
+        raise TypeError(f"AsyncHTTPClient only supports basic auth, not {type(auth).__name__}")
+    token = base64.b64encode(f"{username}:{password}".encode("latin1")).decode("ascii")
+    return "Basic " + token
+
+
+def _form_data(data, files):
+    # requests style files={"file": fileobj} or {"file": ("name.txt", fileobj, "text/plain")}
+    form = aiohttp.FormData()
+    for name, value in (data or {}).items():
+        form.add_field(name, str(value))
+    for name, value in files.items():
+        if isinstance(value, tuple):
+            filename, fileobj, *rest = value
+            form.add_field(name, fileobj, filename=filename, content_type=rest[0] if rest else None)
+        else:
+            form.add_field(name, value, filename=getattr(value, "name", name))
+    return form
+
+
+class AsyncHTTPClient:
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    RETRY_METHODS = ("HEAD", "GET", "OPTIONS")
+
+    def __init__(self, max_concurrency=100, limit_per_host=0, timeout=30, headers=None,
+                 retries=0, backoff_factor=0.5, status_forcelist=RETRY_STATUSES, retry_methods=RETRY_METHODS):
+        self.max_concurrency = max_concurrency
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.headers = headers or {}
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.status_forcelist = set(status_forcelist)
+        self.retry_methods = set(retry_methods)
+        self.session = None
+        self.semaphore = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, limit_per_host=self.limit_per_host)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers=self.headers,
+        )
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _send(self, method, url, params, data, json, headers, auth, files):
+        if files:
+            data = _form_data(data, files)
+        if auth is not None:
+            headers = {**(headers or {}), "Authorization": _basic_auth_header(auth)}
+        async with self.semaphore:
+            async with self.session.request(
+                method, url, params=params, data=data, json=json, headers=headers,
+            ) as response:
+                content = await response.read()
+                return Response(
+                    response.status, content, response.headers, str(response.url),
+                    reason=response.reason or "", encoding=response.charset,
+                )
+
+    async def request(self, method, url, params=None, data=None, json=None, headers=None, auth=None, files=None):
+        method = method.upper()
+        can_retry = method in self.retry_methods
+        attempt = 0
+        while True:
+            try:
+                response = await self._send(method, url, params, data, json, headers, auth, files)
+            except aiohttp.ClientConnectionError:
+                if not can_retry or attempt >= self.retries:
+                    raise
+            else:
+                if not (can_retry and response.status_code in self.status_forcelist and attempt < self.retries):
+                    return response
+            # same backoff formula as urllib3 Retry: backoff_factor * 2 ** attempt
+            await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+            attempt += 1
+
+    async def get(self, url, params=None, **kwargs):
+        return await self.request("GET", url, params=params, **kwargs)
+
+    async def head(self, url, **kwargs):
+        return await self.request("HEAD", url, **kwargs)
+
+    async def post(self, url, data=None, json=None, **kwargs):
+        return await self.request("POST", url, data=data, json=json, **kwargs)
+
+    async def put(self, url, data=None, **kwargs):
+        return await self.request("PUT", url, data=data, **kwargs)
+
+    async def patch(self, url, data=None, **kwargs):
+        return await self.request("PATCH", url, data=data, **kwargs)
+
+    async def delete(self, url, **kwargs):
+        return await self.request("DELETE", url, **kwargs)
+
+
+if __name__ == "__main__":
+    import importlib
+    import io
+    import time
+
+    LocalServer = importlib.import_module("7_local_http_server").LocalServer
+    HTTPClient = importlib.import_module("9_session_client").HTTPClient
+    fetch_all = importlib.import_module("8_concurrent_requests").fetch_all
+
+    N = 200
+    LATENCY = 0.02
+    CONCURRENCY = 50
+
+    async def examples(base):
+        async with AsyncHTTPClient(retries=2, backoff_factor=0.01) as client:
+            response = await client.get(base + "/get", params={"key1": "value1", "key2": "value2"})
+            print(response, response.url, response.json()["args"])
+            print(await client.get(base + "/get", headers={"Authorization": "Bearer YOUR_ACCESS_TOKEN"}))
+            print(await client.get(base + "/get", auth=("username", "password")))
+            print(await client.post(base + "/post", data={"name": "John Doe"}))
+            print(await client.post(base + "/post", json={"key": "value"}))
+            print(await client.post(base + "/post", files={"file": ("file.txt", io.BytesIO(b"hello"))}))
+            try:
+                (await client.get(base + "/status/503")).raise_for_status()
+            except HTTPError as http_err:
+                print(f"HTTP error occurred: {http_err}")
+
+    async def many(url, concurrency):
+        async with AsyncHTTPClient(max_concurrency=concurrency) as client:
+            return await asyncio.gather(*(client.get(url) for _ in range(N)))
+
+    with LocalServer() as server:
+        asyncio.run(examples(server.url))
+        url = f"{server.url}/get?delay={LATENCY}"
+
+        # --------------------------
+        # sync Session path (9_session_client.py), threads (8_concurrent_requests.py) and asyncio
+        # --------------------------
+        with HTTPClient() as client:
+            start = time.perf_counter()
+            for _ in range(N):
+                client.get(url)
+            sync_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = list(fetch_all([url] * N, max_workers=CONCURRENCY, per_host=CONCURRENCY))
+        threads_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        responses = asyncio.run(many(url, concurrency=CONCURRENCY))
+        async_elapsed = time.perf_counter() - start
+
+    assert all(result.outcome == "success" for result in results)
+    assert all(response.status_code == 200 for response in responses)
+    print(f"sync session:  {N} requests in {sync_elapsed:.2f}s (one after the other)")
+    print(f"thread pool:   {N} requests in {threads_elapsed:.2f}s ({CONCURRENCY} threads)")
+    print(f"async client:  {N} requests in {async_elapsed:.2f}s "
+          f"(max_concurrency={CONCURRENCY}, all in one thread)")
@@ -0,0 +1,301 @@
+"""
+- Why cache HTTP responses?
+  In 3_request.py we call the same URLs again and again (https://api.github.com,
+  api.example.com/data). If the data didn't change, downloading the full body every
+  time wastes time, bandwidth and, with rate-limited APIs, our request quota.
+
+- HTTP already tells us what we may cache, with response headers:
+
+    Cache-Control: max-age=60   -> the response is "fresh" for 60 seconds, reuse it without asking
+    Cache-Control: no-cache     -> we may store it, but must ask the server before every reuse
+    Cache-Control: no-store     -> don't store it at all
+    Expires: <date>             -> older way of saying max-age
+
+  and how to ask "did it change?" cheaply (conditional requests):
+
+    ETag: "abc123"                  -> we send back  If-None-Match: "abc123"
+    Last-Modified: <date>           -> we send back  If-Modified-Since: <date>
+
+  If nothing changed the server answers "304 Not Modified" with NO body,
+  and we serve the body we already have. That is called revalidation.
+
+- CachingClient below sits in front of the GET path of HTTPClient (9_session_client.py):
+  - an in-memory LRU (least recently used) cache with a byte budget,
+    when it is full the entry we used longest ago is thrown away
+  - optionally a directory on disk, so the cache survives restarts
+  - counters: hits (served without network), misses (full download),
+    revalidations (304, served from cache after a cheap request)
+"""
+
+import hashlib
+import importlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+HTTPClient = importlib.import_module("9_session_client").HTTPClient
+
+CACHEABLE_STATUSES = {200, 203, 300, 301, 308, 404, 410}
+# what a 304 may update in the stored response; its Content-Length: 0 etc. describe the 304 itself
+REVALIDATION_HEADERS = ("Cache-Control", "Expires", "ETag", "Last-Modified", "Date")
+
+
+def parse_cache_control(value):
+    directives = {}
+    for part in (value or "").split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"') or None
+    return directives
+
+
+def freshness_lifetime(headers, now):
+    """Seconds the response may be reused without asking the server, None if not cacheable."""
+    cache_control = parse_cache_control(headers.get("Cache-Control"))
+    if "no-store" in cache_control:
+        return None
+    if "no-cache" in cache_control:
+        return 0
+    try:
+        age = max(int(headers.get("Age", 0) or 0), 0)
+    except ValueError:
+        age = 0  # a malformed Age is ignored
+    if "max-age" in cache_control:
+        try:
+            return max(int(cache_control["max-age"]) - age, 0)
+        except (TypeError, ValueError):
+            return 0
+    if "Expires" in headers:
+        try:
+            return max(parsedate_to_datetime(headers["Expires"]).timestamp() - now, 0)
+        except (TypeError, ValueError):
+            return 0  # an invalid Expires means "already expired"
+    if "ETag" in headers or "Last-Modified" in headers:
+        return 0  # no freshness info, but we can still revalidate
+    return None
+
+
+class CacheEntry:
+    def __init__(self, url, status_code, headers, content, expires_at):
+        self.url = url
+        self.status_code = status_code
+        self.headers = dict(headers)
+        self.content = content
+        self.expires_at = expires_at
+
+    @property
+    def size(self):
+        return len(self.content) + sum(len(k) + len(v) for k, v in self.headers.items())
+
+    def is_fresh(self, now):
+        return now < self.expires_at
+
+    def to_response(self):
+        response = requests.Response()
+        response.status_code = self.status_code
+        response.headers = CaseInsensitiveDict(self.headers)
+        response._content = self.content
+        response.url = self.url
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.reason = "OK" if self.status_code == 200 else ""
+        response.from_cache = True
+        return response
+
+    # --- on disk: <key>.json with the metadata and <key>.body with the raw bytes
+    def dump(self, path):
+        with open(path + ".body.tmp", "wb") as body:
+            body.write(self.content)
+        with open(path + ".json.tmp", "w") as meta:
+            json.dump({"url": self.url, "status_code": self.status_code,
+                       "headers": self.headers, "expires_at": self.expires_at}, meta)
+        os.replace(path + ".body.tmp", path + ".body")
+        os.replace(path + ".json.tmp", path + ".json")
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path + ".json") as meta_file, open(path + ".body", "rb") as body:
+                meta = json.load(meta_file)
+                return cls(meta["url"], meta["status_code"], meta["headers"], body.read(), meta["expires_at"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+
+class LRUCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self.pop(key)
+        if entry.size > self.max_bytes:
+            return  # bigger than the whole budget, don't flush everything for it
+        self.entries[key] = entry
+        self.current_bytes += entry.size
+        while self.current_bytes > self.max_bytes:
+            _, oldest = self.entries.popitem(last=False)
+            self.current_bytes -= oldest.size
+            self.evictions += 1
+
+    def pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry.size
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+    def as_dict(self):
+        return {"hits": self.hits, "misses": self.misses, "revalidations": self.revalidations}
+
+
+class CachingClient:
+    # request headers that change the response, part of the cache key
+    KEY_HEADERS = ("Authorization", "Accept", "Accept-Language")
+
+    def __init__(self, client=None, max_bytes=64 * 1024 * 1024, cache_dir=None):
+        self.client = client or HTTPClient()
+        self.memory = LRUCache(max_bytes)
+        self.cache_dir = cache_dir
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.stats = CacheStats()
+        self.lock = threading.Lock()
+
+    def cache_key(self, url, params, headers):
+        full_url = requests.Request("GET", url, params=params).prepare().url
+        merged = CaseInsensitiveDict(self.client.session.headers)
+        merged.update(headers)
+        varying = [f"{name}:{merged.get(name, '')}" for name in self.KEY_HEADERS]
+        return full_url, hashlib.sha256("\n".join([full_url] + varying).encode("utf-8")).hexdigest()
+
+    def lookup(self, key):
+        with self.lock:
+            entry = self.memory.get(key)
+        if entry is None and self.cache_dir:
+            entry = CacheEntry.load(os.path.join(self.cache_dir, key))
+            if entry is not None:
+                with self.lock:
+                    self.memory.put(key, entry)
+        return entry
+
+    def store(self, key, entry):
+        with self.lock:
+            self.memory.put(key, entry)
+        if self.cache_dir:
+            entry.dump(os.path.join(self.cache_dir, key))
+
+    def forget(self, key):
+        with self.lock:
+            self.memory.pop(key)
+        if self.cache_dir:
+            for suffix in (".json", ".body"):
+                try:
+                    os.remove(os.path.join(self.cache_dir, key) + suffix)
+                except FileNotFoundError:
+                    pass
+
+    def count(self, name):
+        with self.lock:
+            setattr(self.stats, name, getattr(self.stats, name) + 1)
+
+    def get(self, url, params=None, headers=None, **kwargs):
+        headers = dict(headers or {})
+        if kwargs.get("auth") is not None or kwargs.get("stream"):
+            # credentials passed as auth=... are not visible in the key, don't mix them up
+            return self.client.get(url, params=params, headers=headers, **kwargs)
+
+        full_url, key = self.cache_key(url, params, headers)
+        entry = self.lookup(key)
+        now = time.time()
+        if entry is not None and entry.is_fresh(now):
+            self.count("hits")
+            return entry.to_response()
+
+        if entry is not None:
+            if "ETag" in entry.headers:
+                headers["If-None-Match"] = entry.headers["ETag"]
+            if "Last-Modified" in entry.headers:
+                headers["If-Modified-Since"] = entry.headers["Last-Modified"]
+
+        response = self.client.get(url, params=params, headers=headers, **kwargs)
+        now = time.time()
+
+        if response.status_code == 304 and entry is not None:
+            self.count("revalidations")
+            # a 304 carries updated Cache-Control/Expires/ETag. The entry in the LRU stays as it is
+            # (its size is accounted for), the merged headers go into a new one.
+            merged = CaseInsensitiveDict(entry.headers)
+            merged.update({name: response.headers[name] for name in REVALIDATION_HEADERS if name in response.headers})
+            lifetime = freshness_lifetime(merged, now)
+            entry = CacheEntry(entry.url, entry.status_code, merged, entry.content, now + (lifetime or 0))
+            self.store(key, entry)
+            return entry.to_response()
+
+        self.count("misses")
+        lifetime = freshness_lifetime(response.headers, now)
+        if response.status_code in CACHEABLE_STATUSES and lifetime is not None:
+            self.store(key, CacheEntry(full_url, response.status_code, response.headers, response.content, now + lifetime))
+        elif entry is not None:
+            self.forget(key)
+        response.from_cache = False
+        return response
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    LocalServer = importlib.import_module("7_local_http_server").LocalServer
+
+    with LocalServer() as server, tempfile.TemporaryDirectory() as cache_dir:
+        cache = CachingClient(cache_dir=cache_dir)
+
+        # fresh for 1 second: the first call downloads, the next ones are served from memory
+        for _ in range(5):
+            cache.get(server.url + "/cached", params={"max_age": 1})
+        print("max-age=1, 5 calls:", cache.stats.as_dict(), "server saw", server.hits["/cached"])
+
+        # after it expires we ask again, the server answers 304 and we reuse the body
+        time.sleep(1.1)
+        response = cache.get(server.url + "/cached", params={"max_age": 1})
+        print("after expiry:", cache.stats.as_dict(), "status", response.status_code, "from cache", response.from_cache)
+
+        # no-cache: every use is revalidated, but the body is downloaded only once
+        for _ in range(3):
+            cache.get(server.url + "/cached", params={"cache_control": "no-cache"})
+        print("no-cache, 3 calls:", cache.stats.as_dict())
+
+        # the disk store survives a new client (e.g. a restarted process)
+        restarted = CachingClient(cache_dir=cache_dir)
+        restarted.get(server.url + "/cached", params={"max_age": 60})
+        restarted.get(server.url + "/cached", params={"max_age": 60})
+        reopened = CachingClient(cache_dir=cache_dir)
+        reopened.get(server.url + "/cached", params={"max_age": 60})
+        print("reopened from disk:", reopened.stats.as_dict())
+
+        # a 20 KB budget holds only a few 5 KB responses, the oldest are evicted
+        small = CachingClient(max_bytes=20 * 1024)
+        for i in range(10):
+            small.get(server.url + "/cached", params={"size": 5000, "i": i})
+        print("LRU:", len(small.memory.entries), "entries,", small.memory.current_bytes, "bytes,",
+              small.memory.evictions, "evictions")
+        print("Expires header example:", freshness_lifetime({"Expires": formatdate(time.time() + 30, usegmt=True)}, time.time()))
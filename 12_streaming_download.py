@@ -0,0 +1,192 @@
+"""
+- What is the problem with response.content / response.text for big files?
+  In 3_request.py we did:
+
+    print(response.content)   # the whole body as bytes
+    print(response.text)      # the whole body decoded again as str
+
+  requests downloads the complete body into memory before we can touch it, and
+  .text makes a second (decoded) copy. For a 5 GB file that is 5+ GB of RAM.
+
+- Streaming
+  With stream=True requests only reads the headers. The body stays in the socket
+  and we pull it piece by piece:
+
+    with requests.get(url, stream=True) as response:
+        for chunk in response.iter_content(chunk_size=1024 * 1024):
+            file.write(chunk)
+
+  iter_content still creates a new bytes object for every chunk. Below we go one step
+  further and read into ONE reusable buffer:
+
+    buffer = bytearray(chunk_size)    # allocated once
+    view = memoryview(buffer)         # slicing a memoryview doesn't copy
+    n = response.raw.readinto(view)   # fill the buffer from the socket
+    file.write(view[:n])
+
+  (urllib3 still copies each chunk once internally, but the memory we use is
+  always about chunk_size, whatever the size of the body.)
+
+- Resume with Range requests
+  If the connection drops after 3 GB we don't want to start again. We ask the server
+  only for the missing part:
+
+    Range: bytes=3000000000-      -> server answers "206 Partial Content"
+
+  A server that doesn't support ranges answers 200 with the full body, so then we
+  start from the beginning. A 206 for another offset than ours (Content-Range:
+  bytes 0-.../...) is an error: appending it would corrupt the file.
+
+- Memory-mapped target
+  download_to_mmap() pre-sizes the file and reads straight into the mapped pages,
+  so the file itself is the buffer. If the download fails the file is removed, a
+  full-size file of zeros would look complete.
+"""
+
+import importlib
+import mmap
+import os
+import traceback
+
+HTTPClient = importlib.import_module("9_session_client").HTTPClient
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def download(url, path, client=None, chunk_size=CHUNK_SIZE, resume=True, progress=None):
+    """Stream url into path with a constant-size buffer, returns the file size."""
+    client = client or HTTPClient()
+    offset = os.path.getsize(path) if resume and os.path.exists(path) else 0
+    # identity: we want the raw bytes, a compressed body can't be resumed by byte offset
+    headers = {"Accept-Encoding": "identity"}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+
+    with client.get(url, headers=headers, stream=True) as response:
+        if response.status_code == 416 and response.headers.get("Content-Range") == f"bytes */{offset}":
+            return offset  # we already have the whole file
+        response.raise_for_status()
+        if response.status_code != 206:
+            offset = 0  # the server ignored the Range header, start again
+        else:
+            content_range = response.headers.get("Content-Range", "")
+            if not content_range.startswith(f"bytes {offset}-"):
+                raise IOError(f"asked for bytes {offset}-, the server sent {content_range or 'no Content-Range'}")
+
+        buffer = bytearray(chunk_size)
+        view = memoryview(buffer)
+        with open(path, "ab" if offset else "wb") as file:
+            while True:
+                n = response.raw.readinto(view)
+                if not n:
+                    break
+                file.write(view[:n])
+                offset += n
+                if progress:
+                    progress(offset)
+    return offset
+
+
+def download_to_mmap(url, path, client=None, chunk_size=CHUNK_SIZE):
+    """Stream url directly into a memory-mapped file, the body size must be known."""
+    client = client or HTTPClient()
+    with client.get(url, headers={"Accept-Encoding": "identity"}, stream=True) as response:
+        response.raise_for_status()
+        size = int(response.headers["Content-Length"])
+        try:
+            with open(path, "w+b") as file:
+                file.truncate(size)
+                if size == 0:
+                    return 0
+                with mmap.mmap(file.fileno(), size) as mapped:
+                    target = memoryview(mapped)
+                    position = 0
+                    try:
+                        while position < size:
+                            n = response.raw.readinto(target[position:position + chunk_size])
+                            if not n:
+                                raise IOError(f"connection closed after {position} of {size} bytes")
+                            position += n
+                    except BaseException as err:
+                        # the frames in the traceback (urllib3's readinto) still hold views of the mmap
+                        traceback.clear_frames(err.__traceback__)
+                        raise
+                    finally:
+                        target.release()  # mmap can't be closed while a view exists
+        except BaseException:
+            os.remove(path)  # the zeros after `position` would look like data
+            raise
+    return size
+
+
+if __name__ == "__main__":
+    import multiprocessing
+    import resource
+    import tempfile
+    import time
+
+    LocalServer = importlib.import_module("7_local_http_server").LocalServer
+
+    def expected(size):
+        # the stub server sends byte i as i % 256
+        return (bytes(range(256)) * (size // 256 + 1))[:size]
+
+    def max_rss():
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # KB on Linux
+
+    def measure_in_child(func, results):
+        # ru_maxrss only grows, so every way gets a fresh process and we take its growth
+        before = max_rss()
+        start = time.perf_counter()
+        func()
+        results.put((max_rss() - before, time.perf_counter() - start))
+
+    def peak_memory(func):
+        results = multiprocessing.get_context("fork").Queue()
+        child = multiprocessing.get_context("fork").Process(target=measure_in_child, args=(func, results))
+        child.start()
+        result = results.get()
+        child.join()
+        return result
+
+    with LocalServer() as server, tempfile.TemporaryDirectory() as tmp, HTTPClient() as client:
+        path = os.path.join(tmp, "download.bin")
+
+        # --------------------------
+        # resume after the connection drops
+        # --------------------------
+        size = 10 * 1024 * 1024
+        try:
+            download(f"{server.url}/bytes/{size}?fail_after={size // 3}", path, client)
+        except Exception as err:
+            print(f"first try failed after {os.path.getsize(path)} bytes: {type(err).__name__}")
+        download(f"{server.url}/bytes/{size}?fail_after={size // 3}", path, client)
+        with open(path, "rb") as file:
+            print("resumed download is correct:", file.read() == expected(size))
+
+        # a failed mmap download leaves no file behind
+        mmap_path = os.path.join(tmp, "mmap.bin")
+        try:
+            download_to_mmap(f"{server.url}/bytes/{size}?fail_after={size // 3}", mmap_path, client)
+        except Exception as err:
+            print(f"download_to_mmap() failed ({type(err).__name__}), file left behind: {os.path.exists(mmap_path)}")
+
+        # --------------------------
+        # memory: response.content vs streaming, the growth of the max RSS of a fresh process
+        # (for download_to_mmap() that includes the mapped pages, the OS can write them out and drop them)
+        # --------------------------
+        for size in (16 * 1024 * 1024, 64 * 1024 * 1024):
+            url = f"{server.url}/bytes/{size}"
+
+            def whole_body():
+                with open(path, "wb") as file:
+                    file.write(HTTPClient().get(url).content)
+
+            results = {
+                "response.content": peak_memory(whole_body),
+                "download()": peak_memory(lambda: download(url, path, HTTPClient(), resume=False)),
+                "download_to_mmap()": peak_memory(lambda: download_to_mmap(url, path, HTTPClient())),
+            }
+            for name, (rss, elapsed) in results.items():
+                print(f"{size // 2**20:>3} MB body, {name:<19} max RSS +{rss / 2**20:7.1f} MB, "
+                      f"{size / elapsed / 2**20:7.1f} MB/s")
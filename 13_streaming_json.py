@@ -0,0 +1,210 @@
+"""
+- What is the problem with response.json() for big lists?
+  response.json() waits for the complete body, then builds one huge Python list.
+  For an endpoint that returns millions of records:
+    - we need memory for the raw body AND for all the Python objects at once
+    - we can't process the first record until the last byte has arrived
+
+- Streaming JSON decoding
+  A JSON array is just  [ item , item , item ]  so we can read the bytes as they arrive
+  (stream=True + iter_content) and decode ONE item at a time with
+  json.JSONDecoder().raw_decode(), which decodes a value from the start of a string
+  and tells us where it ended. Every item is handed to us (yield) as soon as its last
+  byte arrived, and then forgotten, so memory stays about the size of one item.
+
+    for record in stream_items(url):
+        ...
+
+  Often the list is inside an object, e.g. {"page": 1, "items": [...]}. Then we give
+  the path to the list: stream_items(url, path="items"), or "data.items" for deeper ones.
+
+- Pagination
+  As we saw with the `params` parameter in 3_request.py, many APIs return the list in
+  pages. paginate() follows the pages for us and yields the items of all pages as one
+  lazy generator:
+    - the standard Link header:  Link: <https://api.example.com/items?page=2>; rel="next"
+      (requests parses it for us into response.links)
+    - or a page number query parameter: page_param="page"
+"""
+
+import codecs
+import importlib
+import json
+
+HTTPClient = importlib.import_module("9_session_client").HTTPClient
+
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = " \t\n\r"
+NUMBER_END = WHITESPACE + ",]}"
+
+
+class _Reader:
+    """Text buffer over an iterator of byte chunks, refilled on demand."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def more(self):
+        # drop what we already consumed, so the buffer doesn't grow with the body
+        if self.pos > CHUNK_SIZE:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        for chunk in self.chunks:
+            text = self.decoder.decode(chunk)
+            if text:
+                self.buffer += text
+                return True
+        self.buffer += self.decoder.decode(b"", final=True)
+        self.eof = True
+        return False
+
+    def peek(self):
+        # next non-whitespace character, "" at the end of the body
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.more():
+                return ""
+
+    def expect(self, chars):
+        char = self.peek()
+        if char not in chars or not char:
+            raise json.JSONDecodeError(f"Expecting one of {chars!r}", self.buffer, self.pos)
+        self.pos += 1
+        return char
+
+    def value(self, decoder=json.JSONDecoder()):
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self.more()
+                continue
+            # "12" or "-0.5" at the end of the buffer may still become "1234" or "-0.5e3",
+            # only numbers have this problem: accept them once a delimiter follows
+            if (not self.eof and self.buffer[self.pos] in "-0123456789"
+                    and (end == len(self.buffer) or self.buffer[end] not in NUMBER_END)):
+                self.more()
+                continue
+            self.pos = end
+            return value
+
+
+def iter_items(chunks, path=""):
+    """Yield the elements of the JSON array at `path` while the byte `chunks` arrive."""
+    reader = _Reader(chunks)
+    for key in [part for part in path.split(".") if part]:
+        # walk into the object until we find `key`, other values are decoded and dropped
+        reader.expect("{")
+        while True:
+            if reader.peek() == "}":
+                return
+            name = reader.value()
+            reader.expect(":")
+            if name == key:
+                break
+            reader.value()
+            if reader.expect(",}") == "}":
+                return
+
+    reader.expect("[")
+    if reader.peek() == "]":
+        return
+    while True:
+        yield reader.value()
+        if reader.expect(",]") == "]":
+            return
+
+
+def stream_items(url, path="", client=None, **kwargs):
+    client = client or HTTPClient()
+    with client.get(url, stream=True, **kwargs) as response:
+        response.raise_for_status()
+        yield from iter_items(response.iter_content(CHUNK_SIZE), path)
+
+
+def paginate(url, path="", client=None, params=None, page_param=None, **kwargs):
+    """Yield the items of every page, following Link rel="next" or incrementing page_param."""
+    client = client or HTTPClient()
+    params = dict(params or {})
+    if page_param:
+        params.setdefault(page_param, 1)
+    while url:
+        count = 0
+        with client.get(url, params=params, stream=True, **kwargs) as response:
+            response.raise_for_status()
+            for item in iter_items(response.iter_content(CHUNK_SIZE), path):
+                count += 1
+                yield item
+            next_url = response.links.get("next", {}).get("url")
+        if next_url:
+            url, params = next_url, None  # the next link already has the query string
+        elif page_param and count and params is not None:  # after a next link the server does the paging
+            params[page_param] += 1
+        else:
+            url = None
+
+
+if __name__ == "__main__":
+    import time
+    import tracemalloc
+
+    LocalServer = importlib.import_module("7_local_http_server").LocalServer
+
+    # some tricky inputs, split into 1 byte chunks
+    sample = '{"meta": {"n": [1, 2]}, "data": {"items": [1234, "a,b]", {"x": [1, {}]}, -0.5e3, null]}}'.encode()
+    print(list(iter_items([sample[i:i + 1] for i in range(len(sample))], path="data.items")))
+
+    N = 300_000
+
+    with LocalServer() as server, HTTPClient() as client:
+        url = f"{server.url}/records/{N}"
+
+        # both return (sum of the values, seconds until the first record was available)
+        def with_json():
+            start = time.perf_counter()
+            records = client.get(url).json()
+            first_item_after = time.perf_counter() - start
+            return sum(record["value"] for record in records), first_item_after
+
+        def with_stream():
+            start = time.perf_counter()
+            total, first_item_after = 0, None
+            for record in stream_items(url, client=client):
+                if first_item_after is None:
+                    first_item_after = time.perf_counter() - start
+                total += record["value"]
+            return total, first_item_after
+
+        # time first, then peak memory in a second run (tracemalloc slows down allocations a lot)
+        for name, func in (("response.json()", with_json), ("stream_items()", with_stream)):
+            start = time.perf_counter()
+            total, first_item_after = func()
+            elapsed = time.perf_counter() - start
+            tracemalloc.start()
+            assert func()[0] == total
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{name:<16} {elapsed:.2f}s, peak {peak / 2**20:6.1f} MB, "
+                  f"first record after {first_item_after * 1000:7.1f}ms")
+
+        # --------------------------
+        # pagination: 3 pages (Link header), consumed as one generator
+        # --------------------------
+        ids = [item["id"] for item in paginate(server.url + "/items", path="items", client=client,
+                                               params={"per_page": 100, "total": 250})]
+        print("Link pagination:", len(ids), "items, pages requested:", server.hits["/items"])
+        pages = paginate(server.url + "/items", path="items", client=client, page_param="page",
+                         params={"per_page": 100, "total": 250})
+        print("first item of a lazy paginated stream:", next(pages))
+        # the Link header wins over page_param, every page is read once
+        assert 1 + sum(1 for _ in pages) == 250
@@ -0,0 +1,201 @@
+"""
+- What is wrong with the upload example in 3_request.py?
+
+    files = {'file': open('file.txt', 'rb')}
+    response = requests.post(url, files=files)
+
+  1. The file is never closed (we should use `with open(...)`).
+  2. requests builds the complete multipart/form-data body in memory before sending
+     it. A 2 GB artifact means 2 GB+ of RAM, for every upload running at the same time.
+
+- What does a multipart/form-data body look like?
+
+    --boundary\\r\\n
+    Content-Disposition: form-data; name="file"; filename="file.txt"\\r\\n
+    Content-Type: application/octet-stream\\r\\n
+    \\r\\n
+    <the file bytes>\\r\\n
+    --boundary--\\r\\n
+
+  Only the small header lines are generated, the big part is the file itself.
+  So we can produce the body as a generator: yield the headers, then read the file
+  in chunks and yield them one by one. requests sends whatever an iterable yields:
+
+    - if the iterable has a length (__len__), requests sets Content-Length
+    - if not, requests uses "Transfer-Encoding: chunked" (size not needed in advance)
+
+  Memory per upload is then about one chunk, whatever the size of the file.
+
+- Instrumentation
+  on_progress(filename, bytes_sent, total_bytes, seconds) is called for every chunk,
+  and on_file_done(filename, size, seconds) when a file part has been sent completely,
+  so we can show progress bars, bytes/sec and per-file timings.
+"""
+
+import importlib
+import mimetypes
+import os
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+HTTPClient = importlib.import_module("9_session_client").HTTPClient
+
+CHUNK_SIZE = 256 * 1024
+
+UploadResult = namedtuple("UploadResult", ["path", "status_code", "bytes", "seconds", "error"])
+
+
+def quote_param(value):
+    # like browsers and urllib3: a '"' would end the quoted string, CR/LF the header
+    return value.replace('"', "%22").replace("\r", "%0D").replace("\n", "%0A")
+
+
+class MultipartStream:
+    """multipart/form-data body that reads files from disk chunk by chunk while it is sent."""
+
+    def __init__(self, fields=None, files=None, chunk_size=CHUNK_SIZE, on_progress=None, on_file_done=None):
+        # files: {"field": "path/to/file"} or {"field": ("filename", "path/to/file", "content/type")}
+        self.boundary = uuid.uuid4().hex
+        self.chunk_size = chunk_size
+        self.on_progress = on_progress
+        self.on_file_done = on_file_done
+        self.parts = []  # (header bytes, path or None, value bytes or None, filename)
+        for name, value in (fields or {}).items():
+            header = f'--{self.boundary}\r\nContent-Disposition: form-data; name="{quote_param(name)}"\r\n\r\n'
+            self.parts.append((header.encode("utf-8"), None, str(value).encode("utf-8"), None))
+        for name, value in (files or {}).items():
+            filename, path, content_type = value if isinstance(value, tuple) else (os.path.basename(value), value, None)
+            content_type = content_type or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+            header = (f'--{self.boundary}\r\n'
+                      f'Content-Disposition: form-data; name="{quote_param(name)}"; '
+                      f'filename="{quote_param(filename)}"\r\n'
+                      f'Content-Type: {content_type}\r\n\r\n')
+            self.parts.append((header.encode("utf-8"), path, None, filename))
+        self.closing = f"--{self.boundary}--\r\n".encode("ascii")
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        size = len(self.closing)
+        for header, path, value, _ in self.parts:
+            size += len(header) + (os.path.getsize(path) if path else len(value)) + 2
+        return size
+
+    def __iter__(self):
+        # one buffer for the whole upload; requests/urllib3 send every chunk before asking for
+        # the next one, so handing out views of the same buffer is safe
+        buffer = bytearray(self.chunk_size)
+        view = memoryview(buffer)
+        for header, path, value, filename in self.parts:
+            yield header
+            if path is None:
+                yield value
+            else:
+                total = os.path.getsize(path)
+                sent = 0
+                start = time.perf_counter()
+                with open(path, "rb") as file:
+                    while True:
+                        n = file.readinto(buffer)
+                        if not n:
+                            break
+                        yield view[:n]
+                        sent += n
+                        if self.on_progress:
+                            self.on_progress(filename, sent, total, time.perf_counter() - start)
+                if self.on_file_done:
+                    self.on_file_done(filename, sent, time.perf_counter() - start)
+            yield b"\r\n"
+        yield self.closing
+
+
+def upload_file(url, path, field="file", fields=None, client=None, chunked=False, **stream_options):
+    client = client or HTTPClient()
+    body = MultipartStream(fields=fields, files={field: path}, **stream_options)
+    # a plain generator has no len(), so requests switches to chunked transfer encoding
+    data = iter(body) if chunked else body
+    return client.post(url, data=data, headers={"Content-Type": body.content_type})
+
+
+def upload_many(url, paths, max_workers=4, field="file", fields=None, client=None, **stream_options):
+    """Upload every path on its own request, max_workers at a time, yield UploadResults as they finish."""
+    client = client or HTTPClient(pool_maxsize=max_workers)
+
+    def upload(path):
+        start = time.perf_counter()
+        try:
+            response = upload_file(url, path, field, fields, client, **stream_options)
+            response.raise_for_status()
+        except Exception as err:
+            return UploadResult(path, None, 0, time.perf_counter() - start, err)
+        return UploadResult(path, response.status_code, os.path.getsize(path), time.perf_counter() - start, None)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for future in as_completed([pool.submit(upload, path) for path in paths]):
+            yield future.result()
+
+
+if __name__ == "__main__":
+    import tempfile
+    import tracemalloc
+
+    LocalServer = importlib.import_module("7_local_http_server").LocalServer
+
+    def make_file(path, size):
+        with open(path, "wb") as file:
+            for _ in range(size // 2**20):
+                file.write(os.urandom(2**20))
+        return path
+
+    with LocalServer() as server, tempfile.TemporaryDirectory() as tmp, HTTPClient() as client:
+        url = server.url + "/upload"
+        big = make_file(os.path.join(tmp, "artifact.bin"), 64 * 2**20)
+
+        # --------------------------
+        # memory: files={...} vs streaming
+        # --------------------------
+        tracemalloc.start()
+        with open(big, "rb") as file:
+            client.post(url, files={"file": file})
+        in_memory_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        last_report = []
+
+        def on_progress(filename, sent, total, seconds):
+            if sent == total or not last_report or seconds - last_report[-1] > 0.1:
+                last_report.append(seconds)
+                print(f"\r{filename}: {sent * 100 // total:3d}% {sent / max(seconds, 1e-9) / 2**20:8.1f} MB/s", end="")
+
+        tracemalloc.start()
+        response = upload_file(url, big, client=client, fields={"build": "42"}, on_progress=on_progress)
+        streaming_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print()
+        print("server received:", response.json()["bytes"], "bytes, chunked:", response.json()["chunked"])
+        print(f"files=...:        peak {in_memory_peak / 2**20:6.1f} MB")
+        print(f"MultipartStream:  peak {streaming_peak / 2**20:6.1f} MB")
+
+        # the body is the same with chunked transfer encoding, only the framing changes
+        response = upload_file(url, big, client=client, chunked=True)
+        print("chunked upload, server received:", response.json()["bytes"], "bytes, chunked:", response.json()["chunked"])
+
+        # --------------------------
+        # many files at once, with per-file timing
+        # --------------------------
+        paths = [make_file(os.path.join(tmp, f"part-{i}.bin"), 16 * 2**20) for i in range(8)]
+        start = time.perf_counter()
+        total = 0
+
+        def on_file_done(filename, size, seconds):
+            print(f"  {filename}: body sent in {seconds:.2f}s ({size / seconds / 2**20:.1f} MB/s)")
+
+        for result in upload_many(url, paths, max_workers=4, on_file_done=on_file_done):
+            total += result.bytes
+            print(f"{os.path.basename(result.path)}: {result.status_code}, request took {result.seconds:.2f}s")
+        elapsed = time.perf_counter() - start
+        print(f"{len(paths)} files, {total / 2**20:.0f} MB in {elapsed:.2f}s = {total / elapsed / 2**20:.1f} MB/s")
@@ -0,0 +1,239 @@
+"""
+- OAuth 2.0 client credentials, the naive way (from 3_request.py)
+
+    response = requests.post(token_url, data={'grant_type': 'client_credentials'}, auth=(client_id, client_secret))
+    token = response.json().get('access_token')
+    response = requests.get('https://api.example.com/data', headers={'Authorization': f'Bearer {token}'})
+
+  If we do this before every API call, every call costs TWO requests. But the token
+  endpoint also tells us how long the token is valid:
+
+    {"access_token": "...", "token_type": "bearer", "expires_in": 3600}
+
+  So we can keep the token and reuse it for the next hour.
+
+- Things to take care of
+  1. Refresh a bit BEFORE it expires (refresh_margin), otherwise requests that are
+     in flight when it expires fail with 401.
+  2. Proactive refresh: when the token is close to expiring we fetch the new one in a
+     background thread, and callers keep using the old (still valid) token meanwhile.
+  3. Thundering herd: when there is no valid token and 50 threads need one at the
+     same moment, only ONE of them calls the token endpoint, the others wait for it.
+  4. If the API still says 401 (token revoked), throw the token away and retry once.
+
+- Auth objects
+  requests lets us plug this into any request with auth=..., like HTTPBasicAuth:
+
+    auth = BearerAuth(ClientCredentialsTokenProvider(token_url, client_id, client_secret))
+    requests.get('https://api.example.com/data', auth=auth)
+
+  ApiKeyAuth does the same for the "Authorization: ApiKey ..." example.
+"""
+
+import asyncio
+import importlib
+import threading
+import time
+
+from requests.auth import AuthBase
+
+HTTPClient = importlib.import_module("9_session_client").HTTPClient
+
+
+class ClientCredentialsTokenProvider:
+    def __init__(self, token_url, client_id, client_secret, scope=None, refresh_margin=30, client=None):
+        self.token_url = token_url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.scope = scope
+        self.refresh_margin = refresh_margin
+        self.client = client or HTTPClient()
+
+        self.lock = threading.Lock()
+        self.refreshed = threading.Condition(self.lock)
+        self.token = None
+        self.expires_at = 0.0
+        self.refreshing = False
+        self.generation = 0  # incremented after every refresh attempt
+        self.error = None
+        self.fetches = 0  # calls to the token endpoint
+
+    def fetch_token(self):
+        data = {"grant_type": "client_credentials"}
+        if self.scope:
+            data["scope"] = self.scope
+        response = self.client.post(self.token_url, data=data, auth=(self.client_id, self.client_secret))
+        response.raise_for_status()
+        payload = response.json()
+        return payload["access_token"], float(payload.get("expires_in", 3600))
+
+    def refresh(self):
+        # only ever runs in one thread at a time, self.refreshing guards it
+        started = time.monotonic()
+        try:
+            token, expires_in = self.fetch_token()
+            error = None
+        except Exception as err:
+            token, expires_in, error = None, 0, err
+        with self.lock:
+            self.fetches += 1
+            self.refreshing = False
+            self.generation += 1
+            self.error = error
+            if error is None:
+                # count the lifetime from when we asked, the response took some time too
+                self.token, self.expires_at = token, started + expires_in
+            self.refreshed.notify_all()
+
+    def get_token(self):
+        with self.lock:
+            while True:
+                now = time.monotonic()
+                if self.token is not None and now < self.expires_at - self.refresh_margin:
+                    return self.token
+                if self.token is not None and now < self.expires_at:
+                    # still valid, but expiring soon: refresh in the background, use this one meanwhile
+                    if not self.refreshing:
+                        self.refreshing = True
+                        threading.Thread(target=self.refresh, daemon=True).start()
+                    return self.token
+                if not self.refreshing:
+                    self.refreshing = True
+                    break  # this thread fetches the token, everybody else waits below
+                generation = self.generation
+                self.refreshed.wait()
+                if self.generation != generation and self.error is not None and self.token is None:
+                    raise self.error
+        self.refresh()
+        with self.lock:
+            if self.error is not None:
+                raise self.error
+            return self.token
+
+    async def aget_token(self):
+        # for asyncio code: the fast path doesn't need a thread, a refresh runs in one
+        token, expires_at = self.token, self.expires_at
+        if token is not None and time.monotonic() < expires_at - self.refresh_margin:
+            return token
+        return await asyncio.to_thread(self.get_token)
+
+    def invalidate(self, token):
+        with self.lock:
+            if self.token == token:
+                self.token, self.expires_at = None, 0.0
+
+
+class BearerAuth(AuthBase):
+    """Authorization: Bearer <token>, with one retry on 401 using a fresh token."""
+
+    def __init__(self, provider):
+        self.provider = provider
+
+    def __call__(self, request):
+        token = self.provider.get_token()
+        request.headers["Authorization"] = f"Bearer {token}"
+        request.register_hook("response", self.handle_401)
+        return request
+
+    def handle_401(self, response, **kwargs):
+        request = response.request
+        if response.status_code != 401 or getattr(request, "token_retried", False):
+            return response
+        self.provider.invalidate(request.headers["Authorization"].partition(" ")[2])
+        response.content  # read the body, so the connection can be reused
+        response.close()
+
+        retry = request.copy()
+        retry.headers["Authorization"] = f"Bearer {self.provider.get_token()}"
+        retry.token_retried = True
+        new_response = response.connection.send(retry, **kwargs)
+        new_response.history.append(response)
+        new_response.request = retry
+        return new_response
+
+
+class ApiKeyAuth(AuthBase):
+    """Authorization: ApiKey <key>, or the key as a query parameter with param="api_key"."""
+
+    def __init__(self, api_key, scheme="ApiKey", param=None):
+        self.api_key = api_key
+        self.scheme = scheme
+        self.param = param
+
+    def __call__(self, request):
+        if self.param:
+            request.prepare_url(request.url, {self.param: self.api_key})
+        else:
+            request.headers["Authorization"] = f"{self.scheme} {self.api_key}"
+        return request
+
+
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    LocalServer = importlib.import_module("7_local_http_server").LocalServer
+
+    N = 10_000
+    THREADS = 16
+
+    def call_api(client, url, auth, count):
+        with ThreadPoolExecutor(THREADS) as pool:
+            statuses = list(pool.map(lambda _: client.get(url, auth=auth).status_code, range(count)))
+        assert set(statuses) == {200}, set(statuses)
+
+    with LocalServer() as server, HTTPClient(pool_maxsize=THREADS) as client:
+        api_url = server.url + "/protected"
+
+        # --------------------------
+        # naive: a new token for every call
+        # --------------------------
+        class NaiveAuth(AuthBase):
+            def __call__(self, request):
+                response = client.post(server.url + "/token", data={"grant_type": "client_credentials"},
+                                       auth=("YOUR_CLIENT_ID", "YOUR_CLIENT_SECRET"))
+                request.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+                return request
+
+        start = time.perf_counter()
+        call_api(client, api_url, NaiveAuth(), N // 10)
+        naive = time.perf_counter() - start
+        print(f"naive:  {server.hits['/token'] * 10} token calls per {N} API requests, "
+              f"{naive * 10:.2f}s (measured on {N // 10})")
+
+        # --------------------------
+        # cached, 1 hour tokens
+        # --------------------------
+        server.hits.clear()
+        provider = ClientCredentialsTokenProvider(server.url + "/token", "YOUR_CLIENT_ID", "YOUR_CLIENT_SECRET",
+                                                  client=client)
+        start = time.perf_counter()
+        call_api(client, api_url, BearerAuth(provider), N)
+        print(f"cached: {server.hits['/token']} token call(s) per {N} API requests, {time.perf_counter() - start:.2f}s")
+
+        # --------------------------
+        # short-lived tokens (1s): refreshed in the background, no request ever waits or fails
+        # --------------------------
+        server.hits.clear()
+        provider = ClientCredentialsTokenProvider(server.url + "/token?expires_in=1", "YOUR_CLIENT_ID",
+                                                  "YOUR_CLIENT_SECRET", refresh_margin=0.3, client=client)
+        start = time.perf_counter()
+        call_api(client, api_url, BearerAuth(provider), N)
+        elapsed = time.perf_counter() - start
+        print(f"1s tokens: {server.hits['/token']} token calls per {N} API requests in {elapsed:.2f}s, "
+              f"401 responses: {server.hits['/protected'] - N}")
+
+        # --------------------------
+        # thundering herd: 50 threads want a token at the same moment
+        # --------------------------
+        server.hits.clear()
+        provider = ClientCredentialsTokenProvider(server.url + "/token?delay=0.2", "YOUR_CLIENT_ID",
+                                                  "YOUR_CLIENT_SECRET", client=client)
+        with ThreadPoolExecutor(50) as pool:
+            tokens = set(pool.map(lambda _: provider.get_token(), range(50)))
+        print(f"50 concurrent callers: {server.hits['/token']} token call, {len(tokens)} distinct token")
+
+        # --------------------------
+        # API key example from 3_request.py as an auth object
+        # --------------------------
+        response = client.get(server.url + "/get", auth=ApiKeyAuth("YOUR_API_KEY"))
+        print("ApiKey header:", response.json()["headers"]["Authorization"])
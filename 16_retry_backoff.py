@@ -0,0 +1,271 @@
+"""
+- What is wrong with the retry example in 3_request.py?
+
+    Retry(total=3, status_forcelist=[429, 500, 502, 503, 504],
+          method_whitelist=["HEAD", "GET", "OPTIONS"], backoff_factor=1)
+
+  1. `method_whitelist` was renamed to `allowed_methods` in urllib3 1.26 and removed
+     in urllib3 2.0, so with a current urllib3 this line raises TypeError.
+  2. When the server is down, EVERY client retries 3 times: the broken server gets
+     4x more traffic exactly when it can handle the least. And all clients use the
+     same backoff (1s, 2s, 4s), so they retry at the same moments, in waves.
+
+- What we do instead
+  - decorrelated jitter backoff: every client sleeps a random time between `base` and
+    3x its previous sleep (capped), so retries spread out instead of arriving in waves
+  - Retry-After: with 429 (Too Many Requests) and 503 the server can tell us how long
+    to wait (seconds, or an HTTP date). We do what it says.
+  - retry budget (per host): every request puts `ratio` (e.g. 0.1) tokens in a bucket,
+    every retry takes 1 token out. So retries can be at most ~10% of the traffic,
+    during an outage the extra load stays small.
+  - circuit breaker (per host): after `failure_threshold` failures in a row we stop
+    calling the host at all (fail fast with CircuitOpenError) for `reset_timeout`
+    seconds, then let ONE trial request through. If it works, we close the circuit again.
+
+  RetryingClient puts all of this around the HTTPClient of 9_session_client.py.
+"""
+
+import importlib
+import random
+import threading
+import time
+from collections import Counter
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+from requests.exceptions import ConnectionError, RequestException, Timeout
+
+HTTPClient = importlib.import_module("9_session_client").HTTPClient
+
+
+class CircuitOpenError(RequestException):
+    """The circuit breaker of this host is open, the request was not sent."""
+
+
+class DecorrelatedJitterBackoff:
+    def __init__(self, base=0.1, cap=20.0):
+        self.base = base
+        self.cap = cap
+
+    def next(self, previous):
+        return min(self.cap, random.uniform(self.base, max(previous, self.base) * 3))
+
+
+def parse_retry_after(value, now=None):
+    """Retry-After is either seconds ("120") or an HTTP date, returns seconds or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(moment.timestamp() - (now if now is not None else time.time()), 0.0)
+
+
+class RetryBudget:
+    def __init__(self, ratio=0.1, reserve=3, max_tokens=100):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = float(reserve)  # a few retries are allowed even at low traffic
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self.lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN  # let exactly one trial request through
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class RetryingClient:
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    # only idempotent methods are safe to send twice
+    RETRY_METHODS = ("HEAD", "GET", "OPTIONS", "PUT", "DELETE")
+
+    def __init__(self, client=None, retries=3, backoff=None, status_forcelist=RETRY_STATUSES,
+                 allowed_methods=RETRY_METHODS, budget_ratio=0.1, budget_reserve=3,
+                 failure_threshold=5, reset_timeout=30.0, max_retry_after=60.0):
+        self.client = client or HTTPClient()
+        self.retries = retries
+        self.backoff = backoff or DecorrelatedJitterBackoff()
+        self.status_forcelist = set(status_forcelist)
+        self.allowed_methods = set(allowed_methods)
+        self.max_retry_after = max_retry_after
+        self.budget_options = {"ratio": budget_ratio, "reserve": budget_reserve}
+        self.breaker_options = {"failure_threshold": failure_threshold, "reset_timeout": reset_timeout}
+        self.budgets = {}
+        self.breakers = {}
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+    def for_host(self, host):
+        with self.lock:
+            if host not in self.budgets:
+                self.budgets[host] = RetryBudget(**self.budget_options)
+                self.breakers[host] = CircuitBreaker(**self.breaker_options)
+            return self.budgets[host], self.breakers[host]
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def request(self, method, url, **kwargs):
+        method = method.upper()
+        host = urlsplit(url).netloc
+        budget, breaker = self.for_host(host)
+        budget.deposit()
+        delay = self.backoff.base
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                self.count("circuit_rejected")
+                raise CircuitOpenError(f"circuit open for {host}, not sending {method} {url}")
+
+            self.count("attempts")
+            error = response = None
+            try:
+                response = self.client.request(method, url, **kwargs)
+            except (ConnectionError, Timeout) as err:
+                error = err
+                breaker.record_failure()
+            except Exception:
+                # not retried (TooManyRedirects, ChunkedEncodingError, ...), but a HALF_OPEN trial must end too
+                breaker.record_failure()
+                raise
+            else:
+                # 429 means "slow down", the host itself is fine
+                if response.status_code >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if response.status_code not in self.status_forcelist:
+                    return response
+
+            retry_after = None
+            if response is not None and response.status_code in (429, 503):
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            give_up = (
+                attempt >= self.retries
+                or method not in self.allowed_methods
+                or (retry_after is not None and retry_after > self.max_retry_after)
+            )
+            if not give_up and not budget.withdraw():
+                self.count("budget_exhausted")
+                give_up = True
+            if give_up:
+                if error is not None:
+                    raise error
+                return response
+
+            delay = self.backoff.next(delay)
+            if retry_after is not None:
+                delay = retry_after
+                self.count("retry_after_honoured")
+            if response is not None:
+                response.close()
+            self.count("retries")
+            attempt += 1
+            time.sleep(delay)
+
+    def get(self, url, params=None, **kwargs):
+        return self.request("GET", url, params=params, **kwargs)
+
+    def post(self, url, data=None, json=None, **kwargs):
+        return self.request("POST", url, data=data, json=json, **kwargs)
+
+
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    LocalServer = importlib.import_module("7_local_http_server").LocalServer
+
+    backoff = DecorrelatedJitterBackoff(base=0.1, cap=5.0)
+    delays = [backoff.base]
+    for _ in range(6):
+        delays.append(backoff.next(delays[-1]))
+    print("decorrelated jitter delays:", [round(delay, 2) for delay in delays[1:]])
+
+    with LocalServer() as server:
+        fast = DecorrelatedJitterBackoff(base=0.01, cap=0.1)
+
+        # --------------------------
+        # 1. a server that fails twice, then works
+        # --------------------------
+        client = RetryingClient(backoff=fast)
+        response = client.get(server.url + "/flaky", params={"fail": 2, "key": "twice"})
+        print("flaky:", response.status_code, response.json(), dict(client.stats))
+
+        # --------------------------
+        # 2. 429 with Retry-After: 1 -> we wait one second, not our own backoff
+        # --------------------------
+        client = RetryingClient(backoff=fast)
+        start = time.perf_counter()
+        response = client.get(server.url + "/flaky", params={"fail": 1, "key": "slow-down", "status": 429, "retry_after": 1})
+        print(f"Retry-After: {response.status_code} after {time.perf_counter() - start:.2f}s", dict(client.stats))
+
+        # --------------------------
+        # 3. retry budget: 200 requests to a host that is down, without breaker
+        # --------------------------
+        client = RetryingClient(backoff=fast, budget_ratio=0.1, failure_threshold=10**9)
+        server.hits.clear()
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(lambda _: client.get(server.url + "/status/503"), range(200)))
+        print(f"budget: 200 requests -> {server.hits['/status/503']} attempts "
+              f"(plain retries=3 would be 800)", dict(client.stats))
+
+        # --------------------------
+        # 4. circuit breaker: after 5 failures we stop calling the host for reset_timeout
+        # --------------------------
+        client = RetryingClient(retries=0, failure_threshold=5, reset_timeout=0.5)
+        server.hits.clear()
+        rejected = 0
+        for _ in range(50):
+            try:
+                client.get(server.url + "/status/503")
+            except CircuitOpenError:
+                rejected += 1
+        print(f"breaker: 50 calls -> {server.hits['/status/503']} reached the server, {rejected} failed fast")
+        time.sleep(0.6)
+        response = client.get(server.url + "/flaky", params={"fail": 0, "key": "recovered"})
+        print("after reset_timeout the trial request goes through:", response.status_code,
+              "state:", client.breakers[urlsplit(server.url).netloc].state)
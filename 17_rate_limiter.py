@@ -0,0 +1,270 @@
+"""
+- Rate limits
+  Most APIs with API keys (see the API Keys section of 3_request.py) only allow a
+  number of requests per time window, e.g. 5000 per hour. If we send faster, the
+  server answers "429 Too Many Requests", and then we have wasted a request AND we
+  still have to send it again later.
+
+  Servers usually tell us where we stand with every response:
+
+    X-RateLimit-Limit: 5000         -> requests allowed per window
+    X-RateLimit-Remaining: 4987     -> requests left in this window
+    X-RateLimit-Reset: 1717000000   -> when the window resets (epoch seconds)
+
+- Token bucket
+  A bucket holds up to `burst` tokens and is refilled with `rate` tokens per second.
+  Every request takes one token; no token -> wait. So on average we send `rate`
+  requests per second, with short bursts of up to `burst` requests.
+
+- RequestScheduler below
+  - one token bucket per (host, API key)
+  - adapts the rate from the X-RateLimit-* headers: `remaining` requests spread
+    evenly until the reset, and a full stop when remaining is 0 or we got a 429
+  - requests wait in a priority queue (smaller number = more urgent), so important
+    calls don't wait behind a big batch job
+  - a request rejected with 429 goes back into the queue instead of failing
+
+    scheduler = RequestScheduler(rate=10)
+    future = scheduler.submit("GET", url, priority=0, headers={"Authorization": "ApiKey ..."})
+    response = future.result()
+"""
+
+import heapq
+import importlib
+import itertools
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+HTTPClient = importlib.import_module("9_session_client").HTTPClient
+parse_retry_after = importlib.import_module("16_retry_backoff").parse_retry_after
+
+Job = namedtuple("Job", ["method", "url", "kwargs", "future", "requeues"])
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, now):
+        # seconds until a token is available, 0 means "send now"
+        if now < self.updated:
+            return self.updated - now  # paused
+        self.refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, seconds, now):
+        # no tokens until the pause is over, then one request to find out where we stand
+        self.updated = max(self.updated, now + seconds)
+        self.tokens = 1.0
+
+    def adapt(self, remaining, reset_after, now):
+        if remaining <= 0:
+            self.pause(reset_after, now)
+            return
+        # spread what is left evenly over the rest of the window, never faster than configured
+        self.rate = min(self.max_rate, remaining / max(reset_after, 0.001))
+        self.tokens = min(self.tokens, remaining)
+
+
+def rate_limit_headers(headers):
+    """(remaining, seconds until reset) from the X-RateLimit-* headers, or None."""
+    remaining = headers.get("X-RateLimit-Remaining")
+    if remaining is None:
+        return None
+    if "X-RateLimit-Reset-After" in headers:
+        reset_after = float(headers["X-RateLimit-Reset-After"])
+    elif "X-RateLimit-Reset" in headers:
+        reset = float(headers["X-RateLimit-Reset"])
+        # big numbers are epoch timestamps (GitHub), small ones are seconds from now
+        reset_after = reset - time.time() if reset > 1e9 else reset
+    else:
+        return None
+    return int(remaining), max(reset_after, 0.0)
+
+
+class RequestScheduler:
+    def __init__(self, client=None, rate=10.0, burst=5, workers=8, max_requeues=3):
+        self.client = client or HTTPClient(pool_maxsize=workers)
+        self.rate = rate
+        self.burst = burst
+        self.max_requeues = max_requeues
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.free_workers = threading.Semaphore(workers)  # don't take more jobs than we can run
+        self.buckets = {}  # (host, key) -> TokenBucket
+        self.queues = {}   # (host, key) -> heap of (priority, order, Job)
+        self.order = itertools.count()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.in_flight = 0  # jobs being sent, a 429 can still put them back into a queue
+        self.stats = Counter()
+        self.dispatcher = threading.Thread(target=self.dispatch_loop, daemon=True)
+        self.dispatcher.start()
+
+    def set_limit(self, host, rate, burst=None, key=None):
+        with self.cond:
+            self.buckets[(host, key)] = TokenBucket(rate, burst or self.burst)
+
+    def submit(self, method, url, priority=0, key=None, **kwargs):
+        if key is None:
+            key = (kwargs.get("headers") or {}).get("Authorization")
+        future = Future()
+        with self.cond:  # an RLock, enqueue() takes it again
+            if self.closed:  # like ThreadPoolExecutor.submit() after shutdown, the dispatcher may be gone
+                raise RuntimeError("scheduler is closed")
+            self.enqueue((urlsplit(url).netloc, key), priority, next(self.order), Job(method, url, kwargs, future, 0))
+        return future
+
+    def enqueue(self, bucket_key, priority, order, job):
+        with self.cond:
+            if bucket_key not in self.buckets:
+                self.buckets[bucket_key] = TokenBucket(self.rate, self.burst)
+            heapq.heappush(self.queues.setdefault(bucket_key, []), (priority, order, job))
+            self.cond.notify()
+
+    def next_job(self):
+        # the most urgent job among the buckets that have a token right now
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                best, wake_in = None, None
+                for bucket_key, queue in self.queues.items():
+                    if not queue:
+                        continue
+                    wait = self.buckets[bucket_key].wait_time(now)
+                    if wait == 0:
+                        if best is None or queue[0] < self.queues[best][0]:
+                            best = bucket_key
+                    elif wake_in is None or wait < wake_in:
+                        wake_in = wait
+                if best is not None:
+                    self.buckets[best].take()
+                    self.in_flight += 1
+                    return best, heapq.heappop(self.queues[best])
+                if self.closed and wake_in is None and not self.in_flight:
+                    return None, None
+                self.cond.wait(wake_in)
+
+    def dispatch_loop(self):
+        while True:
+            self.free_workers.acquire()
+            bucket_key, entry = self.next_job()
+            if entry is None:
+                return
+            self.pool.submit(self.run, bucket_key, entry)
+
+    def run(self, bucket_key, entry):
+        try:
+            self.send(bucket_key, *entry)
+        finally:
+            with self.cond:
+                self.in_flight -= 1
+                self.cond.notify()  # after close() the dispatcher waits for the last one
+
+    def send(self, bucket_key, priority, order, job):
+        try:
+            response = self.client.request(job.method, job.url, **job.kwargs)
+        except Exception as err:
+            job.future.set_exception(err)
+            return
+        finally:
+            self.free_workers.release()
+
+        now = time.monotonic()
+        limits = rate_limit_headers(response.headers)
+        requeue = response.status_code == 429 and job.requeues < self.max_requeues
+        with self.cond:
+            self.stats["sent"] += 1
+            bucket = self.buckets[bucket_key]
+            if limits is not None:
+                bucket.adapt(*limits, now)
+            if response.status_code == 429:
+                self.stats["rejected"] += 1
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                bucket.pause(retry_after if retry_after is not None else 1.0, now)
+            if requeue:
+                self.stats["requeued"] += 1
+            self.cond.notify()
+
+        if requeue:
+            response.close()
+            # same priority and original order, so it doesn't lose its place in the line
+            self.enqueue(bucket_key, priority, order, job._replace(requeues=job.requeues + 1))
+            return
+        job.future.set_result(response)
+
+    def close(self):
+        # waits until every queued request has been sent
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.dispatcher.join()
+        self.pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == "__main__":
+    LocalServer = importlib.import_module("7_local_http_server").LocalServer
+
+    N = 100
+
+    with LocalServer() as server, HTTPClient(pool_maxsize=8) as client:
+        # the API allows 20 requests per second per key
+        url = server.url + "/limited?limit=20&window=1"
+
+        # --------------------------
+        # naive: 8 threads as fast as possible
+        # --------------------------
+        start = time.perf_counter()
+        with ThreadPoolExecutor(8) as pool:
+            statuses = Counter(pool.map(
+                lambda _: client.get(url, headers={"Authorization": "ApiKey naive"}).status_code, range(N)))
+        print(f"naive:     {dict(statuses)} in {time.perf_counter() - start:.2f}s")
+
+        # --------------------------
+        # scheduler: we guess 100 requests/s, the headers teach it the real limit
+        # --------------------------
+        start = time.perf_counter()
+        with RequestScheduler(client, rate=100, burst=5) as scheduler:
+            futures = [scheduler.submit("GET", url, headers={"Authorization": "ApiKey scheduled"}) for _ in range(N)]
+            statuses = Counter(future.result().status_code for future in futures)
+        print(f"scheduler: {dict(statuses)} in {time.perf_counter() - start:.2f}s "
+              f"(ideal {N / 20:.1f}s), {dict(scheduler.stats)}")
+
+        # --------------------------
+        # priorities: 5 urgent requests submitted after 40 batch requests
+        # --------------------------
+        finished = []
+        with RequestScheduler(client, rate=20, burst=1, workers=2) as scheduler:
+            for i in range(40):
+                scheduler.submit("GET", url, priority=10, key="batch").add_done_callback(
+                    lambda _, i=i: finished.append(f"batch-{i}"))
+            for i in range(5):
+                scheduler.submit("GET", url, priority=0, key="batch").add_done_callback(
+                    lambda _, i=i: finished.append(f"urgent-{i}"))
+        print("urgent requests finished at positions:",
+              [position for position, name in enumerate(finished) if name.startswith("urgent")], "of", len(finished))
+        try:
+            scheduler.submit("GET", url)
+            raise AssertionError("submit() after close() was accepted")
+        except RuntimeError:
+            pass
@@ -0,0 +1,243 @@
+"""
+- Where does the time of a request go?
+  In 3_request.py we inspected response.request.headers/url/body, but not how long
+  things took. A request goes through these phases:
+
+    dns      - turning "api.github.com" into an IP address
+    connect  - the TCP handshake (one round-trip to the server)
+    tls      - the TLS handshake, only for https (one or two more round-trips)
+    send     - writing the request line, headers and body
+    ttfb     - "time to first byte": waiting until the response headers arrive,
+               this is mostly the server working on our request
+    body     - downloading the response body
+
+  With a keep-alive connection (9_session_client.py) only the first request to a
+  host pays for dns/connect/tls, so those phases are recorded only for new connections.
+
+- Latency histograms
+  An average hides the slow requests. We want percentiles:
+    p50 - half of the requests were faster than this
+    p99 - 1 in 100 requests was slower than this
+
+  Keeping every measurement to compute exact percentiles costs memory, so like
+  HdrHistogram we count measurements in buckets (LatencyHistogram in
+  34_latency_histogram.py, the benchmarks use it too).
+
+- Usage
+    instrumentation = Instrumentation()
+    client = instrumented_client(instrumentation)
+    client.get(url).timing            -> RequestTiming of this request
+    instrumentation.snapshot()        -> {host: {phase: {"p50": ..., "p99": ...}}}
+    instrumentation.enabled = False   -> back to (almost) zero overhead
+"""
+
+import functools
+import importlib
+import json
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+from urllib3.connection import HTTPSConnection
+from urllib3.exceptions import NameResolutionError, NewConnectionError
+
+session_client = importlib.import_module("9_session_client")
+HTTPClient, PooledAdapter = session_client.HTTPClient, session_client.PooledAdapter
+LatencyHistogram = importlib.import_module("34_latency_histogram").LatencyHistogram
+
+_current = threading.local()  # the RequestTiming of the request this thread is sending
+
+
+class RequestTiming:
+    PHASES = ("dns", "connect", "tls", "send", "ttfb", "body", "total")
+    __slots__ = PHASES + ("new_connection", "request_sent")
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, None)
+        self.new_connection = False
+
+    def as_dict(self):
+        return {phase: getattr(self, phase) for phase in self.PHASES if getattr(self, phase) is not None}
+
+    def __repr__(self):
+        phases = ", ".join(f"{phase}={seconds * 1000:.2f}ms" for phase, seconds in self.as_dict().items())
+        return f"<RequestTiming {phases}>"
+
+
+class _TimedConnectionMixin:
+    # the overrides do nothing extra unless the adapter put a RequestTiming in _current
+
+    def _new_conn(self):
+        timing = getattr(_current, "timing", None)
+        if timing is None:
+            return super()._new_conn()
+        start = time.perf_counter()
+        try:
+            addresses = socket.getaddrinfo(self._dns_host, self.port, 0, socket.SOCK_STREAM)
+        except socket.gaierror as err:
+            raise NameResolutionError(self.host, self, err) from err
+        resolved = time.perf_counter()
+        timing.dns = resolved - start
+
+        # connect to the address we just resolved (the host name is still used for TLS and Host:),
+        # trying every address like socket.create_connection() does
+        dns_host = self._dns_host
+        try:
+            for index, (_, _, _, _, sockaddr) in enumerate(addresses):
+                self._dns_host = sockaddr[0]
+                try:
+                    sock = super()._new_conn()
+                    break
+                except NewConnectionError:
+                    if index == len(addresses) - 1:
+                        raise
+        finally:
+            self._dns_host = dns_host
+        timing.connect = time.perf_counter() - resolved
+        timing.new_connection = True
+        return sock
+
+    def connect(self):
+        timing = getattr(_current, "timing", None)
+        if timing is None:
+            return super().connect()
+        start = time.perf_counter()
+        super().connect()
+        if isinstance(self, HTTPSConnection) and timing.connect is not None:
+            # connect() = _new_conn() (dns + tcp) + the TLS handshake
+            timing.tls = time.perf_counter() - start - timing.dns - timing.connect
+
+    def request(self, *args, **kwargs):
+        timing = getattr(_current, "timing", None)
+        if timing is None:
+            return super().request(*args, **kwargs)
+        # plain http opens the connection inside request(), https already did in _validate_conn()
+        opened_here = self.sock is None
+        start = time.perf_counter()
+        super().request(*args, **kwargs)
+        timing.request_sent = time.perf_counter()
+        timing.send = timing.request_sent - start
+        if opened_here:  # don't count opening it as sending
+            timing.send -= (timing.dns or 0) + (timing.connect or 0) + (timing.tls or 0)
+
+    def getresponse(self):
+        timing = getattr(_current, "timing", None)
+        if timing is None:
+            return super().getresponse()
+        response = super().getresponse()
+        timing.ttfb = time.perf_counter() - timing.request_sent
+        return response
+
+
+class Instrumentation:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.histograms = {}  # host -> phase -> LatencyHistogram
+        self.lock = threading.Lock()
+
+    def record(self, host, timing):
+        with self.lock:
+            phases = self.histograms.setdefault(host, {})
+            for phase, seconds in timing.as_dict().items():
+                phases.setdefault(phase, LatencyHistogram()).record(seconds)
+
+    def snapshot(self):
+        with self.lock:
+            return {host: {phase: histogram.snapshot() for phase, histogram in phases.items()}
+                    for host, phases in self.histograms.items()}
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+
+
+class InstrumentedAdapter(PooledAdapter):
+    def __init__(self, *args, instrumentation=None, **kwargs):
+        self.instrumentation = instrumentation or Instrumentation()
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        # the pools create connections from ConnectionCls, swap in the timed versions
+        timed = {}
+        for scheme, pool_class in self.poolmanager.pool_classes_by_scheme.items():
+            connection_class = type("Timed" + pool_class.ConnectionCls.__name__,
+                                    (_TimedConnectionMixin, pool_class.ConnectionCls), {})
+            timed[scheme] = type("Timed" + pool_class.__name__, (pool_class,), {"ConnectionCls": connection_class})
+        self.poolmanager.pool_classes_by_scheme = timed
+
+    def send(self, request, stream=False, **kwargs):
+        if not self.instrumentation.enabled:
+            return super().send(request, stream=stream, **kwargs)
+        timing = RequestTiming()
+        _current.timing = timing
+        start = time.perf_counter()
+        try:
+            response = super().send(request, stream=stream, **kwargs)
+            if not stream:
+                body_start = time.perf_counter()
+                response.content  # what Session.send would do right after us
+                timing.body = time.perf_counter() - body_start
+        finally:
+            _current.timing = None
+        timing.total = time.perf_counter() - start
+        response.timing = timing
+        self.instrumentation.record(urlsplit(request.url).netloc, timing)
+        return response
+
+
+def instrumented_client(instrumentation=None, **client_options):
+    instrumentation = instrumentation or Instrumentation()
+    client = HTTPClient(adapter_class=functools.partial(InstrumentedAdapter, instrumentation=instrumentation),
+                        **client_options)
+    client.instrumentation = instrumentation
+    return client
+
+
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    LocalServer = importlib.import_module("7_local_http_server").LocalServer
+
+    with LocalServer() as server:
+        port = server.httpd.server_address[1]
+        client = instrumented_client(pool_maxsize=8)
+
+        print("first request: ", client.get(server.url + "/get").timing)
+        print("second request:", client.get(server.url + "/get").timing)
+        print("1 MB body:     ", client.get(server.url + "/bytes/1048576").timing)
+
+        # --------------------------
+        # two "upstreams": localhost is slow at the 95th percentile, 127.0.0.1 is fast
+        # --------------------------
+        client.instrumentation.reset()
+
+        def call(i):
+            slow = 0.05 if i % 20 == 0 else 0.002
+            client.get(f"http://localhost:{port}/get?delay={slow}")
+            client.get(f"http://127.0.0.1:{port}/get?delay=0.002")
+
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(call, range(400)))
+        for host, phases in client.instrumentation.snapshot().items():
+            print(host, "ttfb", phases["ttfb"])
+        print(client.instrumentation.to_json()[:200], "...")
+
+        # --------------------------
+        # overhead: instrumentation enabled vs disabled vs the plain HTTPClient
+        # --------------------------
+        N = 2000
+        plain = HTTPClient()
+        url = server.url + "/get"
+        for name, target in (("plain HTTPClient", plain), ("enabled", client), ("disabled", client)):
+            client.instrumentation.enabled = name != "disabled"
+            target.get(url)
+            start = time.perf_counter()
+            for _ in range(N):
+                target.get(url)
+            print(f"{name:<17} {(time.perf_counter() - start) / N * 1e6:7.1f} us/request")
@@ -0,0 +1,418 @@
+"""
+- Why a local SMTP server?
+  Every example in 6_send_mail.py needs a real Gmail account and asks for the password
+  with input(). To try our code or measure how fast it is, we don't want to send real
+  mails (and Gmail would block us quickly anyway).
+
+  Python used to ship a debugging server for this:
+      python -m smtpd -c DebuggingServer -n localhost:1025
+  but the smtpd module is deprecated (and removed in Python 3.12), so here is our own
+  small one. It speaks enough SMTP for smtplib:
+
+    EHLO/HELO, AUTH PLAIN/LOGIN (any password works), MAIL FROM, RCPT TO, DATA,
+    BDAT (CHUNKING), STARTTLS, RSET, NOOP, QUIT
+
+  and it does NOT deliver anything, it just counts (or keeps) the messages.
+
+- Knobs for experiments
+    latency                      - seconds to wait before every batch of replies,
+                                   like the round-trip time to a far away server
+    max_messages_per_connection  - after that many messages the server answers
+                                   "421 closing connection", like real providers do
+    rcpt_errors                  - {"bounce": (550, "No such user")}: recipients
+                                   starting with "bounce" are rejected with 550
+    max_recipients               - more RCPT TO per message get "452 Too many recipients"
+    pipelining                   - advertise PIPELINING. Pipelined commands arrive
+                                   together and are answered with ONE flush anyway,
+                                   so they cost one round-trip (one `latency`)
+    chunking                     - advertise CHUNKING and accept BDAT
+    tls=(certfile, keyfile)      - offer STARTTLS (port 587 style), or with
+                                   implicit_tls=True speak TLS right away (SMTP_SSL, 465);
+                                   make_certificate() creates a self-signed one
+    error_rate                   - this fraction of MAIL FROM gets "451 try again later"
+
+- Usage
+    with LocalSMTPServer() as server:
+        with smtplib.SMTP(server.host, server.port) as smtp:
+            smtp.sendmail("my@gmail.com", "your@gmail.com", "Subject: Hi\\r\\n\\r\\nHello")
+        print(server.messages)
+"""
+
+import base64
+import multiprocessing
+import os
+import random
+import socket
+import socketserver
+import ssl
+import subprocess
+import threading
+import time
+from collections import Counter
+
+
+class SMTPHandler(socketserver.BaseRequestHandler):
+    def setup(self):
+        self.options = self.server.options
+        self.buffer = bytearray()
+        self.replies = []
+        self.mail_from = None
+        self.recipients = []
+        self.chunks = bytearray()  # BDAT data of the current message
+        self.tls_active = False
+        self.messages_on_connection = 0
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    # --------------------------
+    # I/O: replies are collected and sent together when we run out of input,
+    # so `latency` is paid once per round-trip, like on a real network
+    # --------------------------
+    def reply(self, code, *lines):
+        lines = lines or ("OK",)
+        for index, line in enumerate(lines):
+            separator = " " if index == len(lines) - 1 else "-"
+            self.replies.append(f"{code}{separator}{line}\r\n".encode("utf-8"))
+
+    def flush(self):
+        if self.replies:
+            if self.options["latency"]:
+                time.sleep(self.options["latency"])
+            self.request.sendall(b"".join(self.replies))
+            self.replies.clear()
+            self.server.count("round_trips")
+
+    def fill(self):
+        self.flush()
+        data = self.request.recv(256 * 1024)
+        self.buffer += data
+        return bool(data)
+
+    def readline(self):
+        while (end := self.buffer.find(b"\r\n")) == -1:
+            if not self.fill():
+                return None
+        line = bytes(self.buffer[:end])
+        del self.buffer[:end + 2]
+        return line.decode("utf-8", "replace")
+
+    def read_exactly(self, size):
+        while len(self.buffer) < size:
+            if not self.fill():
+                return None
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def read_data(self):
+        # everything up to "\r\n.\r\n", then undo the dot-stuffing ("..foo" -> ".foo")
+        data = bytearray()
+        self.buffer[:0] = b"\r\n"  # so a "." on the very first line is found too
+        while True:
+            end = self.buffer.find(b"\r\n.\r\n")
+            if end != -1:
+                data += self.buffer[:end + 2]
+                del self.buffer[:end + 5]
+                break
+            data += self.buffer[:-4]
+            del self.buffer[:-4]
+            if not self.fill():
+                return None
+        return bytes(data[2:]).replace(b"\r\n..", b"\r\n.")
+
+    # --------------------------
+    # SMTP commands
+    # --------------------------
+    def extensions(self):
+        extensions = ["SIZE 52428800", "8BITMIME", "AUTH PLAIN LOGIN"]
+        if self.options["pipelining"]:
+            extensions.append("PIPELINING")
+        if self.options["chunking"]:
+            extensions.append("CHUNKING")
+        if self.server.tls_context is not None and not self.tls_active:
+            extensions.append("STARTTLS")
+        return extensions
+
+    def handle(self):
+        self.server.count("connections")
+        try:
+            if self.server.tls_context is not None and self.options["implicit_tls"]:
+                self.start_tls()
+            self.reply(220, "localhost ESMTP local test sink")
+            while True:
+                line = self.readline()
+                if line is None:
+                    return
+                verb, _, argument = line.partition(" ")
+                method = getattr(self, "smtp_" + verb.upper(), None)
+                if method is None:
+                    self.reply(502, "Command not implemented")
+                elif method(argument.strip()) is False:
+                    self.flush()
+                    return
+        except (ConnectionError, ssl.SSLError):
+            return  # the client went away without QUIT
+
+    def start_tls(self):
+        self.request = self.server.tls_context.wrap_socket(self.request, server_side=True)
+        self.tls_active = True
+        self.server.count("tls_handshakes")
+
+    def smtp_EHLO(self, argument):
+        self.reply(250, "localhost", *self.extensions())
+
+    def smtp_HELO(self, argument):
+        self.reply(250, "localhost")
+
+    def smtp_STARTTLS(self, argument):
+        if self.server.tls_context is None or self.tls_active:
+            self.reply(502, "Command not implemented")
+            return
+        self.reply(220, "Ready to start TLS")
+        self.flush()
+        self.start_tls()
+        # everything from before the handshake is forgotten, the client sends EHLO again
+        self.buffer.clear()
+        self.mail_from, self.recipients = None, []
+
+    def smtp_AUTH(self, argument):
+        mechanism, _, initial = argument.partition(" ")
+        if mechanism.upper() == "PLAIN":
+            if not initial:
+                self.reply(334, "")
+                self.flush()
+                initial = self.readline()
+            _, username, _ = base64.b64decode(initial).split(b"\0")
+        elif mechanism.upper() == "LOGIN":
+            self.reply(334, base64.b64encode(b"Username:").decode())
+            username = base64.b64decode(self.readline() or "")
+            self.reply(334, base64.b64encode(b"Password:").decode())
+            self.readline()
+        else:
+            self.reply(504, "Unrecognized authentication type")
+            return
+        self.server.count("logins")
+        self.reply(235, "Authentication successful")
+
+    def smtp_MAIL(self, argument):
+        limit = self.options["max_messages_per_connection"]
+        if limit and self.messages_on_connection >= limit:
+            self.reply(421, "Too many messages on this connection, closing")
+            return False
+        if self.server.inject_error():
+            self.reply(451, "Temporary local problem, try again later")
+            return
+        self.mail_from = argument.partition(":")[2].split(" ")[0].strip("<>")
+        self.recipients = []
+        self.chunks.clear()
+        self.reply(250)
+
+    def smtp_RCPT(self, argument):
+        if self.mail_from is None:
+            self.reply(503, "Need MAIL command")
+            return
+        if len(self.recipients) >= self.options["max_recipients"]:
+            self.reply(452, "Too many recipients")
+            return
+        address = argument.partition(":")[2].split(" ")[0].strip("<>")
+        for prefix, (code, text) in self.options["rcpt_errors"].items():
+            if address.startswith(prefix):
+                self.reply(code, text)
+                return
+        self.recipients.append(address)
+        self.reply(250)
+
+    def smtp_DATA(self, argument):
+        if not self.recipients:
+            self.reply(503, "Need RCPT command")
+            return
+        self.reply(354, "End data with <CR><LF>.<CR><LF>")
+        data = self.read_data()
+        if data is None:
+            return False
+        self.deliver(data)
+
+    def smtp_BDAT(self, argument):
+        # "BDAT <size> [LAST]" followed by exactly <size> bytes, no dot-stuffing (RFC 3030)
+        size, _, last = argument.partition(" ")
+        data = self.read_exactly(int(size))
+        if data is None:
+            return False
+        if not self.options["chunking"] or not self.recipients:
+            self.chunks.clear()
+            self.reply(503, "Need RCPT command" if self.options["chunking"] else "CHUNKING not enabled")
+            return
+        self.chunks += data
+        if last.upper() == "LAST":
+            data = bytes(self.chunks)
+            self.chunks.clear()
+            self.deliver(data)
+        else:
+            self.reply(250, f"{len(data)} octets received")
+
+    def deliver(self, data):
+        self.server.store(self.mail_from, self.recipients, data)
+        self.messages_on_connection += 1
+        self.mail_from, self.recipients = None, []
+        self.reply(250, "Message accepted")
+
+    def smtp_RSET(self, argument):
+        self.mail_from, self.recipients = None, []
+        self.chunks.clear()
+        self.reply(250)
+
+    def smtp_NOOP(self, argument):
+        self.reply(250)
+
+    def smtp_QUIT(self, argument):
+        self.reply(221, "Bye")
+        return False
+
+
+class SMTPSinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, address, options):
+        self.options = options
+        self.stats = Counter()
+        self.messages = []  # (mail_from, recipients, data) when keep_messages=True
+        self.lock = threading.Lock()
+        self.random = random.Random(options["seed"])
+        self.tls_context = None
+        if options["tls"]:
+            self.tls_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            self.tls_context.load_cert_chain(*options["tls"])
+        super().__init__(address, SMTPHandler)
+
+    def inject_error(self):
+        if not self.options["error_rate"]:
+            return False
+        with self.lock:
+            return self.random.random() < self.options["error_rate"]
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.stats[name] += amount
+
+    def store(self, mail_from, recipients, data):
+        with self.lock:
+            self.stats["messages"] += 1
+            self.stats["recipients"] += len(recipients)
+            self.stats["bytes"] += len(data)
+            if self.options["keep_messages"]:
+                self.messages.append((mail_from, list(recipients), data))
+
+
+class LocalSMTPServer:
+    """Runs an SMTPSinkServer on 127.0.0.1 in a background thread."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, max_messages_per_connection=0, rcpt_errors=None,
+                 max_recipients=100, pipelining=True, chunking=True, tls=None, implicit_tls=False, error_rate=0.0,
+                 seed=None, keep_messages=True):
+        options = {
+            "tls": tls,
+            "implicit_tls": implicit_tls,
+            "error_rate": error_rate,
+            "seed": seed,
+            "max_recipients": max_recipients,
+            "pipelining": pipelining,
+            "chunking": chunking,
+            "latency": latency,
+            "max_messages_per_connection": max_messages_per_connection,
+            "rcpt_errors": rcpt_errors or {},
+            "keep_messages": keep_messages,
+        }
+        self.server = SMTPSinkServer((host, port), options)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def host(self):
+        return self.server.server_address[0]
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    @property
+    def options(self):
+        return self.server.options
+
+    @property
+    def stats(self):
+        return self.server.stats
+
+    @property
+    def messages(self):
+        return self.server.messages
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def make_certificate(directory, host="localhost"):
+    """A self-signed certificate for 127.0.0.1/localhost made with the openssl command line tool.
+    Returns (certfile, keyfile); clients trust it with ssl.create_default_context(cafile=certfile)."""
+    certfile, keyfile = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-keyout", keyfile, "-out", certfile, "-subj", f"/CN={host}",
+         "-addext", f"subjectAltName=DNS:{host},IP:127.0.0.1"],
+        check=True, capture_output=True)
+    return certfile, keyfile
+
+
+class LocalSMTPServerProcess:
+    """The same server in a child process, so memory and CPU we measure are only our own.
+    Takes the options of LocalSMTPServer, but there are no .stats/.messages to look at."""
+
+    def __init__(self, **options):
+        self.options = options
+        self.process = None
+        self.host = self.port = None
+
+    def start(self):
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        self.process = multiprocessing.get_context("fork").Process(
+            target=_serve_forever, args=(sender, self.options), daemon=True)
+        self.process.start()
+        self.host, self.port = receiver.recv()
+        return self
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def _serve_forever(connection, options):
+    server = LocalSMTPServer(**options).start()
+    connection.send((server.host, server.port))
+    server.thread.join()
+
+
+if __name__ == "__main__":
+    import smtplib
+
+    with LocalSMTPServer() as server:
+        with smtplib.SMTP(server.host, server.port) as smtp:
+            smtp.login("my@gmail.com", "any password")
+            smtp.sendmail("my@gmail.com", ["your@gmail.com"], "Subject: Hi there\r\n\r\n.This message is sent from Python.")
+        print(server.messages)
+        print(dict(server.stats))
@@ -81,6 +81,8 @@
 
 # My custom class which behaves like a sequence
 class MySeq:
+    __slots__ = ("elements",)  # no __dict__ per instance, subclasses with __slots__ stay small too
+
     def __init__(self, elements):
         self.elements = list(elements)
 
@@ -90,4 +92,11 @@ class MySeq:
     def __getitem__(self, index):
         return self.elements[index]
 
-numbers = MySeq([1, 2, 3, 4, 5])
\ No newline at end of file
+numbers = MySeq([1, 2, 3, 4, 5])
+
+# MySeq copies everything into a list: for millions of numbers see TypedSeq
+# in 29_typed_sequence.py (array.array storage, slices are memoryviews, numpy can wrap it)
+# and for data bigger than RAM MMapSeq in 30_mmap_sequence.py (fixed-width records in a mmap file)
+# range(10) + range(10, 20, 2) without TypeError and without copying: ChainSeq in 31_chained_sequence.py
+# whole-sequence arithmetic, masks and reductions instead of loops: VecSeq in 32_vectorized_sequence.py
+# what len, index, slice, iteration, "+" and "in" cost for each of them: 33_sequence_benchmark.py
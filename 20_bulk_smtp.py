@@ -0,0 +1,248 @@
+"""
+- Why is sending many mails with 6_send_mail.py slow?
+  Every example there does:
+
+    with smtplib.SMTP_SSL(smtp_server, port, context=context) as server:
+        server.login(sender_email, password)
+        server.sendmail(sender_email, receiver_email, message)
+
+  For ONE message that is: TCP connect, greeting, TLS handshake, EHLO, AUTH, then
+  MAIL/RCPT/DATA, then QUIT. Only MAIL/RCPT/DATA is the actual sending, everything
+  else is repeated for every message. With 50ms to the server that is ~0.5s per mail.
+
+- SMTP connections can send many messages
+  After one message is accepted ("250 OK") we can start the next MAIL FROM on the
+  same connection. So we keep a pool of logged-in connections (like the HTTP
+  connection pool of 9_session_client.py) and send from several threads at once.
+
+  Servers don't like connections that live forever, so:
+    - a connection is closed after `max_messages_per_connection` messages
+    - when the server says "421 closing connection", disconnects us or times out,
+      we throw that connection away and send the message again on a new one
+
+- Usage
+    pool = SMTPConnectionPool("smtp.gmail.com", 465, "my@gmail.com", password, ssl=True)
+    with BulkMailer(pool, workers=4) as mailer:
+        for result in mailer.send_many(mails):
+            print(result)
+"""
+
+import queue
+import smtplib
+import socket
+import ssl as ssl_module
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from email.message import Message
+
+Mail = namedtuple("Mail", ["sender", "recipients", "message"])
+SendResult = namedtuple("SendResult", ["mail", "ok", "refused", "error", "attempts", "elapsed"])
+
+# errors after which the connection can't be used anymore, the message can be sent again
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, socket.timeout, ConnectionError)
+
+
+def is_reconnect_error(err):
+    if isinstance(err, RECONNECT_ERRORS):
+        return True
+    # smtplib closes the connection itself when the server answers 421
+    if getattr(err, "smtp_code", None) == 421:
+        return True
+    recipients = getattr(err, "recipients", None) or {}
+    return any(code == 421 for code, _ in recipients.values())
+
+
+class SMTPConnectionPool:
+    """Logged-in SMTP connections to one server, shared by threads."""
+
+    def __init__(self, host, port, username=None, password=None, ssl=False, starttls=False, context=None,
+                 size=4, max_messages_per_connection=100, timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.ssl = ssl
+        self.starttls = starttls
+        # one SSLContext for all connections, creating it loads the CA certificates every time
+        self.context = context or (ssl_module.create_default_context() if ssl or starttls else None)
+        self.max_messages_per_connection = max_messages_per_connection
+        self.timeout = timeout
+        self.idle = queue.LifoQueue()  # the most recently used connection is the least likely to be timed out
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def connect(self):
+        if self.ssl:
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout, context=self.context)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            server.ehlo()
+            if self.starttls:
+                server.starttls(context=self.context)
+                server.ehlo()
+            if self.username:
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        server.messages_sent = 0
+        self.count("connections")
+        return server
+
+    def acquire(self):
+        self.slots.acquire()
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self.connect()
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def release(self, server):
+        if server.messages_sent >= self.max_messages_per_connection:
+            self.quit(server)
+        else:
+            self.idle.put(server)
+        self.slots.release()
+
+    def discard(self, server):
+        server.close()
+        self.count("discarded")
+        self.slots.release()
+
+    def quit(self, server):
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    def close(self):
+        while True:
+            try:
+                self.quit(self.idle.get_nowait())
+            except queue.Empty:
+                return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class BulkMailer:
+    def __init__(self, pool, workers=4, retries=2):
+        self.pool = pool
+        self.workers = workers
+        self.retries = retries
+
+    def send(self, mail):
+        """Sends one Mail, returns a SendResult (never raises for SMTP errors)."""
+        if not isinstance(mail, Mail):
+            mail = Mail(*mail)
+        start = time.perf_counter()
+        attempts = 0
+        while True:
+            attempts += 1
+            error = None
+            try:
+                server = self.pool.acquire()
+            except (smtplib.SMTPException, OSError) as err:
+                error = err
+            else:
+                try:
+                    if isinstance(mail.message, Message):
+                        refused = server.send_message(mail.message, mail.sender, mail.recipients)
+                    else:
+                        refused = server.sendmail(mail.sender, mail.recipients, mail.message)
+                except (smtplib.SMTPException, OSError) as err:
+                    error = err
+                    if is_reconnect_error(err):
+                        self.pool.discard(server)
+                    else:
+                        # a normal rejection (e.g. 550 unknown user), smtplib already sent RSET
+                        self.pool.release(server)
+                        return SendResult(mail, False, {}, err, attempts, time.perf_counter() - start)
+                else:
+                    server.messages_sent += 1
+                    self.pool.release(server)
+                    return SendResult(mail, True, refused, None, attempts, time.perf_counter() - start)
+
+            if attempts > self.retries or not (is_reconnect_error(error) or isinstance(error, OSError)):
+                return SendResult(mail, False, {}, error, attempts, time.perf_counter() - start)
+            self.pool.count("retries")
+
+    def send_many(self, mails):
+        """Sends with `workers` threads, yields a SendResult per mail in the original order."""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            yield from executor.map(self.send, mails)
+
+    def close(self):
+        self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == "__main__":
+    import importlib
+
+    LocalSMTPServer = importlib.import_module("19_local_smtp_server").LocalSMTPServer
+
+    N = 300
+    LATENCY = 0.005  # 5ms per round-trip, a server in the same region
+    message = """\
+Subject: Hi there
+
+This message is sent from Python."""
+    mails = [Mail("my@gmail.com", [f"my+person{i}@gmail.com"], message) for i in range(N)]
+
+    with LocalSMTPServer(latency=LATENCY, keep_messages=False) as server:
+        # --------------------------
+        # the 6_send_mail.py way: one connection (and login) per message
+        # --------------------------
+        start = time.perf_counter()
+        for mail in mails:
+            with smtplib.SMTP(server.host, server.port) as smtp:
+                smtp.login("my@gmail.com", "password")
+                smtp.sendmail(*mail)
+        one_by_one = time.perf_counter() - start
+        print(f"one connection per message: {N / one_by_one:7.1f} msgs/s, {dict(server.stats)}")
+
+        # --------------------------
+        # pooled, one thread and 4 threads
+        # --------------------------
+        for workers in (1, 4):
+            server.stats.clear()
+            pool = SMTPConnectionPool(server.host, server.port, "my@gmail.com", "password", size=workers)
+            start = time.perf_counter()
+            with BulkMailer(pool, workers=workers) as mailer:
+                results = list(mailer.send_many(mails))
+            elapsed = time.perf_counter() - start
+            print(f"pooled, {workers} worker(s):       {N / elapsed:7.1f} msgs/s, "
+                  f"ok={sum(result.ok for result in results)}, {dict(server.stats)}")
+
+    # --------------------------
+    # the server closes the connection after 50 messages with 421, we reconnect
+    # --------------------------
+    with LocalSMTPServer(max_messages_per_connection=50, keep_messages=False) as server:
+        pool = SMTPConnectionPool(server.host, server.port, size=4, max_messages_per_connection=1000)
+        with BulkMailer(pool, workers=4) as mailer:
+            results = list(mailer.send_many(mails))
+        print(f"421 after 50 messages: ok={sum(result.ok for result in results)}/{N}, "
+              f"retried={sum(result.attempts > 1 for result in results)}, pool={dict(pool.stats)}, "
+              f"server={dict(server.stats)}")
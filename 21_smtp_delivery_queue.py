@@ -0,0 +1,432 @@
+"""
+- Our own "transactional email service"
+  The end of 6_send_mail.py says that for a large volume of emails with reliable
+  delivery we should look at transactional email services. What do they do?
+
+    1. Accept a message and store it on disk BEFORE saying "ok", so nothing is lost
+       when the process crashes.
+    2. Deliver many messages at the same time, but only a few connections per
+       destination domain (gmail.com doesn't like 500 connections from one client).
+    3. Remember what happened to every message:
+         delivered - the server answered 250
+         deferred  - temporary error (4xx, timeout, connection lost), try again later
+         bounced   - permanent error (5xx) or too many attempts, give up
+
+- MailQueue: the outbox is a SQLite table
+  One row per (message, recipient domain). When the server refuses some recipients of a
+  row and accepts the others, the refused ones move to a row of their own (the next
+  "part"), so they are deferred or bounced while the rest is delivered.
+  Every state change is committed right after the server answers, so after a crash:
+    - queued/deferred rows are simply sent again
+    - delivered/bounced rows are never sent again
+    - rows in "sending" were on the wire when we crashed. We don't know if the server
+      got them, so they are sent again. This window (one message per connection) is
+      the only place where a duplicate can happen; it has the same Message-ID header,
+      so receiving servers can drop it.
+  Enqueueing the same Message-ID twice is ignored (UNIQUE constraint).
+  Only one engine may run per queue file, a starting engine takes over all "sending" rows.
+
+- DeliveryEngine: asyncio + aiosmtplib (python -m pip install aiosmtplib)
+  Like 10_async_requests.py: one thread, many connections. Every domain has its own
+  in-memory inbox and up to `per_domain` workers, every worker keeps ONE SMTP
+  connection open and sends message after message on it (see 20_bulk_smtp.py).
+
+    queue = MailQueue("outbox.sqlite3")
+    queue.enqueue(build_message(sender, receiver, "Hi there", "This message is sent from Python."))
+    engine = DeliveryEngine(queue, relay=("smtp.example.com", 25))
+    asyncio.run(engine.run())
+"""
+
+import asyncio
+import json
+import sqlite3
+import time
+from collections import Counter, defaultdict, namedtuple
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import formatdate, getaddresses, make_msgid
+
+import aiosmtplib
+
+QUEUED, SENDING, DELIVERED, DEFERRED, BOUNCED = "queued", "sending", "delivered", "deferred", "bounced"
+
+Outgoing = namedtuple("Outgoing", ["id", "message_id", "domain", "sender", "recipients", "body", "attempts"])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id           INTEGER PRIMARY KEY,
+    message_id   TEXT NOT NULL,
+    domain       TEXT NOT NULL,
+    part         INTEGER NOT NULL DEFAULT 0,
+    sender       TEXT NOT NULL,
+    recipients   TEXT NOT NULL,
+    body         BLOB NOT NULL,
+    state        TEXT NOT NULL DEFAULT 'queued',
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    last_error   TEXT,
+    updated      REAL NOT NULL,
+    UNIQUE (message_id, domain, part)
+);
+CREATE INDEX IF NOT EXISTS outbox_ready ON outbox (state, next_attempt);
+"""
+
+
+def build_message(sender, receiver, subject, text, html=None):
+    """The multipart message of 6_send_mail.py, plus the headers a queue needs (Message-ID, Date)."""
+    message = MIMEMultipart("alternative")
+    message["Subject"] = subject
+    message["From"] = sender
+    message["To"] = receiver
+    message["Date"] = formatdate(localtime=True)
+    message["Message-ID"] = make_msgid(domain=sender.rpartition("@")[2] or None)
+    message.attach(MIMEText(text, "plain"))
+    if html is not None:
+        message.attach(MIMEText(html, "html"))
+    return message
+
+
+class MailQueue:
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, isolation_level=None)  # autocommit, we use explicit transactions
+        # WAL: a commit is an append to the log, readers don't block the writer
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def enqueue(self, message, sender=None, recipients=None):
+        """Stores an email.message.Message, one row per recipient domain. Returns the Message-ID."""
+        sender = sender or message["From"]
+        if recipients is None:
+            fields = message.get_all("To", []) + message.get_all("Cc", []) + message.get_all("Bcc", [])
+            recipients = [address for _, address in getaddresses(fields)]
+        if message["Message-ID"] is None:
+            message["Message-ID"] = make_msgid()
+        message_id = message["Message-ID"]
+
+        # like smtplib.send_message: Bcc must not be visible to the receivers
+        bcc = message.get_all("Bcc")
+        del message["Bcc"]
+        body = message.as_bytes()
+        for value in bcc or ():
+            message["Bcc"] = value
+
+        by_domain = defaultdict(list)
+        for recipient in recipients:
+            by_domain[recipient.rpartition("@")[2].lower()].append(recipient)
+        now = time.time()
+        with self.transaction():
+            self.db.executemany(
+                "INSERT OR IGNORE INTO outbox (message_id, domain, sender, recipients, body, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(message_id, domain, sender, json.dumps(addresses), body, now)
+                 for domain, addresses in by_domain.items()])
+        return message_id
+
+    def enqueue_many(self, messages):
+        with self.transaction():
+            return [self.enqueue(message) for message in messages]
+
+    def transaction(self):
+        return _Transaction(self.db)
+
+    def recover(self):
+        """Rows left in "sending" by a crashed run go back to the queue. Returns how many."""
+        with self.transaction():
+            return self.db.execute("UPDATE outbox SET state = ? WHERE state = ?", (QUEUED, SENDING)).rowcount
+
+    def claim(self, limit, now=None):
+        now = time.time() if now is None else now
+        with self.transaction():
+            rows = self.db.execute(
+                "SELECT id, message_id, domain, sender, recipients, body, attempts FROM outbox "
+                "WHERE state IN (?, ?) AND next_attempt <= ? ORDER BY next_attempt, id LIMIT ?",
+                (QUEUED, DEFERRED, now, limit)).fetchall()
+            self.db.executemany("UPDATE outbox SET state = ?, updated = ? WHERE id = ?",
+                                [(SENDING, now, row[0]) for row in rows])
+        return [Outgoing(*row[:4], json.loads(row[4]), *row[5:]) for row in rows]
+
+    def release(self, outgoings):
+        """Claimed rows that were never sent go back to the queue (engine stopped, worker crashed)."""
+        with self.transaction():
+            self.db.executemany("UPDATE outbox SET state = ? WHERE id = ? AND state = ?",
+                                [(QUEUED, outgoing.id, SENDING) for outgoing in outgoings])
+
+    def split(self, outgoing, recipients):
+        """Moves some recipients of a claimed row to a new row (also "sending"), returns it."""
+        rest = [recipient for recipient in outgoing.recipients if recipient not in recipients]
+        with self.transaction():
+            self.db.execute("UPDATE outbox SET recipients = ? WHERE id = ?", (json.dumps(rest), outgoing.id))
+            cursor = self.db.execute(
+                "INSERT INTO outbox (message_id, domain, part, sender, recipients, body, state, attempts, updated) "
+                "SELECT message_id, domain, (SELECT MAX(part) + 1 FROM outbox WHERE message_id = ? AND domain = ?), "
+                "sender, ?, body, ?, attempts, ? FROM outbox WHERE id = ?",
+                (outgoing.message_id, outgoing.domain, json.dumps(list(recipients)), SENDING, time.time(), outgoing.id))
+        return outgoing._replace(id=cursor.lastrowid, recipients=list(recipients))
+
+    def mark(self, outgoing, state, error=None, next_attempt=0):
+        with self.transaction():
+            self.db.execute(
+                "UPDATE outbox SET state = ?, attempts = attempts + 1, next_attempt = ?, last_error = ?, updated = ? "
+                "WHERE id = ?", (state, next_attempt, error, time.time(), outgoing.id))
+
+    def next_due(self):
+        """Seconds until the next deferred row is due, 0 if something is ready, None if nothing is left."""
+        row = self.db.execute("SELECT MIN(next_attempt) FROM outbox WHERE state IN (?, ?)", (QUEUED, DEFERRED)).fetchone()
+        return None if row[0] is None else max(row[0] - time.time(), 0.0)
+
+    def counts(self):
+        return dict(self.db.execute("SELECT state, COUNT(*) FROM outbox GROUP BY state").fetchall())
+
+    def close(self):
+        self.db.close()
+
+
+class _Transaction:
+    # nested `with queue.transaction()` blocks become one transaction (enqueue_many)
+    def __init__(self, db):
+        self.db = db
+        self.outermost = not db.in_transaction
+
+    def __enter__(self):
+        if self.outermost:
+            self.db.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.outermost:
+            self.db.execute("COMMIT" if exc_type is None else "ROLLBACK")
+
+
+class DeliveryEngine:
+    def __init__(self, queue, relay=("localhost", 25), routes=None, max_connections=100, per_domain=10,
+                 batch_size=500, max_attempts=5, retry_base=60.0, retry_max=3600.0, idle_timeout=1.0, timeout=30):
+        self.queue = queue
+        self.relay = relay
+        self.routes = routes or {}  # domain -> (host, port), everything else goes through the relay
+        self.per_domain = per_domain
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.inboxes = defaultdict(asyncio.Queue)
+        self.workers = defaultdict(set)
+        self.quitting = set()  # workers that stopped taking messages and are saying QUIT
+        self.pending = 0
+        self.stats = Counter()
+        self.peak_per_domain = Counter()
+
+    async def run(self, stop_when_idle=True, poll_interval=0.2):
+        self.connections = asyncio.Semaphore(self.max_connections)
+        self.progress = asyncio.Event()
+        self.stats["recovered"] += self.queue.recover()
+        try:
+            while True:
+                if self.pending < self.batch_size // 2:
+                    for outgoing in self.queue.claim(self.batch_size - self.pending):
+                        self.dispatch(outgoing)
+                if self.pending == 0:
+                    wait = self.queue.next_due()
+                    if wait is None and stop_when_idle:
+                        return self.stats
+                    await asyncio.sleep(min(wait if wait is not None else poll_interval, poll_interval))
+                    continue
+                self.progress.clear()
+                await self.progress.wait()
+        finally:
+            await self.stop_workers()
+
+    def dispatch(self, outgoing):
+        inbox = self.inboxes[outgoing.domain]
+        inbox.put_nowait(outgoing)
+        self.pending += 1
+        workers = self.workers[outgoing.domain]
+        if len(workers) < min(self.per_domain, inbox.qsize()):
+            task = asyncio.create_task(self.domain_worker(outgoing.domain))
+            workers.add(task)
+            task.add_done_callback(workers.discard)
+            task.add_done_callback(self.quitting.discard)
+
+    async def domain_worker(self, domain):
+        inbox = self.inboxes[domain]
+        smtp = None
+        async with self.connections:
+            active = len(self.workers[domain])
+            self.peak_per_domain[domain] = max(self.peak_per_domain[domain], active)
+            try:
+                while True:
+                    try:
+                        outgoing = await asyncio.wait_for(inbox.get(), self.idle_timeout)
+                    except asyncio.TimeoutError:
+                        return
+                    if outgoing is None:
+                        return
+                    try:
+                        smtp = await self.deliver(smtp, outgoing)
+                    except Exception as err:  # a bug, not the server: retried later, bounced after max_attempts
+                        self.fail(outgoing, True, f"{type(err).__name__}: {err}")
+                        raise
+                    finally:
+                        self.pending -= 1
+                        self.progress.set()
+            except Exception:
+                if len(self.workers[domain]) == 1:  # nobody left to send the rest of the inbox
+                    self.release_inbox(domain)
+                raise
+            finally:
+                # no longer counted before the QUIT, or dispatch() starts no worker for a row queued meanwhile
+                task = asyncio.current_task()
+                self.workers[domain].discard(task)
+                if smtp is not None:
+                    self.quitting.add(task)
+                    await self.disconnect(smtp)
+
+    async def connect(self, domain):
+        host, port = self.routes.get(domain, self.relay)
+        smtp = aiosmtplib.SMTP(hostname=host, port=port, timeout=self.timeout, start_tls=False)
+        await smtp.connect()
+        self.stats["connections"] += 1
+        return smtp
+
+    async def disconnect(self, smtp):
+        try:
+            await smtp.quit()
+        except (aiosmtplib.SMTPException, OSError):
+            smtp.close()
+
+    async def deliver(self, smtp, outgoing):
+        """Sends one row and records the outcome, returns the connection to use for the next one."""
+        try:
+            if smtp is None:
+                smtp = await self.connect(outgoing.domain)
+            refused, _ = await smtp.sendmail(outgoing.sender, outgoing.recipients, outgoing.body)
+        except aiosmtplib.SMTPRecipientsRefused as err:
+            self.settle(outgoing, {refusal.recipient: refusal for refusal in err.recipients})
+        except aiosmtplib.SMTPResponseException as err:
+            self.fail(outgoing, 400 <= err.code < 500, f"{err.code} {err.message}")
+            if err.code == 421 and smtp is not None:  # the server is closing the connection
+                smtp.close()
+                smtp = None
+        except (aiosmtplib.SMTPException, OSError, asyncio.TimeoutError) as err:
+            self.fail(outgoing, True, f"{type(err).__name__}: {err}")
+            if smtp is not None:
+                smtp.close()
+            smtp = None
+        else:
+            self.settle(outgoing, refused)
+        return smtp
+
+    def settle(self, outgoing, refused):
+        """Records a sent row: refused recipients ({address: response}) are deferred (4xx) or bounced (5xx)
+        in rows of their own, the accepted ones are delivered."""
+        groups = defaultdict(dict)
+        for address, response in refused.items():
+            groups[400 <= response.code < 500][address] = response
+        for temporary, group in groups.items():
+            error = "; ".join(f"{address}: {response.code} {response.message}" for address, response in group.items())
+            if len(group) == len(outgoing.recipients):  # nobody else left in this row
+                self.fail(outgoing, temporary, error)
+                return
+            self.fail(self.queue.split(outgoing, group), temporary, error)
+            outgoing = outgoing._replace(recipients=[address for address in outgoing.recipients if address not in group])
+        self.queue.mark(outgoing, DELIVERED)
+        self.stats[DELIVERED] += 1
+
+    def fail(self, outgoing, temporary, error):
+        attempts = outgoing.attempts + 1
+        if temporary and attempts < self.max_attempts:
+            delay = min(self.retry_base * 2 ** (attempts - 1), self.retry_max)
+            self.queue.mark(outgoing, DEFERRED, error, time.time() + delay)
+            self.stats[DEFERRED] += 1
+        else:
+            self.queue.mark(outgoing, BOUNCED, error)
+            self.stats[BOUNCED] += 1
+
+    def release_inbox(self, domain):
+        inbox = self.inboxes[domain]
+        unsent = [outgoing for outgoing in (inbox.get_nowait() for _ in range(inbox.qsize())) if outgoing is not None]
+        self.queue.release(unsent)
+        self.pending -= len(unsent)
+        self.progress.set()
+
+    async def stop_workers(self):
+        # workers finish the message they are sending, the rest goes back to the queue
+        for domain, workers in self.workers.items():
+            self.release_inbox(domain)
+            for _ in range(len(workers)):
+                self.inboxes[domain].put_nowait(None)
+        tasks = [task for workers in self.workers.values() for task in workers] + list(self.quitting)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    import importlib
+    import multiprocessing
+    import os
+    import re
+    import tempfile
+
+    LocalSMTPServer = importlib.import_module("19_local_smtp_server").LocalSMTPServer
+
+    N = 20000
+    DOMAINS = [f"example{i}.com" for i in range(10)]
+
+    def make_messages(count):
+        for i in range(count):
+            receiver = f"person{i}@{DOMAINS[i % len(DOMAINS)]}"
+            if i % 1000 == 1:
+                receiver = f"bounce{i}@{DOMAINS[0]}"
+            elif i % 1000 == 2:
+                receiver = f"defer{i}@{DOMAINS[1]}"
+            yield build_message("my@gmail.com", receiver, "Hi there", f"Hi person {i},\nThis message is sent from Python.")
+
+    with tempfile.TemporaryDirectory() as directory, \
+            LocalSMTPServer(latency=0.001, rcpt_errors={"bounce": (550, "No such user"), "defer": (451, "Try again later")},
+                            keep_messages=False) as server:
+        # --------------------------
+        # 1. throughput
+        # --------------------------
+        queue = MailQueue(os.path.join(directory, "outbox.sqlite3"))
+        start = time.perf_counter()
+        queue.enqueue_many(make_messages(N))
+        print(f"enqueued {N} messages in {time.perf_counter() - start:.2f}s")
+
+        engine = DeliveryEngine(queue, relay=(server.host, server.port), per_domain=5,
+                                max_attempts=3, retry_base=0.05, retry_max=0.2)
+        start = time.perf_counter()
+        stats = asyncio.run(engine.run())
+        elapsed = time.perf_counter() - start
+        print(f"delivered in {elapsed:.2f}s = {stats[DELIVERED] / elapsed * 60:,.0f} msgs/minute, {dict(stats)}")
+        print("queue:", queue.counts(), "| max connections per domain:", max(engine.peak_per_domain.values()),
+              "| server:", dict(server.stats))
+        queue.close()
+
+        # --------------------------
+        # 2. crash in the middle of sending, then start again
+        # --------------------------
+        server.stats.clear()
+        server.options["keep_messages"] = True
+        queue_path = os.path.join(directory, "crash.sqlite3")
+        queue = MailQueue(queue_path)
+        queue.enqueue_many(build_message("my@gmail.com", f"person{i}@{DOMAINS[i % 10]}", "Hi", "Hello")
+                           for i in range(5000))
+
+        def run_engine():
+            engine = DeliveryEngine(MailQueue(queue_path), relay=(server.host, server.port), per_domain=5)
+            asyncio.run(engine.run())
+
+        # run the engine in another process and kill -9 it after half a second
+        process = multiprocessing.get_context("fork").Process(target=run_engine)
+        process.start()
+        time.sleep(0.5)
+        process.kill()
+        process.join()
+        print("after the crash:", queue.counts())
+        stats = asyncio.run(DeliveryEngine(queue, relay=(server.host, server.port), per_domain=5).run())
+        ids = Counter(re.search(rb"Message-ID: (\S+)", data).group(1) for _, _, data in server.messages)
+        print(f"after the restart: {queue.counts()}, recovered={stats['recovered']}, "
+              f"unique messages received={len(ids)}, duplicates={sum(ids.values()) - len(ids)}")
+        queue.close()
@@ -0,0 +1,313 @@
+"""
+- What does the attachment example in 6_send_mail.py cost?
+
+    part.set_payload(attachment.read())     -> the whole PDF in memory
+    encoders.encode_base64(part)            -> a base64 copy, 4/3 of the size
+    text = message.as_string()              -> the whole message again, as one string
+    server.sendmail(sender, receiver, text) -> smtplib encodes it to bytes and copies it
+                                               once more for the dot-stuffing (see below)
+
+  So a 10 MB PDF means ~60 MB of copies and base64 work for EVERY send, even when the
+  same PDF goes to thousands of people.
+
+- Encode once, send many times
+  AttachmentStore base64-encodes a file once and keeps the result:
+    - cache_dir=None: in memory
+    - cache_dir=path: in a file "<key>.b64", memory-mapped (mmap), so the OS keeps it
+      in its page cache and our process doesn't copy it at all
+  The key is (path, modification time, size): when the file changes we encode again.
+
+- Streaming it into the DATA command
+  smtplib.sendmail() wants the whole message in one string. send_chunks() below does
+  what sendmail() does (MAIL FROM, RCPT TO, DATA) but writes the message piece by
+  piece to the socket, and the attachment pieces are slices of the mmap.
+
+  In DATA a line with only "." ends the message, so smtplib doubles every dot at the
+  start of a line ("dot-stuffing"). Base64 only uses A-Z a-z 0-9 + / =, so the encoded
+  attachment never needs it; only the small text parts are stuffed.
+"""
+
+import base64
+import hashlib
+import importlib
+import mimetypes
+import mmap
+import os
+import random
+import re
+import smtplib
+import threading
+from email.utils import encode_rfc2231, formatdate, make_msgid
+
+mail_merge = importlib.import_module("22_mail_merge")
+
+LINE_BYTES = 57  # 57 bytes -> one base64 line of 76 characters
+BLOCK_BYTES = LINE_BYTES * 16384  # ~900 KB read per step while encoding
+
+
+def dot_stuff(data):
+    return re.sub(rb"(?m)^\.", b"..", data)
+
+
+class EncodedAttachment:
+    def __init__(self, path, key, data, content_type):
+        self.path = path
+        self.filename = os.path.basename(path)
+        self.key = key
+        self.data = data  # bytes or mmap with the base64 text, CRLF line ends
+        self.content_type = content_type
+
+    def __len__(self):
+        return len(self.data)
+
+    def chunks(self, chunk_size=256 * 1024):
+        view = memoryview(self.data)
+        for start in range(0, len(view), chunk_size):
+            yield view[start:start + chunk_size]
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+
+class AttachmentStore:
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.entries = {}  # absolute path -> EncodedAttachment
+        self.path_locks = {}  # absolute path -> Lock, held while that file is encoded
+        self.lock = threading.Lock()
+        self.encoded = 0  # how many times we really base64-encoded a file
+
+    @staticmethod
+    def key_for(path):
+        stat = os.stat(path)
+        return hashlib.sha1(f"{path}\0{stat.st_mtime_ns}\0{stat.st_size}".encode()).hexdigest()
+
+    def get(self, path, content_type=None):
+        path = os.path.abspath(path)
+        key = self.key_for(path)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry.key == key:
+                return entry
+            path_lock = self.path_locks.setdefault(path, threading.Lock())
+        # only senders of this file wait for the encoding, the others go on
+        with path_lock:
+            with self.lock:
+                entry = self.entries.get(path)
+            if entry is not None and entry.key == key:
+                return entry  # encoded by another thread while we waited
+            content_type = content_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+            new = EncodedAttachment(path, key, self.load(path, key), content_type)
+            with self.lock:
+                self.entries[path] = new
+            if entry is not None:
+                self.discard(entry)
+            return new
+
+    def load(self, path, key):
+        if not self.cache_dir:
+            with open(path, "rb") as source:
+                return b"".join(self.encode(source))
+        cached = os.path.join(self.cache_dir, key + ".b64")
+        if not os.path.exists(cached):
+            temporary = f"{cached}.{os.getpid()}.tmp"
+            with open(path, "rb") as source, open(temporary, "wb") as target:
+                for block in self.encode(source):
+                    target.write(block)
+            os.replace(temporary, cached)  # other processes never see a half-written file
+        with open(cached, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def encode(self, source):
+        with self.lock:
+            self.encoded += 1
+        while block := source.read(BLOCK_BYTES):
+            # encodebytes makes 76 character lines ending in "\n", SMTP wants "\r\n"
+            yield base64.encodebytes(block).replace(b"\n", b"\r\n")
+
+    def discard(self, entry):
+        # the file changed. Another thread may still be streaming the old data, so its mmap
+        # isn't closed here; it goes away with the last reference (the removed file too).
+        if self.cache_dir:
+            try:
+                os.remove(os.path.join(self.cache_dir, entry.key + ".b64"))
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        with self.lock:
+            for entry in self.entries.values():
+                entry.close()
+            self.entries.clear()
+
+
+def content_disposition(filename):
+    if filename.isascii() and not any(char in filename for char in '"\\\r\n'):
+        return f'attachment; filename="{filename}"'
+    return f"attachment; filename*={encode_rfc2231(filename, 'utf-8')}"  # RFC 2231: utf-8''%C3%A4...
+
+
+def message_chunks(sender, receiver, subject, body, attachments):
+    """The message of the 6_send_mail.py attachment example, as chunks ready for DATA."""
+    boundary = "===============%019d==" % random.randrange(10 ** 19)
+    lines = body.replace("\r\n", "\n").split("\n")
+    if body.isascii() and max(map(len, lines)) <= 998:
+        encoding, text = "7bit", "\r\n".join(lines).encode("ascii")
+    else:
+        # 8bit would need a server with 8BITMIME and MAIL FROM ... BODY=8BITMIME
+        encoding, text = "quoted-printable", mail_merge.encode_qp_text(body)
+    head = (f"From: {sender}\r\n"
+            f"To: {receiver}\r\n").encode()
+    head += mail_merge.encode_header("Subject", subject)  # RFC 2047 if it isn't ASCII
+    head += (f"Date: {formatdate(localtime=True)}\r\n"
+             f"Message-ID: {make_msgid(domain=sender.rpartition('@')[2] or None)}\r\n"
+             "MIME-Version: 1.0\r\n"
+             f'Content-Type: multipart/mixed; boundary="{boundary}"\r\n'
+             "\r\n"
+             f"--{boundary}\r\n"
+             'Content-Type: text/plain; charset="utf-8"\r\n'
+             f"Content-Transfer-Encoding: {encoding}\r\n"
+             "\r\n").encode()
+    yield dot_stuff(head + text + b"\r\n")
+    for attachment in attachments:
+        yield (f"--{boundary}\r\n"
+               f"Content-Type: {attachment.content_type}\r\n"
+               "Content-Transfer-Encoding: base64\r\n"
+               f"Content-Disposition: {content_disposition(attachment.filename)}\r\n"
+               "\r\n").encode()
+        yield from attachment.chunks()  # base64: no dot-stuffing needed
+    yield f"--{boundary}--\r\n".encode()
+
+
+def start_envelope(server, sender, recipients):
+    """MAIL FROM and RCPT TO with the error handling of smtplib.SMTP.sendmail().
+    Returns the refused recipients, raises when nobody is left to send to."""
+    server.ehlo_or_helo_if_needed()
+    code, response = server.mail(sender)
+    if code != 250:
+        if code == 421:
+            server.close()
+        else:
+            server.rset()
+        raise smtplib.SMTPSenderRefused(code, response, sender)
+    refused = {}
+    for recipient in recipients:
+        code, response = server.rcpt(recipient)
+        if code not in (250, 251):
+            refused[recipient] = (code, response)
+        if code == 421:
+            server.close()
+            raise smtplib.SMTPRecipientsRefused(refused)
+    if len(refused) == len(recipients):
+        server.rset()
+        raise smtplib.SMTPRecipientsRefused(refused)
+    return refused
+
+
+def send_chunks(server, sender, recipients, chunks):
+    """smtplib.SMTP.sendmail() for a message given as chunks that are already dot-stuffed
+    and end with CRLF. Returns the refused recipients like sendmail()."""
+    if isinstance(recipients, str):
+        recipients = [recipients]
+    refused = start_envelope(server, sender, recipients)
+    code, response = server.docmd("data")
+    if code != 354:
+        server.rset()
+        raise smtplib.SMTPDataError(code, response)
+    for chunk in chunks:
+        server.send(chunk)
+    server.send(b".\r\n")
+    code, response = server.getreply()
+    if code != 250:
+        if code == 421:
+            server.close()
+        else:
+            server.rset()
+        raise smtplib.SMTPDataError(code, response)
+    return refused
+
+
+if __name__ == "__main__":
+    import email
+    import email.policy
+    import importlib
+    import tempfile
+    import time
+    import tracemalloc
+    from email import encoders
+    from email.mime.base import MIMEBase
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
+    local_smtp_server = importlib.import_module("19_local_smtp_server")
+
+    N = 20
+    sender_email, receiver_email = "my@gmail.com", "your@gmail.com"
+    subject, body = "An email with attachment from Python", "This is an email with attachment sent from Python"
+
+    def naive_send(server, filename):
+        # the attachment example of 6_send_mail.py
+        message = MIMEMultipart()
+        message["From"] = sender_email
+        message["To"] = receiver_email
+        message["Subject"] = subject
+        message.attach(MIMEText(body, "plain"))
+        with open(filename, "rb") as attachment:
+            part = MIMEBase("application", "octet-stream")
+            part.set_payload(attachment.read())
+        encoders.encode_base64(part)
+        part.add_header("Content-Disposition", f"attachment; filename= {os.path.basename(filename)}")
+        message.attach(part)
+        server.sendmail(sender_email, receiver_email, message.as_string())
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "document.pdf")
+        with open(filename, "wb") as file:
+            file.write(os.urandom(10 * 1024 * 1024))
+        store = AttachmentStore(cache_dir=os.path.join(directory, "cache"))
+
+        def cached_send(server, filename):
+            send_chunks(server, sender_email, [receiver_email],
+                        message_chunks(sender_email, receiver_email, subject, body, [store.get(filename)]))
+
+        # the received attachment must be the same bytes as the file
+        with local_smtp_server.LocalSMTPServer() as sink, smtplib.SMTP(sink.host, sink.port) as server:
+            cached_send(server, filename)
+            received = email.message_from_bytes(sink.messages[0][2], policy=email.policy.default)
+            attachment = next(received.iter_attachments())
+            with open(filename, "rb") as file:
+                assert attachment.get_content() == file.read() and attachment.get_filename() == "document.pdf"
+
+            # non-ASCII subject, body and file name
+            report = os.path.join(directory, 'Bericht "März".txt')
+            with open(report, "wb") as file:
+                file.write(b"x" * 1000)
+            send_chunks(server, sender_email, [receiver_email],
+                        message_chunks(sender_email, receiver_email, "Grüße", "Schöne Grüße\n.", [store.get(report)]))
+            received = email.message_from_bytes(sink.messages[1][2], policy=email.policy.default)
+            assert received["Subject"] == "Grüße"
+            assert received.get_body().get_content().replace("\r\n", "\n") == "Schöne Grüße\n."
+            assert next(received.iter_attachments()).get_filename() == 'Bericht "März".txt'
+
+        # the server runs in another process, so tracemalloc only sees the sending side
+        with local_smtp_server.LocalSMTPServerProcess(keep_messages=False) as sink, \
+                smtplib.SMTP(sink.host, sink.port) as server:
+            for name, send in (("6_send_mail.py way", naive_send), ("AttachmentStore", cached_send)):
+                start = time.perf_counter()
+                for _ in range(N):
+                    send(server, filename)
+                per_send = (time.perf_counter() - start) / N
+
+                tracemalloc.start()
+                send(server, filename)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                print(f"{name:<20} {per_send * 1000:7.1f} ms/send  peak {peak / 1024:8.1f} KB/send")
+
+        print(f"10 MB attachment, {2 * N + 3} sends, base64-encoded {store.encoded} time(s)")
+        store.close()
@@ -0,0 +1,228 @@
+"""
+- How many copies of a message does server.sendmail(..., message.as_string()) make?
+  For a message with a 25 MB attachment (~34 MB after base64):
+
+    message.as_string()    -> the Generator writes the whole message into a StringIO
+                              and returns it as one str                      (1 copy)
+    sendmail()             -> encodes the str to bytes                        (2)
+                              converts every line end to CRLF                 (3)
+                              dot-stuffs: "." at line start becomes ".."      (4)
+                              and adds "\\r\\n.\\r\\n" at the end               (5)
+
+  So next to the message object itself, ~5x the message size is in memory at once.
+
+- Streaming instead
+  send_message_streaming() walks the message tree like the email Generator does
+  (headers, blank line, then the body or, for multipart, every part between the
+  boundaries) and writes it to the socket in pieces of `chunk_size` bytes. Line ends
+  are fixed and dots are stuffed piece by piece, so the extra memory is a few chunks
+  no matter how large the message is.
+
+- BDAT (RFC 3030, CHUNKING)
+  With DATA the server has to look for the "\\r\\n.\\r\\n" at the end, that's why we need
+  dot-stuffing. If the server advertises CHUNKING we can send instead:
+
+    BDAT 1048576          followed by exactly 1048576 bytes
+    BDAT 1048576
+    BDAT 23115 LAST
+
+  The server knows the length of every chunk, so there is nothing to escape.
+"""
+
+import importlib
+import random
+import re
+import smtplib
+from email.utils import getaddresses
+
+start_envelope = importlib.import_module("23_attachment_cache").start_envelope
+
+LINE_ENDS = re.compile(rb"\r\n|\r|\n")
+
+
+def iter_message(message, policy=None, top=True):
+    """The bytes of an email.message.Message as pieces, in the order the Generator writes them
+    (not yet CRLF-normalized). Top level Bcc headers are left out like smtplib.send_message."""
+    policy = policy or message.policy.clone(linesep="\r\n")
+    for name, value in message.raw_items():
+        if top and name.lower() in ("bcc", "resent-bcc"):
+            continue
+        yield policy.fold_binary(name, value)
+    yield b"\r\n"
+
+    if message.get_content_maintype() == "multipart":
+        boundary = message.get_boundary()
+        if boundary is None:
+            boundary = "===============%019d==" % random.randrange(10 ** 19)
+            message.set_boundary(boundary)
+        if message.preamble is not None:
+            yield message.preamble.encode("utf-8", "surrogateescape") + b"\r\n"
+        for index, part in enumerate(message.get_payload()):
+            yield (b"\r\n" if index else b"") + f"--{boundary}\r\n".encode("ascii")
+            yield from iter_message(part, policy, top=False)
+        yield f"\r\n--{boundary}--\r\n".encode("ascii")
+        if message.epilogue is not None:
+            yield message.epilogue.encode("utf-8", "surrogateescape")
+    elif message.is_multipart():  # message/rfc822: one message inside
+        for part in message.get_payload():
+            yield from iter_message(part, policy, top=False)
+    else:
+        # get_payload() would encode the whole payload once just to check it for surrogates,
+        # so we read _payload directly, like the email Generator does
+        payload = message._payload
+        if isinstance(payload, bytes):
+            yield payload
+        elif payload:
+            # the (already encoded) payload is usually one big str, encode it a slice at a time
+            for start in range(0, len(payload), 64 * 1024):
+                yield payload[start:start + 64 * 1024].encode("utf-8", "surrogateescape")
+
+
+class _DataWriter:
+    """Collects message pieces and sends them as DATA (CRLF + dot-stuffing) or as BDAT chunks."""
+
+    def __init__(self, server, chunk_size, bdat):
+        self.server = server
+        self.chunk_size = chunk_size
+        self.bdat = bdat
+        self.buffer = bytearray()
+        self.carry = b""  # a "\r" at the end of a piece, its "\n" may be in the next one
+        self.at_line_start = True
+
+    def write(self, data):
+        data = self.carry + data
+        self.carry = b""
+        if data.endswith(b"\r"):
+            data, self.carry = data[:-1], b"\r"
+        if not data:
+            return
+        data = LINE_ENDS.sub(b"\r\n", data)
+        if not self.bdat:
+            data = data.replace(b"\n.", b"\n..")
+            if self.at_line_start and data.startswith(b"."):
+                data = b"." + data
+        self.at_line_start = data.endswith(b"\n")
+        self.buffer += data
+        if len(self.buffer) >= self.chunk_size:
+            self.send_chunk()
+
+    def send_chunk(self, last=False):
+        if self.bdat:
+            self.server.send(f"BDAT {len(self.buffer)}{' LAST' if last else ''}\r\n".encode("ascii"))
+        self.server.send(bytes(self.buffer))
+        self.buffer.clear()
+        if self.bdat:
+            self.check_reply()
+
+    def check_reply(self):
+        code, response = self.server.getreply()
+        if code != 250:
+            if code == 421:
+                self.server.close()
+            else:
+                self.server.rset()
+            raise smtplib.SMTPDataError(code, response)
+
+    def close(self):
+        if self.carry:
+            self.write(b"\n")
+        if self.bdat:
+            self.send_chunk(last=True)
+            return
+        if not self.at_line_start:
+            self.buffer += b"\r\n"
+        self.buffer += b".\r\n"
+        self.send_chunk()
+        self.check_reply()
+
+
+def envelope_addresses(message, from_addr=None, to_addrs=None):
+    # the same rules as smtplib.SMTP.send_message
+    if from_addr is None:
+        from_addr = message["Sender"] or message["From"]
+        from_addr = getaddresses([from_addr])[0][1]
+    if to_addrs is None:
+        fields = [value for name in ("To", "Bcc", "Cc") for value in message.get_all(name, [])]
+        to_addrs = [address for _, address in getaddresses(fields)]
+    elif isinstance(to_addrs, str):
+        to_addrs = [to_addrs]
+    return from_addr, to_addrs
+
+
+def send_message_streaming(server, message, from_addr=None, to_addrs=None, chunk_size=1024 * 1024, use_bdat=None):
+    """Like smtplib.SMTP.send_message(), without building the message in memory.
+    Uses BDAT when the server supports it (use_bdat=None) and returns the refused recipients."""
+    from_addr, to_addrs = envelope_addresses(message, from_addr, to_addrs)
+    refused = start_envelope(server, from_addr, to_addrs)
+    if use_bdat is None:
+        use_bdat = server.has_extn("chunking")
+    if not use_bdat:
+        code, response = server.docmd("data")
+        if code != 354:
+            server.rset()
+            raise smtplib.SMTPDataError(code, response)
+    writer = _DataWriter(server, chunk_size, use_bdat)
+    for piece in iter_message(message):
+        writer.write(piece)
+    writer.close()
+    return refused
+
+
+if __name__ == "__main__":
+    import os
+    import time
+    import tracemalloc
+    from email import encoders
+    from email.mime.base import MIMEBase
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
+    local_smtp_server = importlib.import_module("19_local_smtp_server")
+
+    def attachment_message(size):
+        # the attachment example of 6_send_mail.py
+        message = MIMEMultipart()
+        message["From"] = "my@gmail.com"
+        message["To"] = "your@gmail.com"
+        message["Subject"] = "An email with attachment from Python"
+        message["Bcc"] = "your@gmail.com"
+        message.attach(MIMEText("This is an email with attachment sent from Python\n.\n..dots\n", "plain"))
+        part = MIMEBase("application", "octet-stream")
+        part.set_payload(os.urandom(size))
+        encoders.encode_base64(part)
+        part.add_header("Content-Disposition", "attachment; filename= document.pdf")
+        message.attach(part)
+        return message
+
+    # --------------------------
+    # the server must receive exactly what as_bytes() would give, with DATA and with BDAT
+    # --------------------------
+    message = attachment_message(300 * 1024)
+    del message["Bcc"]
+    expected = message.as_bytes(policy=message.policy.clone(linesep="\r\n"))
+    with local_smtp_server.LocalSMTPServer() as sink, smtplib.SMTP(sink.host, sink.port) as server:
+        send_message_streaming(server, message, use_bdat=False, chunk_size=4096)
+        send_message_streaming(server, message, use_bdat=True, chunk_size=4096)
+        assert [data for _, _, data in sink.messages] == [expected, expected]
+        print("DATA and BDAT deliver the same bytes as message.as_bytes()", dict(sink.stats))
+
+    # --------------------------
+    # 25 MB attachment: extra memory while sending (the server runs in another process)
+    # --------------------------
+    message = attachment_message(25 * 1024 * 1024)
+    with local_smtp_server.LocalSMTPServerProcess(keep_messages=False) as sink, \
+            smtplib.SMTP(sink.host, sink.port) as server:
+        ways = (
+            ("sendmail(as_string())", lambda: server.sendmail("my@gmail.com", ["your@gmail.com"], message.as_string())),
+            ("streaming DATA", lambda: send_message_streaming(server, message, use_bdat=False)),
+            ("streaming BDAT", lambda: send_message_streaming(server, message)),
+        )
+        for name, send in ways:
+            start = time.perf_counter()
+            send()
+            elapsed = time.perf_counter() - start
+            tracemalloc.start()
+            send()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{name:<22} {elapsed:6.2f}s  peak {peak / 2 ** 20:7.1f} MB")
@@ -0,0 +1,151 @@
+"""
+- Bcc "for mass emails"
+  The attachment example in 6_send_mail.py sets message["Bcc"] because one message can
+  go to many people: the envelope (RCPT TO) decides who gets it, not the To header.
+  But then it still calls sendmail() for one receiver. And sendmail() waits for the
+  answer to every command, so ONE envelope with 100 receivers costs:
+
+    MAIL FROM  -> wait                       1 round-trip
+    RCPT TO    -> wait   (100 times)       100 round-trips
+    DATA       -> wait                       1 round-trip
+    message .  -> wait                       1 round-trip
+
+- PIPELINING (RFC 2920)
+  If the server says PIPELINING in its EHLO answer, we may send MAIL FROM, all the
+  RCPT TOs and DATA in one go and read the answers afterwards:
+
+    MAIL FROM + 100x RCPT TO + DATA -> wait  1 round-trip
+    message .                       -> wait  1 round-trip
+
+  We still read every single answer, so we know for every receiver if it was
+  accepted (250) or refused (e.g. 550 No such user).
+
+- Batches
+  Servers only allow a limited number of RCPT TO per message (at least 100, RFC 5321),
+  so send_bulk() splits the receivers into envelopes of `max_recipients`.
+
+    statuses = send_bulk(server, "my@gmail.com", receivers, message, max_recipients=100)
+    statuses["your@gmail.com"]  -> (250, b"Message accepted") or (550, b"No such user")
+"""
+
+import importlib
+import re
+import smtplib
+
+dot_stuff = importlib.import_module("23_attachment_cache").dot_stuff
+
+LINE_ENDS = re.compile(rb"\r\n|\r|\n")
+
+
+def prepare_data(message):
+    """str/bytes message -> DATA bytes: CRLF line ends, dot-stuffed, ending with the "." line."""
+    if isinstance(message, str):
+        message = message.encode("utf-8")
+    data = dot_stuff(LINE_ENDS.sub(b"\r\n", message))
+    if not data.endswith(b"\r\n"):
+        data += b"\r\n"
+    return data + b".\r\n"
+
+
+def send_envelope(server, sender, recipients, data, pipelining=None):
+    """One message to several recipients. `data` comes from prepare_data().
+    Returns {recipient: (code, response)}, the final answer for every recipient."""
+    server.ehlo_or_helo_if_needed()
+    if pipelining is None:
+        pipelining = server.has_extn("pipelining")
+
+    if pipelining:
+        commands = [f"MAIL FROM:<{sender}>"] + [f"RCPT TO:<{recipient}>" for recipient in recipients] + ["DATA"]
+        server.send("\r\n".join(commands) + "\r\n")
+        mail_reply = server.getreply()
+        rcpt_replies = [server.getreply() for _ in recipients]
+        data_reply = server.getreply()
+    else:
+        mail_reply = server.mail(sender)
+        rcpt_replies = [server.rcpt(recipient) for recipient in recipients] if mail_reply[0] == 250 else []
+        accepted = any(code in (250, 251) for code, _ in rcpt_replies)
+        data_reply = server.docmd("data") if accepted else (503, b"No valid recipients")
+
+    if mail_reply[0] == 421 or data_reply[0] == 421:
+        server.close()
+        raise smtplib.SMTPServerDisconnected(f"server closed the connection: {mail_reply} {data_reply}")
+    if mail_reply[0] != 250:
+        if data_reply[0] == 354:
+            server.send(b".\r\n")  # the server wants a message anyway (RFC 2920), send an empty one
+            server.getreply()
+        server.rset()
+        return {recipient: mail_reply for recipient in recipients}
+
+    statuses = dict(zip(recipients, rcpt_replies))
+    accepted = [recipient for recipient, (code, _) in statuses.items() if code in (250, 251)]
+    if data_reply[0] != 354:
+        server.rset()
+        statuses.update((recipient, data_reply) for recipient in accepted)
+        return statuses
+    if not accepted:
+        server.send(b".\r\n")
+        server.getreply()
+        server.rset()
+        return statuses
+
+    server.send(data)
+    final_reply = server.getreply()
+    if final_reply[0] == 421:
+        server.close()
+    elif final_reply[0] != 250:
+        server.rset()
+    statuses.update((recipient, final_reply) for recipient in accepted)
+    return statuses
+
+
+def send_bulk(server, sender, recipients, message, max_recipients=100, pipelining=None):
+    """The same message to many recipients, `max_recipients` per envelope. Returns {recipient: (code, response)}."""
+    data = prepare_data(message)
+    statuses = {}
+    for start in range(0, len(recipients), max_recipients):
+        statuses.update(send_envelope(server, sender, recipients[start:start + max_recipients], data, pipelining))
+    return statuses
+
+
+if __name__ == "__main__":
+    import time
+    from collections import Counter
+
+    LocalSMTPServer = importlib.import_module("19_local_smtp_server").LocalSMTPServer
+
+    N = 1000
+    LATENCY = 0.002  # 2ms per round-trip, the same datacenter; across the internet it's 20-100ms
+    message = """\
+Subject: Hi there
+
+This message is sent from Python."""
+    receivers = [f"my+person{i}@gmail.com" if i % 100 else f"bounce{i}@gmail.com" for i in range(N)]
+
+    with LocalSMTPServer(latency=LATENCY, rcpt_errors={"bounce": (550, "No such user")}, keep_messages=False) as sink:
+        ways = (
+            ("sendmail(), 1 receiver per message", lambda server: [
+                server.sendmail("my@gmail.com", [receiver], message) for receiver in receivers if "bounce" not in receiver]),
+            ("sendmail(), 100 receivers per message", lambda server: [
+                server.sendmail("my@gmail.com", receivers[start:start + 100], message) for start in range(0, N, 100)]),
+            ("send_bulk() without PIPELINING", lambda server: send_bulk(
+                server, "my@gmail.com", receivers, message, pipelining=False)),
+            ("send_bulk() with PIPELINING", lambda server: send_bulk(server, "my@gmail.com", receivers, message)),
+        )
+        for name, send in ways:
+            with smtplib.SMTP(sink.host, sink.port) as server:
+                server.ehlo()
+                sink.stats.clear()
+                start = time.perf_counter()
+                result = send(server)
+                elapsed = time.perf_counter() - start
+                round_trips = sink.stats["round_trips"]
+            print(f"{name:<40} per {N} receivers: {round_trips:5d} round-trips, {elapsed:6.2f}s")
+
+        # every receiver gets its own answer
+        print("statuses:", Counter(code for code, _ in result.values()))
+
+        # more receivers per envelope than the server allows -> 452 for the rest, reported per receiver
+        sink.options["max_recipients"] = 50
+        with smtplib.SMTP(sink.host, sink.port) as server:
+            statuses = send_bulk(server, "my@gmail.com", receivers[:200], message, max_recipients=100)
+        print("server limit 50, batches of 100:", Counter(code for code, _ in statuses.values()))
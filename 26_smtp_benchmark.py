@@ -0,0 +1,312 @@
+"""
+- Measuring the send paths of 6_send_mail.py without a Gmail account
+  Every example in 6_send_mail.py talks to smtp.gmail.com and asks for a password,
+  so we can't measure them, and we can't notice when a change makes them slower.
+  This benchmark runs them against the local server of 19_local_smtp_server.py with:
+
+    TLS          - a self-signed certificate (made with the openssl command line tool),
+                   port 465 style (SMTP_SSL) and port 587 style (STARTTLS)
+    --latency    - seconds per round-trip, like a server far away
+    --error-rate - this fraction of messages gets "451 try again later"
+
+- Scenarios (the examples of 6_send_mail.py, and the faster ways from the later files)
+    plain_ssl           SMTP_SSL + login + sendmail, a new connection per message
+    plain_starttls      SMTP + starttls() + login + sendmail, a new connection per message
+    html                the MIMEMultipart("alternative") example
+    attachment          the MIMEBase + encode_base64 attachment example
+    yagmail             what yagmail does: text + html + attachment, and ONE connection
+                        that stays open between sends (yagmail.SMTP keeps it)
+    plain_pooled        plain, through the connection pool of 20_bulk_smtp.py
+    attachment_pooled   attachment, through the connection pool of 20_bulk_smtp.py
+
+- Every scenario runs in its own process, so CPU time and peak memory (RSS) belong to
+  that scenario only. The report is JSON:
+
+    python 26_smtp_benchmark.py --output today.json
+    python 26_smtp_benchmark.py --baseline today.json    -> exit code 1 if a scenario got
+                                                            slower than --tolerance
+"""
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import resource
+import smtplib
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from email import encoders
+from email.mime.application import MIMEApplication
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+LatencyHistogram = importlib.import_module("34_latency_histogram").LatencyHistogram
+
+SENDER = "my@gmail.com"
+PASSWORD = "any password"
+TEXT = """\
+Hi,
+How are you?
+www.github.com"""
+HTML = """\
+<html>
+  <body>
+    <p>Hi,<br>
+       How are you?<br>
+       <a href="http://www.github.com">GitHub</a>
+       has many great tutorials.
+    </p>
+  </body>
+</html>
+"""
+
+
+# --------------------------
+# the messages of 6_send_mail.py
+# --------------------------
+def plain_message(receiver, attachment):
+    return """\
+Subject: Hi there
+
+This message is sent from Python."""
+
+
+def html_message(receiver, attachment):
+    message = MIMEMultipart("alternative")
+    message["Subject"] = "multipart test"
+    message["From"] = SENDER
+    message["To"] = receiver
+    message.attach(MIMEText(TEXT, "plain"))
+    message.attach(MIMEText(HTML, "html"))
+    return message.as_string()
+
+
+def attachment_message(receiver, attachment):
+    message = MIMEMultipart()
+    message["From"] = SENDER
+    message["To"] = receiver
+    message["Subject"] = "An email with attachment from Python"
+    message["Bcc"] = receiver
+    message.attach(MIMEText("This is an email with attachment sent from Python", "plain"))
+    with open(attachment, "rb") as file:
+        part = MIMEBase("application", "octet-stream")
+        part.set_payload(file.read())
+    encoders.encode_base64(part)
+    part.add_header("Content-Disposition", f"attachment; filename= {os.path.basename(attachment)}")
+    message.attach(part)
+    return message.as_string()
+
+
+def yagmail_message(receiver, attachment):
+    # the structure yagmail builds: mixed( alternative(text, html), attachment )
+    message = MIMEMultipart("mixed")
+    message["Subject"] = "Yagmail test with attachment"
+    message["From"] = SENDER
+    message["To"] = receiver
+    alternative = MIMEMultipart("alternative")
+    alternative.attach(MIMEText("Hello there from Yagmail", "plain"))
+    alternative.attach(MIMEText("<p>Hello there from Yagmail</p>", "html"))
+    message.attach(alternative)
+    with open(attachment, "rb") as file:
+        part = MIMEApplication(file.read(), Name=os.path.basename(attachment))
+    part["Content-Disposition"] = f'attachment; filename="{os.path.basename(attachment)}"'
+    message.attach(part)
+    return message.as_string()
+
+
+# --------------------------
+# the ways to send them
+# --------------------------
+def connect(transport, ports, context):
+    if transport == "ssl":
+        server = smtplib.SMTP_SSL("localhost", ports["ssl"], context=context)
+    else:
+        server = smtplib.SMTP("localhost", ports["starttls"])
+        server.ehlo()
+        server.starttls(context=context)
+        server.ehlo()
+    server.login(SENDER, PASSWORD)
+    return server
+
+
+def send_per_message(config, build, context, record):
+    # 6_send_mail.py: everything from scratch for every message
+    for receiver in config["receivers"]:
+        start = time.perf_counter()
+        try:
+            with connect(config["transport"], config["ports"], context) as server:
+                server.sendmail(SENDER, receiver, build(receiver, config["attachment"]))
+            record(time.perf_counter() - start, None)
+        except smtplib.SMTPException as err:
+            record(time.perf_counter() - start, err)
+
+
+def send_one_connection(config, build, context, record):
+    # yagmail.SMTP: one connection, reused for every send()
+    server = connect(config["transport"], config["ports"], context)
+    try:
+        for receiver in config["receivers"]:
+            start = time.perf_counter()
+            try:
+                server.sendmail(SENDER, [receiver], build(receiver, config["attachment"]))
+                record(time.perf_counter() - start, None)
+            except smtplib.SMTPException as err:
+                record(time.perf_counter() - start, err)
+    finally:
+        server.quit()
+
+
+def send_pooled(config, build, context, record):
+    bulk_smtp = importlib.import_module("20_bulk_smtp")
+    workers = config["workers"]
+    pool = bulk_smtp.SMTPConnectionPool("localhost", config["ports"]["ssl"], SENDER, PASSWORD, ssl=True,
+                                        context=context, size=workers)
+
+    def send(receiver):
+        start = time.perf_counter()
+        result = mailer.send(bulk_smtp.Mail(SENDER, [receiver], build(receiver, config["attachment"])))
+        record(time.perf_counter() - start, result.error)
+
+    with bulk_smtp.BulkMailer(pool, workers=workers) as mailer, ThreadPoolExecutor(workers) as executor:
+        list(executor.map(send, config["receivers"]))
+
+
+SCENARIOS = {
+    # name: (message, transport, send path)
+    "plain_ssl": (plain_message, "ssl", send_per_message),
+    "plain_starttls": (plain_message, "starttls", send_per_message),
+    "html": (html_message, "ssl", send_per_message),
+    "attachment": (attachment_message, "ssl", send_per_message),
+    "yagmail": (yagmail_message, "ssl", send_one_connection),
+    "plain_pooled": (plain_message, "ssl", send_pooled),
+    "attachment_pooled": (attachment_message, "ssl", send_pooled),
+}
+
+
+def run_scenario(config):
+    """Runs in the child process, returns the result dict of one scenario."""
+    build, transport, send = SCENARIOS[config["scenario"]]
+    config = dict(config, transport=transport,
+                  receivers=[f"my+person{i}@gmail.com" for i in range(config["messages"])])
+    context = ssl.create_default_context(cafile=config["cafile"])
+    histogram = LatencyHistogram()
+    errors = Counter()
+
+    def record(seconds, error):
+        histogram.record(seconds)
+        if error is not None:
+            errors[getattr(error, "smtp_code", None) or type(error).__name__] += 1
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    send(config, build, context, record)
+    elapsed = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (after.ru_utime - usage.ru_utime) + (after.ru_stime - usage.ru_stime)
+    latency = histogram.snapshot()
+    return {
+        "scenario": config["scenario"],
+        "transport": transport,
+        "path": send.__name__,
+        "messages": config["messages"],
+        "errors": {str(code): count for code, count in errors.items()},
+        "seconds": round(elapsed, 3),
+        "msgs_per_s": round(config["messages"] / elapsed, 1),
+        "latency_ms": {key[:-3]: value for key, value in latency.items() if key.endswith("_ms")},
+        "cpu_s": round(cpu, 3),
+        "cpu_ms_per_msg": round(cpu / config["messages"] * 1000, 3),
+        "max_rss_mb": round(after.ru_maxrss / 1024, 1),  # ru_maxrss is in KB on Linux
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Scenarios that got slower than the baseline by more than `tolerance` (0.2 = 20%)."""
+    before = {result["scenario"]: result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = before.get(result["scenario"])
+        if old is None:
+            continue
+        if result["msgs_per_s"] < old["msgs_per_s"] * (1 - tolerance):
+            regressions.append(f"{result['scenario']}: {old['msgs_per_s']} -> {result['msgs_per_s']} msgs/s")
+        if result["latency_ms"].get("p99", 0) > old["latency_ms"].get("p99", 0) * (1 + tolerance):
+            regressions.append(f"{result['scenario']}: p99 {old['latency_ms']['p99']} -> {result['latency_ms']['p99']} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip("- \n"))
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=4, help="threads of the pooled scenarios")
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds per round-trip")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--attachment-kb", type=int, default=1024)
+    parser.add_argument("--output", help="write the JSON report to this file (default: stdout)")
+    parser.add_argument("--baseline", help="JSON report to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.messages < 1:
+        parser.error("--messages must be at least 1")
+
+    if args.child:
+        print(json.dumps(run_scenario(json.loads(args.child))))
+        return 0
+
+    local_smtp_server = importlib.import_module("19_local_smtp_server")
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = local_smtp_server.make_certificate(directory)
+        attachment = os.path.join(directory, "document.pdf")
+        with open(attachment, "wb") as file:
+            file.write(os.urandom(args.attachment_kb * 1024))
+
+        sink_options = {"latency": args.latency, "error_rate": args.error_rate, "tls": (certfile, keyfile),
+                        "keep_messages": False}
+        with local_smtp_server.LocalSMTPServerProcess(implicit_tls=True, **sink_options) as ssl_sink, \
+                local_smtp_server.LocalSMTPServerProcess(**sink_options) as starttls_sink:
+            results = []
+            for scenario in args.scenarios:
+                config = {"scenario": scenario, "messages": args.messages, "workers": args.workers,
+                          "ports": {"ssl": ssl_sink.port, "starttls": starttls_sink.port},
+                          "cafile": certfile, "attachment": attachment}
+                child = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", json.dumps(config)],
+                                       capture_output=True, text=True, check=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__)))
+                result = json.loads(child.stdout)
+                results.append(result)
+                print(f"{scenario:<18} {result['msgs_per_s']:8.1f} msgs/s  p99 {result['latency_ms']['p99']:8.2f} ms  "
+                      f"cpu {result['cpu_ms_per_msg']:6.2f} ms/msg  rss {result['max_rss_mb']:6.1f} MB  "
+                      f"errors {result['errors']}", file=sys.stderr)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "child")},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION", regression, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
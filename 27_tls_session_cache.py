@@ -0,0 +1,254 @@
+"""
+- What does every TLS connection of 6_send_mail.py and 3_request.py cost?
+
+    context = ssl.create_default_context()   -> reads and parses the whole system CA bundle
+                                                (~150 certificates), for EVERY send
+    smtplib.SMTP_SSL(..., context=context)   -> a full TLS handshake: the server signs with
+                                                its private key, we verify its certificate
+                                                chain against those CAs
+    requests.get("https://...")              -> the same again: requests tells urllib3 to load
+                                                its CA bundle (certifi, or verify="ca.pem") into
+                                                the context for every new connection
+
+  We talk to the same few servers all the time, so most of that work is repeated.
+
+- Two fixes
+    1. One SSLContext per configuration (CA file, client certificate, TLS versions):
+       get_context() below is cached, the CA bundle is loaded once per process.
+    2. Session resumption: after a full handshake the server gives us a session ticket
+       (TLS 1.3, or a session ID in TLS 1.2). Sending it back on the next connection to
+       the same host skips the certificate exchange, the signature and the chain check.
+       TLS 1.2 resumption also saves one round-trip; in TLS 1.3 both handshakes take
+       one round-trip, there it is only CPU.
+
+  Against our local servers almost all of the time goes into loading CA bundles
+  (~30 ms per connection); resumption takes another 15-35% off a connect, mostly
+  because the server doesn't have to sign anything.
+
+  A session only works with the SSLContext that created it, so ResumingSSLContext keeps
+  the sessions itself, one per (host name, port), and counts how many handshakes were
+  full and how many were resumed.
+
+- Usage
+    context = get_context()                                  # or get_context(cafile=...)
+    with smtplib.SMTP_SSL("smtp.gmail.com", 465, context=context) as server: ...
+    context.stats                                            # Counter({"full": 1, "resumed": 9})
+
+    session.mount("https://", TLSAdapter(ssl_context=context))  # the same for requests
+"""
+
+import functools
+import importlib
+import os
+import ssl
+import threading
+from collections import Counter
+
+PooledAdapter = importlib.import_module("9_session_client").PooledAdapter
+
+
+def _peer_port(sock):
+    try:
+        return sock.getpeername()[1]
+    except OSError:  # not connected (yet), nothing to resume
+        return None
+
+
+class _ResumingSSLSocket(ssl.SSLSocket):
+    session_key = None  # (server_hostname, port), set after the handshake
+
+    def do_handshake(self, block=False):
+        super().do_handshake(block)
+        port = _peer_port(self)
+        if not self.server_side and self.server_hostname and port is not None:
+            self.session_key = (self.server_hostname, port)
+        self.context.record_handshake(self)
+
+    def unwrap(self):
+        self.context.save_session(self)
+        return super().unwrap()
+
+    def close(self):
+        # TLS 1.3 tickets arrive after the handshake, so we take the session at the end
+        self.context.save_session(self)
+        super().close()
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """SSLContext that resumes TLS sessions to hosts it has talked to before."""
+
+    sslsocket_class = _ResumingSSLSocket
+
+    def __init__(self, protocol=ssl.PROTOCOL_TLS_CLIENT, resume=True):
+        self.resume = resume
+        self.sessions = {}  # (server_hostname, port) -> ssl.SSLSession
+        self.stats = Counter()  # full / resumed handshakes
+        self.lock = threading.Lock()
+
+    def wrap_socket(self, sock, server_side=False, do_handshake_on_connect=True, suppress_ragged_eofs=True,
+                    server_hostname=None, session=None):
+        if session is None and self.resume and not server_side and server_hostname:
+            with self.lock:
+                session = self.sessions.get((server_hostname, _peer_port(sock)))
+        return super().wrap_socket(sock, server_side, do_handshake_on_connect, suppress_ragged_eofs,
+                                   server_hostname, session)
+
+    def record_handshake(self, sock):
+        with self.lock:
+            self.stats["resumed" if sock.session_reused else "full"] += 1
+
+    def save_session(self, sock):
+        if sock.session_key is None or not self.resume:
+            return
+        session = sock.session  # None when the connection is already gone
+        if session is not None and (session.has_ticket or session.id):
+            with self.lock:
+                self.sessions[sock.session_key] = session
+
+    def forget(self, host=None):
+        with self.lock:
+            for key in [key for key in self.sessions if host is None or key[0] == host]:
+                del self.sessions[key]
+
+
+@functools.lru_cache(maxsize=None)
+def get_context(cafile=None, capath=None, certfile=None, keyfile=None,
+                minimum_version=None, maximum_version=None, resume=True):
+    """The shared client context for this configuration, created once per process.
+    Like ssl.create_default_context(): hostname check and certificate verification are on."""
+    context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT, resume=resume)
+    if cafile or capath:
+        context.load_verify_locations(cafile, capath)
+    else:
+        context.load_default_certs()
+    if certfile:
+        context.load_cert_chain(certfile, keyfile)
+    if minimum_version is not None:
+        context.minimum_version = minimum_version
+    if maximum_version is not None:
+        context.maximum_version = maximum_version
+    return context
+
+
+class TLSAdapter(PooledAdapter):
+    """PooledAdapter whose HTTPS connections all use one (resuming) SSLContext.
+    Its CA certificates are loaded once, when the context is created.
+
+    ssl_context is used for verify=True. verify="ca.pem" (also from REQUESTS_CA_BUNDLE) and
+    cert=... get the get_context() context for that CA path and client certificate, so a
+    request never changes who another request trusts or which certificate it shows."""
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, max_retries=0, pool_block=False, ssl_context=None):
+        self.ssl_context = ssl_context or get_context()
+        super().__init__(pool_connections, pool_maxsize, max_retries, pool_block)
+
+    def context_for(self, verify, cert):
+        if verify is True and not cert:
+            return self.ssl_context
+        options = {}  # only what is set, get_context(cafile=x) is cached apart from get_context(x, None, ...)
+        if isinstance(verify, str):
+            options["capath" if os.path.isdir(verify) else "cafile"] = verify
+        if cert:
+            certfile, keyfile = (cert, None) if isinstance(cert, str) else cert
+            options["certfile"] = certfile
+            if keyfile:
+                options["keyfile"] = keyfile
+        if not getattr(self.ssl_context, "resume", True):
+            options["resume"] = False
+        return get_context(**options)
+
+    def build_connection_pool_key_attributes(self, request, verify, cert=None):
+        host_params, pool_kwargs = super().build_connection_pool_key_attributes(request, verify, cert)
+        if host_params["scheme"] == "https" and verify is not False:
+            for name in ("ca_certs", "ca_cert_dir", "cert_file", "key_file"):
+                pool_kwargs.pop(name, None)
+            pool_kwargs["ssl_context"] = self.context_for(verify, cert)
+        return host_params, pool_kwargs
+
+    def cert_verify(self, conn, url, verify, cert):
+        super().cert_verify(conn, url, verify, cert)
+        if url.lower().startswith("https") and verify:
+            # otherwise urllib3 loads the CA bundle (and the client certificate) into the shared
+            # context for every connection; the context of context_for() already has them
+            conn.ca_certs = conn.ca_cert_dir = None
+            conn.cert_file = conn.key_file = None
+
+
+if __name__ == "__main__":
+    import resource
+    import smtplib
+    import tempfile
+    import time
+
+    import certifi
+    import requests
+
+    local_smtp_server = importlib.import_module("19_local_smtp_server")
+    LocalServer = importlib.import_module("7_local_http_server").LocalServer
+
+    N = 200
+
+    def cpu_time():
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+
+    def measure(name, connect, context=None):
+        connect()  # warm-up, and the first (full) handshake that gives us a session
+        if context is not None:
+            context.stats.clear()
+        start, cpu = time.perf_counter(), cpu_time()
+        for _ in range(N):
+            connect()
+        elapsed, cpu = time.perf_counter() - start, cpu_time() - cpu
+        handshakes = dict(context.stats) if context is not None else "-"
+        print(f"{name:<44} {elapsed / N * 1000:6.2f} ms/connect  cpu {cpu / N * 1000:6.2f} ms  {handshakes}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = local_smtp_server.make_certificate(directory)
+        # what requests trusts by default (certifi) plus our self-signed certificate
+        bundle = os.path.join(directory, "bundle.pem")
+        with open(bundle, "w") as file, open(certifi.where()) as cas, open(certfile) as ours:
+            file.write(cas.read() + ours.read())
+
+        def default_context():
+            # what 6_send_mail.py does; our self-signed certificate has to be trusted on top
+            context = ssl.create_default_context()
+            context.load_verify_locations(certfile)
+            return context
+
+        # --------------------------
+        # SMTP_SSL: connect, EHLO, QUIT (the server runs in another process, cpu is ours only)
+        # --------------------------
+        with local_smtp_server.LocalSMTPServerProcess(tls=(certfile, keyfile), implicit_tls=True) as sink:
+            def smtp_connect(make_context):
+                def connect():
+                    with smtplib.SMTP_SSL("localhost", sink.port, context=make_context()) as server:
+                        server.ehlo()
+                return connect
+
+            print(f"SMTP_SSL, {N} connections")
+            measure("create_default_context() per connection", smtp_connect(default_context))
+            for version in (ssl.TLSVersion.TLSv1_3, ssl.TLSVersion.TLSv1_2):
+                cached = get_context(cafile=bundle, maximum_version=version, resume=False)
+                measure(f"{version.name}: cached context", smtp_connect(lambda: cached), cached)
+                resuming = get_context(cafile=bundle, maximum_version=version)
+                measure(f"{version.name}: cached context + resumption", smtp_connect(lambda: resuming), resuming)
+
+        # --------------------------
+        # HTTPS with requests, "Connection: close" forces a new connection for every request
+        # --------------------------
+        with LocalServer(tls=(certfile, keyfile)) as server:
+            url = server.url + "/get"
+            headers = {"Connection": "close"}
+
+            print(f"HTTPS GET, {N} connections")
+            measure("requests.get()", lambda: requests.get(url, headers=headers, verify=bundle))
+            with requests.Session() as session:
+                measure("Session()", lambda: session.get(url, headers=headers, verify=bundle))
+            for resume in (False, True):
+                context = get_context(cafile=bundle) if resume else get_context(cafile=bundle, resume=False)
+                with requests.Session() as session:
+                    session.mount("https://", TLSAdapter(ssl_context=context))
+                    # verify=bundle -> get_context(cafile=bundle), the same context
+                    measure(f"TLSAdapter, cached context{' + resumption' if resume else ''}",
+                            lambda: session.get(url, headers=headers, verify=bundle), context)
@@ -0,0 +1,305 @@
+"""
+- Measuring our HTTP clients the same way every time
+  3_request.py shows the requests we make: GET with params, POST form and JSON, a file
+  upload and calls with Basic auth or a Bearer token. This harness sends a mix of those
+  request shapes to a base URL (by default the local stub of 7_local_http_server.py)
+  with three clients:
+
+    sync    requests.get()/post() for every request, like 3_request.py:
+            a new Session and a new connection each time
+    pooled  one shared requests.Session with a connection pool (9_session_client.py),
+            called from --concurrency threads
+    async   AsyncHTTPClient (10_async_requests.py), --concurrency requests in flight,
+            all in one thread
+
+- Two ways to put load on the server
+    --concurrency N   closed loop: N workers, each sends the next request as soon as
+                      the last one is answered. Shows how much a client can do.
+    --rps R           open loop: request i is due at start + i/R, no matter how slow
+                      the server is. The latency counts from that due time, so a slow
+                      server also shows up as waiting time ("coordinated omission": a
+                      closed loop quietly sends less when the server is slow, and its
+                      percentiles look better than what users see).
+
+- Every mode runs in its own process, so the CPU time is the client's only.
+  The report is JSON, like 26_smtp_benchmark.py:
+
+    python 28_http_benchmark.py --output today.json
+    python 28_http_benchmark.py --baseline today.json        -> exit code 1 on a regression
+    python 28_http_benchmark.py --base-url https://httpbin.org --requests 50 --concurrency 5
+
+  The paths are httpbin's (/get, /post), only "upload" goes to /upload, set
+  --upload-path /post for httpbin.
+"""
+
+import argparse
+import asyncio
+import importlib
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+LatencyHistogram = importlib.import_module("34_latency_histogram").LatencyHistogram
+
+MODES = ("sync", "pooled", "async")
+UPLOAD = os.urandom(64 * 1024)
+TOKEN = "YOUR_ACCESS_TOKEN"
+
+
+# --------------------------
+# the request shapes of 3_request.py: name -> (method, path, request arguments)
+# --------------------------
+def shapes(upload_path):
+    return {
+        "get_params": ("GET", "/get", {"params": {"key1": "value1", "key2": "value2"}}),
+        "post_form": ("POST", "/post", {"data": {"name": "John Doe", "email": "john.doe@example.com"}}),
+        "post_json": ("POST", "/post", {"json": {"key": "value", "items": [1, 2, 3]}}),
+        "upload": ("POST", upload_path, {"files": {"file": ("file.txt", UPLOAD, "text/plain")}}),
+        "basic_auth": ("GET", "/get", {"auth": ("username", "password")}),
+        "bearer": ("GET", "/get", {"headers": {"Authorization": f"Bearer {TOKEN}"}}),
+    }
+
+
+def plan(config):
+    """The list of (shape, method, url, arguments) to send, the same for every mode."""
+    table = shapes(config["upload_path"])
+    requests_plan = []
+    for shape in itertools.islice(itertools.cycle(config["shapes"]), config["requests"]):
+        method, path, arguments = table[shape]
+        if config["delay"]:
+            arguments = dict(arguments, params={**arguments.get("params", {}), "delay": config["delay"]})
+        requests_plan.append((shape, method, config["base_url"] + path, arguments))
+    return requests_plan
+
+
+class Recorder:
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self.per_shape = {}  # shape -> LatencyHistogram
+        self.errors = Counter()  # status code or exception name -> count
+        self.lock = threading.Lock()
+
+    def record(self, shape, seconds, status=None, error=None):
+        with self.lock:
+            self.histogram.record(seconds)
+            if shape not in self.per_shape:
+                self.per_shape[shape] = LatencyHistogram()
+            self.per_shape[shape].record(seconds)
+            if error is not None:
+                self.errors[type(error).__name__] += 1
+            elif status >= 400:
+                self.errors[str(status)] += 1
+
+
+def due_times(config, start):
+    """When request i should start: right away (closed loop) or at start + i/rps (open loop)."""
+    if config["rps"]:
+        return [start + i / config["rps"] for i in range(config["requests"])]
+    return None
+
+
+# --------------------------
+# the three clients
+# --------------------------
+def run_threads(config, requests_plan, recorder, send):
+    start = time.perf_counter()
+    due = due_times(config, start)
+    counter = itertools.count()
+
+    def worker():
+        while (i := next(counter)) < len(requests_plan):
+            shape, method, url, arguments = requests_plan[i]
+            begin = time.perf_counter()
+            if due is not None:
+                if due[i] > begin:
+                    time.sleep(due[i] - begin)
+                begin = due[i]
+            try:
+                status = send(method, url, arguments)
+                recorder.record(shape, time.perf_counter() - begin, status)
+            except Exception as err:  # RequestException, but also whatever leaks out of urllib3
+                recorder.record(shape, time.perf_counter() - begin, error=err)
+
+    with ThreadPoolExecutor(config["concurrency"]) as executor:
+        for future in [executor.submit(worker) for _ in range(config["concurrency"])]:
+            future.result()
+
+
+def run_sync(config, requests_plan, recorder):
+    def send(method, url, arguments):
+        return requests.request(method, url, timeout=config["timeout"], **arguments).status_code
+    run_threads(config, requests_plan, recorder, send)
+
+
+def run_pooled(config, requests_plan, recorder):
+    HTTPClient = importlib.import_module("9_session_client").HTTPClient
+    with HTTPClient(pool_maxsize=config["concurrency"], timeout=config["timeout"]) as client:
+        run_threads(config, requests_plan, recorder,
+                    lambda method, url, arguments: client.request(method, url, **arguments).status_code)
+
+
+def run_async(config, requests_plan, recorder):
+    async_requests = importlib.import_module("10_async_requests")
+
+    async def main():
+        async with async_requests.AsyncHTTPClient(max_concurrency=config["concurrency"],
+                                                  timeout=config["timeout"]) as client:
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            due = due_times(config, start)
+            counter = itertools.count()
+
+            async def worker():
+                while (i := next(counter)) < len(requests_plan):
+                    shape, method, url, arguments = requests_plan[i]
+                    begin = loop.time()
+                    if due is not None:
+                        if due[i] > begin:
+                            await asyncio.sleep(due[i] - begin)
+                        begin = due[i]
+                    try:
+                        response = await client.request(method, url, **arguments)
+                        recorder.record(shape, loop.time() - begin, response.status_code)
+                    except Exception as err:  # anything the client raises is a failed request, as in run_threads
+                        recorder.record(shape, loop.time() - begin, error=err)
+
+            await asyncio.gather(*(worker() for _ in range(config["concurrency"])))
+
+    asyncio.run(main())
+
+
+RUNNERS = {"sync": run_sync, "pooled": run_pooled, "async": run_async}
+
+
+def run_mode(config):
+    """Runs in the child process, returns the result dict of one mode."""
+    requests_plan = plan(config)
+    recorder = Recorder()
+    runner = RUNNERS[config["mode"]]
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    runner(config, requests_plan, recorder)
+    elapsed = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (after.ru_utime - usage.ru_utime) + (after.ru_stime - usage.ru_stime)
+
+    def percentiles(histogram):
+        # the same keys for every result, None without requests (every one failed before it was timed)
+        snapshot = histogram.snapshot()
+        return {key: snapshot.get(key + "_ms") for key in ("min", "mean", "p50", "p95", "p99", "max")}
+
+    count = len(requests_plan)
+    return {
+        "mode": config["mode"],
+        "requests": count,
+        "errors": dict(recorder.errors),
+        "error_rate": round(sum(recorder.errors.values()) / count, 4),
+        "seconds": round(elapsed, 3),
+        "rps": round(count / elapsed, 1),
+        "latency_ms": percentiles(recorder.histogram),
+        "shapes": {shape: percentiles(histogram) for shape, histogram in sorted(recorder.per_shape.items())},
+        "cpu_s": round(cpu, 3),
+        "cpu_ms_per_request": round(cpu / count * 1000, 3),
+        "max_rss_mb": round(after.ru_maxrss / 1024, 1),  # ru_maxrss is in KB on Linux
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Modes that got slower than the baseline by more than `tolerance` (0.2 = 20%)."""
+    before = {result["mode"]: result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = before.get(result["mode"])
+        if old is None:
+            continue
+        if result["rps"] < old["rps"] * (1 - tolerance):
+            regressions.append(f"{result['mode']}: {old['rps']} -> {result['rps']} requests/s")
+        p99, old_p99 = result["latency_ms"].get("p99"), old["latency_ms"].get("p99")
+        if p99 is not None and old_p99 is not None and p99 > old_p99 * (1 + tolerance):
+            regressions.append(f"{result['mode']}: p99 {old_p99} -> {p99} ms")
+        if result["error_rate"] > old["error_rate"] + 0.01:
+            regressions.append(f"{result['mode']}: error rate {old['error_rate']} -> {result['error_rate']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip("- \n"))
+    parser.add_argument("--base-url", help="server to test (default: a local 7_local_http_server.py stub)")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--shapes", nargs="+", choices=sorted(shapes("/upload")), default=list(shapes("/upload")))
+    parser.add_argument("--requests", type=int, default=1000, help="requests per mode")
+    parser.add_argument("--concurrency", type=int, default=8, help="threads, or requests in flight for async")
+    parser.add_argument("--rps", type=float, default=0, help="open loop at this rate (default: closed loop)")
+    parser.add_argument("--delay", type=float, default=0, help="?delay= seconds for the local stub")
+    parser.add_argument("--upload-path", default="/upload")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--output", help="write the JSON report to this file (default: stdout)")
+    parser.add_argument("--baseline", help="JSON report to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.requests < 1 or args.concurrency < 1:
+        parser.error("--requests and --concurrency must be at least 1")
+
+    if args.child:
+        print(json.dumps(run_mode(json.loads(args.child))))
+        return 0
+
+    server = None
+    if args.base_url is None:
+        server = importlib.import_module("7_local_http_server").LocalServer().start()
+    base_url = (args.base_url or server.url).rstrip("/")
+    results = []
+    try:
+        for mode in args.modes:
+            config = {"mode": mode, "base_url": base_url, "shapes": args.shapes, "requests": args.requests,
+                      "concurrency": args.concurrency, "rps": args.rps, "delay": args.delay,
+                      "upload_path": args.upload_path, "timeout": args.timeout}
+            child = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", json.dumps(config)],
+                                   capture_output=True, text=True, check=True,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)))
+            result = json.loads(child.stdout)
+            results.append(result)
+            p50, p99 = (f"{value:7.2f}" if value is not None else f"{'-':>7}"
+                        for value in (result["latency_ms"]["p50"], result["latency_ms"]["p99"]))
+            print(f"{mode:<7} {result['rps']:8.1f} req/s  p50 {p50} ms  p99 {p99} ms  "
+                  f"cpu {result['cpu_ms_per_request']:5.2f} ms/req  errors {result['error_rate']:.1%}", file=sys.stderr)
+    finally:
+        if server is not None:
+            server.stop()
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "child")},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION", regression, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
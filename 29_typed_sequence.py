@@ -0,0 +1,162 @@
+"""
+- What does MySeq (1_sequence_type.py) cost for numbers?
+  MySeq keeps its elements in a list. A list stores a pointer (8 bytes) per item and
+  every item is a full Python object somewhere else: a float is 24 bytes, an int 28+.
+  So 10 million floats are ~320 MB, and
+
+    >>> seq[1000:2000000]       # copies ~2 million pointers into a new list
+
+- TypedSeq: the same sequence, but the numbers are stored "unboxed"
+  array.array("d", ...) keeps raw C doubles next to each other: 8 bytes per float,
+  nothing else. Items become Python objects only when we read them.
+
+    typecode   C type            bytes     typecode   C type            bytes
+    "b"/"B"    signed/unsigned   1         "l"/"L"    long              8
+    "h"/"H"    short             2         "q"/"Q"    long long         8
+    "i"/"I"    int               4         "f"/"d"    float/double      4/8
+
+- Slices are views
+  A memoryview looks at the memory of another object without copying it, and slicing
+  a memoryview gives another view (also with a step: view[::2]). So
+
+    >>> big = TypedSeq(range(10_000_000), "q")
+    >>> part = big[1000:2_000_000]   # O(1), shares the memory of big
+    >>> numpy.asarray(part)          # O(1) too: numpy wraps the same memory
+
+  TypedSeq is immutable like MySeq, so the views are read-only and the memory can't
+  change under a view (and an array.array can't be resized while views exist anyway).
+
+- The buffer protocol
+  numpy.asarray(seq) calls seq.__array__(), which wraps our memoryview. From Python 3.12
+  on __buffer__ (PEP 688) makes memoryview(seq), bytes(seq) etc. work without a copy too.
+  TypedSeq.frombuffer(data, "d") goes the other way: a bytearray, mmap or numpy array
+  becomes a TypedSeq without copying.
+"""
+
+import array
+import importlib
+
+MySeq = importlib.import_module("1_sequence_type").MySeq
+
+
+class TypedSeq(MySeq):
+    __slots__ = ("typecode", "storage", "view")
+
+    def __init__(self, elements=(), typecode="d"):
+        storage = array.array(typecode, elements)
+        self._attach(storage, memoryview(storage))
+
+    def _attach(self, storage, view):
+        self.storage = storage  # the object that owns the memory (array, bytearray, mmap, ...)
+        self.view = view.toreadonly()
+        self.typecode = view.format
+
+    @classmethod
+    def frombuffer(cls, buffer, typecode="d"):
+        """A TypedSeq over any buffer (bytearray, mmap, numpy array...) without copying it."""
+        view = memoryview(buffer)
+        if view.format != typecode:
+            view = view.cast("B").cast(typecode)
+        seq = cls.__new__(cls)
+        seq._attach(buffer, view)
+        return seq
+
+    @property
+    def elements(self):
+        # MySeq code reads .elements, a memoryview supports the same len/index/slice
+        return self.view
+
+    @property
+    def nbytes(self):
+        return self.view.nbytes
+
+    def __len__(self):
+        return len(self.view)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            seq = self.__class__.__new__(self.__class__)
+            seq._attach(self.storage, self.view[index])
+            return seq
+        return self.view[index]
+
+    def __iter__(self):
+        return iter(self.view)
+
+    def __buffer__(self, flags):
+        return memoryview(self.view)
+
+    def __array__(self, dtype=None, copy=None):
+        import numpy
+
+        result = numpy.asarray(self.view)
+        if dtype is not None or copy:
+            result = result.astype(dtype or result.dtype, copy=bool(copy))
+        return result
+
+    def tolist(self):
+        return self.view.tolist()
+
+    def __repr__(self):
+        items = self.view[:10].tolist()
+        more = ", ..." if len(self.view) > 10 else ""
+        return f"TypedSeq({self.typecode!r}, [{', '.join(map(repr, items))}{more}], len={len(self)})"
+
+
+if __name__ == "__main__":
+    import random
+    import sys
+    import time
+    import tracemalloc
+
+    import numpy
+
+    N = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    def allocated(func):
+        tracemalloc.start()
+        result = func()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return result, size
+
+    def duration(seconds):
+        for unit, scale in (("ns", 1e9), ("us", 1e6), ("ms", 1e3)):
+            if seconds * scale < 1000:
+                return f"{seconds * scale:10.1f} {unit}"
+        return f"{seconds:10.1f} s "
+
+    def per_op(func, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return (time.perf_counter() - start) / repeat
+
+    # the same behaviour as MySeq
+    typed = TypedSeq([1.5, 2.5, 3.5, 4.5, 5.5])
+    assert isinstance(typed, MySeq) and len(typed) == 5 and typed[1] == 2.5 and typed[-1] == 5.5
+    assert not hasattr(typed, "__dict__")  # __slots__ all the way up, MySeq included
+    assert typed[1:4].tolist() == [2.5, 3.5, 4.5] and typed[::-2].tolist() == [5.5, 3.5, 1.5]
+    assert list(typed) == [1.5, 2.5, 3.5, 4.5, 5.5]
+
+    values = [random.random() for _ in range(N)]
+    my_seq, list_bytes = allocated(lambda: MySeq(random.random() for _ in range(N)))
+    typed, typed_bytes = allocated(lambda: TypedSeq(values, "d"))
+    indexes = [random.randrange(N) for _ in range(100_000)]
+
+    print(f"{N:,} floats")
+    print(f"{'':<22}{'MySeq (list)':>16}{'TypedSeq':>16}")
+    print(f"{'memory':<22}{list_bytes / N:13.1f} B/el{typed_bytes / N:13.1f} B/el")
+    rows = (
+        ("seq[i]", lambda seq: (lambda: [seq[i] for i in indexes]), len(indexes), 5),
+        ("seq[N/4:3N/4]", lambda seq: (lambda: seq[N // 4:3 * N // 4]), 1, 20),
+        ("for x in seq", lambda seq: (lambda: sum(seq)), N, 3),
+        ("numpy.asarray(seq)", lambda seq: (lambda: numpy.asarray(seq.elements if seq is my_seq else seq)), 1, 5),
+    )
+    for name, make, ops, repeat in rows:
+        timings = [per_op(make(seq), repeat) / ops for seq in (my_seq, typed)]
+        print(f"{name:<22}{duration(timings[0]):>16}{duration(timings[1]):>16}")
+
+    wrapped = numpy.asarray(typed[::2])
+    assert wrapped[1] == typed[2] and not wrapped.flags.writeable
+    print("numpy.asarray(typed[::2]) shares the memory of typed:", numpy.shares_memory(wrapped, typed.storage))
@@ -0,0 +1,208 @@
+"""
+- A sequence bigger than our memory
+  MySeq (1_sequence_type.py) needs __len__ and __getitem__, and keeps everything in a
+  list. For a dataset of 100 million records that list doesn't fit into RAM, and even
+  if it did, reading the file into it takes minutes before we can look at record 0.
+
+- Fixed-width records + mmap
+  If every record has the same size (struct format "<qdd": an int64 and two doubles,
+  24 bytes), record i starts at byte HEADER_SIZE + i * 24. No index, no parsing.
+
+  mmap maps the file into our address space: the OS reads a page (4 KB) only when we
+  touch it ("lazy paging") and can drop it again when memory gets tight, because it is
+  still in the file. So
+
+    open          -> map the file, read the header             (no matter how big)
+    seq[i]        -> struct.unpack_from at one offset          O(1)
+    seq[a:b:c]    -> a view: the same mmap + range(a, b, c)    O(1), no copy
+    for r in seq  -> struct.iter_unpack over the mapped bytes   memory stays flat
+
+  MMapSeq is a collections.abc.Sequence, so `in`, index(), count() and reversed()
+  come from the mixin methods.
+
+- File layout
+    first HEADER_SIZE bytes: b"MMAPSEQ1\\n" + JSON {"format": "<qdd", "fields": [...]}
+    then the records, packed with that struct format, one after another
+  The header is one page, so the records start page-aligned.
+
+- Usage
+    write_records("prices.seq", "<qdd", rows, fields=("id", "price", "volume"))
+    with MMapSeq("prices.seq") as prices:
+        prices[123_456_789]          -> Record(id=123456789, price=..., volume=...)
+        prices[-1000:].count(...)
+"""
+
+import json
+import mmap
+import struct
+from collections import namedtuple
+from collections.abc import Sequence
+
+MAGIC = b"MMAPSEQ1\n"
+HEADER_SIZE = 4096
+BATCH = 64 * 1024  # records packed per write / unpacked per step while iterating
+
+
+def write_records(path, fmt, records, fields=None):
+    """Writes an iterable of tuples (or single values for a one-field format). Returns the count."""
+    record = struct.Struct(fmt)
+    single = len(record.unpack(bytes(record.size))) == 1
+    header = MAGIC + json.dumps({"format": fmt, "fields": list(fields) if fields else None}).encode("utf-8")
+    if len(header) > HEADER_SIZE:
+        raise ValueError("format and field names don't fit into the header")
+    count = 0
+    with open(path, "wb") as file:
+        file.write(header.ljust(HEADER_SIZE, b"\0"))
+        batch = bytearray(BATCH * record.size)
+        used = 0
+        for item in records:
+            if single:
+                record.pack_into(batch, used, item)
+            else:
+                record.pack_into(batch, used, *item)
+            used += record.size
+            count += 1
+            if used == len(batch):
+                file.write(batch)
+                used = 0
+        file.write(memoryview(batch)[:used])
+    return count
+
+
+class MMapSeq(Sequence):
+    """Read-only sequence of fixed-width records in a memory-mapped file."""
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)  # the mapping keeps its own handle
+        if self.mmap[:len(MAGIC)] != MAGIC:
+            self.mmap.close()
+            raise ValueError(f"{path} is not a MMapSeq file")
+        header = json.loads(self.mmap[len(MAGIC):HEADER_SIZE].rstrip(b"\0"))
+        self.path = path
+        self.format = header["format"]
+        self.struct = struct.Struct(self.format)
+        self.fields = header["fields"]
+        self.record_type = namedtuple("Record", self.fields) if self.fields else None
+        self.single = len(self.struct.unpack(bytes(self.struct.size))) == 1
+        count = (len(self.mmap) - HEADER_SIZE) // self.struct.size
+        self.rows = range(count)  # the records this sequence shows, a slice of it for views
+
+    @classmethod
+    def _view(cls, parent, rows):
+        view = cls.__new__(cls)
+        view.__dict__.update(parent.__dict__)
+        view.rows = rows
+        return view
+
+    def _make(self, values):
+        if self.single:
+            return values[0]
+        if self.record_type is not None:
+            return self.record_type._make(values)
+        return values
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._view(self, self.rows[index])  # slicing a range is O(1)
+        row = self.rows[index]  # negative indexes and IndexError come from range
+        return self._make(self.struct.unpack_from(self.mmap, HEADER_SIZE + row * self.struct.size))
+
+    def __iter__(self):
+        rows = self.rows
+        if rows.step != 1:
+            for row in rows:
+                yield self._make(self.struct.unpack_from(self.mmap, HEADER_SIZE + row * self.struct.size))
+            return
+        size = self.struct.size
+        for first in range(rows.start, rows.stop, BATCH):
+            last = min(first + BATCH, rows.stop)
+            # a copy of one batch (BATCH * size bytes): a memoryview kept across the yields
+            # would make close() fail with BufferError while an iterator is still alive
+            chunk = self.mmap[HEADER_SIZE + first * size:HEADER_SIZE + last * size]
+            if self.single:
+                for values in self.struct.iter_unpack(chunk):
+                    yield values[0]
+            elif self.record_type is not None:
+                yield from map(self.record_type._make, self.struct.iter_unpack(chunk))
+            else:
+                yield from self.struct.iter_unpack(chunk)
+
+    @property
+    def nbytes(self):
+        return len(self.rows) * self.struct.size
+
+    def close(self):
+        # views share the mapping of the sequence they come from, this closes it for all of them
+        self.mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return f"<MMapSeq {self.path!r} {self.format!r} rows={self.rows}>"
+
+
+if __name__ == "__main__":
+    import os
+    import random
+    import resource
+    import sys
+    import tempfile
+    import time
+    import tracemalloc
+
+    N = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000
+    FORMAT = "<qdd"
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "prices.seq")
+        start = time.perf_counter()
+        write_records(path, FORMAT, ((i, i * 0.5, i * 2.0) for i in range(N)), fields=("id", "price", "volume"))
+        print(f"wrote {N:,} records ({os.path.getsize(path) / 2 ** 20:.0f} MB) in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        seq = MMapSeq(path)
+        print(f"open:            {(time.perf_counter() - start) * 1e6:8.1f} us")
+
+        indexes = [random.randrange(N) for _ in range(100_000)]
+        start = time.perf_counter()
+        for i in indexes:
+            seq[i]
+        print(f"seq[i] (random): {(time.perf_counter() - start) / len(indexes) * 1e9:8.1f} ns")
+
+        start = time.perf_counter()
+        for _ in range(1000):
+            view = seq[N // 4:-N // 4:3]
+        print(f"seq[a:b:3]:      {(time.perf_counter() - start) / 1000 * 1e9:8.1f} ns  -> {len(view):,} records, "
+              f"view[1] = {view[1]}")
+        assert view[1] == seq[N // 4 + 3] and view[-1] == seq[N // 4 + (len(view) - 1) * 3]
+        assert view[10:20][0] == view[10] and seq[-1].id == N - 1
+
+        start = time.perf_counter()
+        total = sum(record.price for record in seq)
+        elapsed = time.perf_counter() - start
+        assert total == sum(i * 0.5 for i in range(N))
+        tracemalloc.start()  # measured separately, tracemalloc makes every allocation slow
+        for record in seq[:N // 10]:
+            pass
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"iterate all:     {elapsed / N * 1e9:8.1f} ns/record, python heap peak {peak / 2 ** 20:.1f} MB, "
+              f"max RSS {rss:.0f} MB (mapped pages included, the OS can drop them)")
+        seq.close()
+
+        # the same records in a list, the MySeq way
+        start = time.perf_counter()
+        with open(path, "rb") as file:
+            file.seek(HEADER_SIZE)
+            records = list(struct.iter_unpack(FORMAT, file.read()))
+        print(f"load into list:  {time.perf_counter() - start:8.2f} s, "
+              f"max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
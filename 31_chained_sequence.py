@@ -0,0 +1,195 @@
+"""
+- What does "+" cost?
+  1_sequence_type.py shows that lists and tuples can be concatenated with "+", and that
+  range(10) + range(10, 20, 2) raises TypeError. "+" also COPIES both operands into a
+  new object. Collecting chunks like this:
+
+    result = ()
+    for chunk in chunks:
+        result = result + chunk        # copies everything we have so far, again
+
+  copies 1 + 2 + 3 + ... + k chunks: it gets quadratically slower with more chunks.
+
+- ChainSeq: concatenation without copying
+  ChainSeq keeps the sequences themselves (lists, tuples, ranges, MySeq, ...) and the
+  running total of their lengths (a prefix sum):
+
+    parts = [range(10), range(10, 20, 2), [7, 8, 9]]
+    ends  = [10,        15,               18       ]
+
+  seq[12] -> bisect finds the first end > 12: part 1, at 12 - 10 = 2 -> 14
+  That is O(log k) for k parts, and append() only adds one part and one end: O(1).
+
+    >>> ChainSeq(range(10), range(10, 20, 2))     # range + range, nothing copied
+    >>> seq = ChainSeq(); seq.append(chunk)       # or seq += chunk
+
+- Slices are views
+  seq[a:b:c] returns a SliceView: the chained sequence plus a range of indexes, so a
+  slice of a slice is also just another range. Nothing is copied until we read.
+
+  The parts are not copied, so don't change their length after adding them:
+  the offsets would be wrong.
+"""
+
+import itertools
+from bisect import bisect_right
+from collections.abc import Sequence
+
+
+class SliceView(Sequence):
+    """seq[rows] for any sequence, rows is a range (slicing a range is O(1))."""
+
+    def __init__(self, base, rows):
+        self.base = base
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return SliceView(self.base, self.rows[index])
+        return self.base[self.rows[index]]
+
+    def __iter__(self):
+        if self.rows.step == 1 and hasattr(self.base, "iter_range"):
+            return self.base.iter_range(self.rows.start, self.rows.stop)
+        return map(self.base.__getitem__, self.rows)
+
+    def __repr__(self):
+        return f"SliceView({self.base!r}, {self.rows!r})"
+
+
+class ChainSeq(Sequence):
+    def __init__(self, *parts):
+        self.parts = []
+        self.ends = []  # ends[i] = len(parts[0]) + ... + len(parts[i])
+        for part in parts:
+            self.append(part)
+
+    def append(self, part):
+        """Adds a whole sequence at the end, O(1)."""
+        if len(part):
+            self.parts.append(part)
+            self.ends.append(len(self) + len(part))
+        return self
+
+    def __len__(self):
+        return self.ends[-1] if self.ends else 0
+
+    def locate(self, index):
+        """index -> (part number, index inside that part)."""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("ChainSeq index out of range")
+        number = bisect_right(self.ends, index)
+        return number, index - (self.ends[number - 1] if number else 0)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return SliceView(self, range(len(self))[index])
+        number, offset = self.locate(index)
+        return self.parts[number][offset]
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self.parts)
+
+    def iter_range(self, start, stop):
+        """Items start..stop-1 without indexing every one of them through bisect."""
+        if start >= stop:
+            return
+        number, offset = self.locate(start)
+        remaining = stop - start
+        for part in itertools.islice(self.parts, number, None):
+            end = min(len(part), offset + remaining)
+            if offset == 0 and end == len(part):
+                yield from part  # the whole part: its own (fast) iterator
+            else:
+                yield from map(part.__getitem__, range(offset, end))
+            remaining -= end - offset
+            if not remaining:
+                return
+            offset = 0
+
+    def __contains__(self, value):
+        # each part answers with its own __contains__, that's O(1) for a range
+        return any(value in part for part in self.parts)
+
+    def __reversed__(self):
+        return itertools.chain.from_iterable(map(reversed, reversed(self.parts)))
+
+    def __add__(self, other):
+        return ChainSeq(*self.parts, other)
+
+    def __radd__(self, other):
+        return ChainSeq(other, *self.parts)
+
+    def __iadd__(self, other):
+        return self.append(other)
+
+    def __repr__(self):
+        return f"ChainSeq({', '.join(map(repr, self.parts))})"
+
+
+if __name__ == "__main__":
+    import importlib
+    import random
+    import time
+
+    MySeq = importlib.import_module("1_sequence_type").MySeq
+
+    # --------------------------
+    # range + range, and mixed sequence types
+    # --------------------------
+    seq = ChainSeq(range(10), range(10, 20, 2))
+    print(seq, "->", list(seq))
+    seq += [100, 200]
+    seq = (-1, -2) + seq + MySeq([300, 400])
+    expected = [-1, -2] + list(range(10)) + list(range(10, 20, 2)) + [100, 200, 300, 400]
+    assert list(seq) == expected and len(seq) == len(expected)
+    assert [seq[i] for i in range(-len(seq), len(seq))] == expected * 2
+    for window in (slice(3, 15), slice(None, None, -1), slice(1, -1, 3), slice(100, 200)):
+        assert list(seq[window]) == expected[window] and list(seq[window][1::2]) == expected[window][1::2]
+    assert 16 in seq and 17 not in seq and list(reversed(seq)) == expected[::-1] and seq.index(100) == 17
+
+    # --------------------------
+    # appending k chunks of 1000 items: tuple "+" is quadratic, ChainSeq.append is not
+    # --------------------------
+    chunk = tuple(range(1000))
+    print(f"{'chunks':>8}{'tuple +':>12}{'list.extend':>14}{'ChainSeq.append':>18}")
+    for k in (250, 500, 1000):
+        timings = []
+        start = time.perf_counter()
+        result = ()
+        for _ in range(k):
+            result = result + chunk
+        timings.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        result = []
+        for _ in range(k):
+            result.extend(chunk)
+        timings.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        result = ChainSeq()
+        for _ in range(k):
+            result.append(chunk)
+        timings.append(time.perf_counter() - start)
+        print(f"{k:>8}" + "".join(f"{seconds * 1000:{width}.2f} ms" for seconds, width in zip(timings, (9, 11, 15))))
+
+    # --------------------------
+    # seq[i] grows with log(k), a slice is O(1)
+    # --------------------------
+    print(f"{'parts':>8}{'seq[i]':>12}{'seq[a:b]':>12}")
+    for k in (1, 100, 10_000):
+        seq = ChainSeq(*(range(i * 100, (i + 1) * 100) for i in range(k)))
+        indexes = [random.randrange(len(seq)) for _ in range(100_000)]
+        start = time.perf_counter()
+        for i in indexes:
+            seq[i]
+        per_index = (time.perf_counter() - start) / len(indexes)
+        start = time.perf_counter()
+        for _ in range(10_000):
+            seq[10:-10]
+        per_slice = (time.perf_counter() - start) / 10_000
+        print(f"{k:>8}{per_index * 1e9:9.0f} ns{per_slice * 1e9:9.0f} ns")
@@ -0,0 +1,323 @@
+"""
+- Why are loops over MySeq slow?
+  MySeq (1_sequence_type.py) gives us one element at a time, so every transformation is
+  a Python loop:
+
+    total = 0
+    for i in range(len(prices)):
+        value = prices[i] * quantities[i]     # 2x __getitem__, 1 float object created
+        if value > 100:
+            total += value
+
+  Each step runs bytecode, calls methods and creates objects: ~150 ns per element.
+
+- Vectorized: one call for the whole sequence
+  VecSeq has the same len/index interface, plus operations that work on all elements
+  at once:
+
+    value = prices * quantities          # elementwise, also with a scalar: prices * 1.19
+    big = value[value > 100]             # boolean mask
+    value[[3, 1, 2]], value.take(...)    # gather ("fancy indexing")
+    big.sum(), big.min(), big.max(), big.mean(), value.argsort()
+    prices.map(math.sqrt)                # any function, element by element
+
+  With NumPy installed the elements live in a numpy array and every operation is ONE
+  loop in C over raw numbers. Without NumPy the same API runs as plain Python list
+  comprehensions: not faster than our own loop, but the code doesn't have to change.
+  VecSeq(..., backend="python") picks the fallback on purpose.
+
+  For 1M records the arithmetic + mask + sum pipeline below gets ~14x faster with NumPy.
+  argsort only ~3x: sorted() was already running in C, only the key lookups were Python.
+
+- Like NumPy, comparisons (==, <, ...) return a VecSeq of booleans, not True/False.
+"""
+
+import importlib
+import itertools
+import operator
+
+try:
+    import numpy
+except ImportError:  # VecSeq falls back to plain Python lists
+    numpy = None
+
+MySeq = importlib.import_module("1_sequence_type").MySeq
+
+
+class VecSeq(MySeq):
+    def __init__(self, elements, backend=None):
+        backend = backend or ("numpy" if numpy is not None else "python")
+        if isinstance(elements, MySeq):
+            elements = elements.elements
+        if backend == "numpy":
+            if numpy is None:
+                raise ImportError("backend='numpy' needs numpy: python -m pip install numpy")
+            if not hasattr(elements, "__len__"):
+                elements = list(elements)  # a generator
+            elements = numpy.asarray(elements)
+        elif backend == "python":
+            elements = elements.tolist() if hasattr(elements, "tolist") else list(elements)
+        else:
+            raise ValueError(f"unknown backend {backend!r}")
+        self.elements = elements
+        self.backend = backend
+
+    def _new(self, elements):
+        seq = self.__class__.__new__(self.__class__)
+        seq.elements = elements
+        seq.backend = self.backend
+        return seq
+
+    def _operand(self, other):
+        # another sequence -> something our backend can combine with our elements
+        if isinstance(other, MySeq):
+            other = other.elements
+        if self.backend == "numpy":
+            return numpy.asarray(other) if not numpy.isscalar(other) else other
+        if isinstance(other, (str, bytes)) or not hasattr(other, "__len__"):
+            return other
+        other = other.tolist() if hasattr(other, "tolist") else other
+        if len(other) != len(self.elements):
+            raise ValueError(f"length mismatch: {len(self.elements)} and {len(other)}")
+        return other
+
+    def _binary(self, other, op):
+        other = self._operand(other)
+        if self.backend == "numpy":
+            return self._new(op(self.elements, other))
+        if hasattr(other, "__len__") and not isinstance(other, (str, bytes)):
+            return self._new(list(map(op, self.elements, other)))
+        return self._new([op(value, other) for value in self.elements])
+
+    def _reflected(self, other, op):
+        return self._binary(other, lambda a, b: op(b, a))
+
+    # --------------------------
+    # elementwise
+    # --------------------------
+    def __add__(self, other):
+        return self._binary(other, operator.add)
+
+    def __radd__(self, other):
+        return self._reflected(other, operator.add)
+
+    def __sub__(self, other):
+        return self._binary(other, operator.sub)
+
+    def __rsub__(self, other):
+        return self._reflected(other, operator.sub)
+
+    def __mul__(self, other):
+        return self._binary(other, operator.mul)
+
+    def __rmul__(self, other):
+        return self._reflected(other, operator.mul)
+
+    def __truediv__(self, other):
+        return self._binary(other, operator.truediv)
+
+    def __rtruediv__(self, other):
+        return self._reflected(other, operator.truediv)
+
+    def __floordiv__(self, other):
+        return self._binary(other, operator.floordiv)
+
+    def __rfloordiv__(self, other):
+        return self._reflected(other, operator.floordiv)
+
+    def __mod__(self, other):
+        return self._binary(other, operator.mod)
+
+    def __rmod__(self, other):
+        return self._reflected(other, operator.mod)
+
+    def __pow__(self, other):
+        return self._binary(other, operator.pow)
+
+    def __rpow__(self, other):
+        return self._reflected(other, operator.pow)
+
+    def __neg__(self):
+        return self._new(-self.elements if self.backend == "numpy" else [-value for value in self.elements])
+
+    def __abs__(self):
+        return self._new(abs(self.elements) if self.backend == "numpy" else [abs(value) for value in self.elements])
+
+    def __lt__(self, other):
+        return self._binary(other, operator.lt)
+
+    def __le__(self, other):
+        return self._binary(other, operator.le)
+
+    def __gt__(self, other):
+        return self._binary(other, operator.gt)
+
+    def __ge__(self, other):
+        return self._binary(other, operator.ge)
+
+    def __eq__(self, other):
+        return self._binary(other, operator.eq)
+
+    def __ne__(self, other):
+        return self._binary(other, operator.ne)
+
+    __hash__ = None  # == is elementwise, so VecSeq can't be a dict key
+
+    def __and__(self, other):
+        return self._binary(other, operator.and_)
+
+    def __or__(self, other):
+        return self._binary(other, operator.or_)
+
+    def __invert__(self):
+        if self.backend == "numpy":
+            return self._new(~self.elements)
+        # like numpy: logical not for bools, bitwise not (-x - 1) for ints
+        return self._new([not value if isinstance(value, bool) else ~value for value in self.elements])
+
+    def map(self, func):
+        """func applied to every element. NumPy ufuncs (numpy.sqrt, ...) run vectorized."""
+        if self.backend == "numpy":
+            if isinstance(func, numpy.ufunc):
+                return self._new(func(self.elements))
+            # numpy picks the dtype from the results: big ints stay exact, strings stay strings
+            return self._new(numpy.asarray(list(map(func, self.elements.tolist()))))
+        return self._new(list(map(func, self.elements)))
+
+    # --------------------------
+    # indexing: a position, a slice, a boolean mask or a list of positions
+    # --------------------------
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._new(self.elements[index])
+        if isinstance(index, int) or (numpy is not None and isinstance(index, numpy.integer)):
+            value = self.elements[index]
+            return value.item() if hasattr(value, "item") else value
+        index = index.elements if isinstance(index, MySeq) else index
+        if self.backend == "numpy":
+            if not len(index):
+                return self._new(self.elements[:0])  # numpy.asarray([]) is float, not a valid index
+            return self._new(self.elements[numpy.asarray(index)])
+        index = index.tolist() if hasattr(index, "tolist") else index
+        if len(index) and isinstance(index[0], bool):
+            return self.compress(index)
+        return self.take(index)
+
+    def take(self, indexes):
+        indexes = indexes.elements if isinstance(indexes, MySeq) else indexes
+        if self.backend == "numpy":
+            return self._new(self.elements.take(indexes))
+        return self._new([self.elements[i] for i in indexes])
+
+    def compress(self, mask):
+        mask = mask.elements if isinstance(mask, MySeq) else mask
+        if len(mask) != len(self):
+            raise IndexError(f"mask of length {len(mask)} for {len(self)} elements")
+        if self.backend == "numpy":
+            return self._new(self.elements[numpy.asarray(mask, dtype=bool)])
+        return self._new(list(itertools.compress(self.elements, mask)))
+
+    # --------------------------
+    # reductions
+    # --------------------------
+    def _scalar(self, value):
+        return value.item() if hasattr(value, "item") else value
+
+    def sum(self):
+        return self._scalar(self.elements.sum() if self.backend == "numpy" else sum(self.elements))
+
+    def min(self):
+        return self._scalar(self.elements.min() if self.backend == "numpy" else min(self.elements))
+
+    def max(self):
+        return self._scalar(self.elements.max() if self.backend == "numpy" else max(self.elements))
+
+    def mean(self):
+        return self.sum() / len(self)
+
+    def argsort(self):
+        """Positions that would sort the sequence (stable)."""
+        if self.backend == "numpy":
+            return self._new(self.elements.argsort(kind="stable"))
+        return self._new(sorted(range(len(self.elements)), key=self.elements.__getitem__))
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def tolist(self):
+        return self.elements.tolist() if self.backend == "numpy" else list(self.elements)
+
+    def __repr__(self):
+        items = self.tolist()
+        shown = ", ".join(map(repr, items[:10])) + (", ..." if len(items) > 10 else "")
+        return f"VecSeq([{shown}], backend={self.backend!r})"
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    N = 1_000_000
+    prices = [random.uniform(1, 100) for _ in range(N)]
+    quantities = [random.randint(1, 10) for _ in range(N)]
+
+    # --------------------------
+    # both backends give the same answers
+    # --------------------------
+    for backend in ("python", "numpy"):
+        seq = VecSeq([3.0, 1.0, 4.0, 1.5, 5.0], backend=backend)
+        assert (seq * 2 + 1).tolist() == [7.0, 3.0, 9.0, 4.0, 11.0] and (10 - seq)[0] == 7.0
+        assert seq[seq > 2].tolist() == [3.0, 4.0, 5.0] and seq[[4, 0]].tolist() == [5.0, 3.0]
+        assert seq[(seq > 1) & (seq < 5)].tolist() == [3.0, 4.0, 1.5] and seq[~(seq > 2)].tolist() == [1.0, 1.5]
+        assert (seq.sum(), seq.min(), seq.max()) == (14.5, 1.0, 5.0) and seq.argsort().tolist() == [1, 3, 0, 2, 4]
+        assert (seq * VecSeq([1, 2, 3, 4, 5], backend=backend)).tolist() == [3.0, 2.0, 12.0, 6.0, 25.0]
+        assert seq.map(abs)[1:3].tolist() == [1.0, 4.0] and len(seq) == 5 and seq[-1] == 5.0
+        assert VecSeq([10 ** 17 + 1], backend=backend).map(lambda x: x + 1).tolist() == [10 ** 17 + 2]
+        assert VecSeq(["a", "b"], backend=backend).map(str.upper).tolist() == ["A", "B"] and seq[[]].tolist() == []
+        ints = VecSeq([1, 2, 3], backend=backend)
+        assert (~ints).tolist() == [-2, -3, -4] and (2 ** ints).tolist() == [2, 4, 8]
+        assert (7 // ints).tolist() == [7, 3, 2] and (7 % ints).tolist() == [0, 1, 1]
+
+    # --------------------------
+    # a per-record pipeline: revenue of the big orders, and the orders ranked by value
+    # --------------------------
+    def loop_revenue(prices, quantities):
+        # element by element through MySeq, like we would write it without VecSeq
+        total = 0.0
+        for i in range(len(prices)):
+            value = prices[i] * quantities[i]
+            if value > 100:
+                total += value
+        return total
+
+    def loop_ranking(prices, quantities):
+        values = [prices[i] * quantities[i] for i in range(len(prices))]
+        return sorted(range(len(values)), key=values.__getitem__)[:3]
+
+    def vec_revenue(prices, quantities):
+        values = prices * quantities
+        return values[values > 100].sum()
+
+    def vec_ranking(prices, quantities):
+        return (prices * quantities).argsort()[:3].tolist()
+
+    ways = [("MySeq + Python loop", (loop_revenue, loop_ranking), MySeq),
+            ("VecSeq, python backend", (vec_revenue, vec_ranking), lambda data: VecSeq(data, backend="python"))]
+    if numpy is not None:
+        ways.append(("VecSeq, numpy backend", (vec_revenue, vec_ranking), lambda data: VecSeq(data, backend="numpy")))
+
+    print(f"{N:,} records{'revenue > 100':>26}{'argsort ranking':>26}")
+    expected = None
+    baselines = None
+    for name, pipelines, make in ways:
+        prices_seq, quantities_seq = make(prices), make(quantities)
+        timings, results = [], []
+        for pipeline in pipelines:
+            start = time.perf_counter()
+            results.append(pipeline(prices_seq, quantities_seq))
+            timings.append(time.perf_counter() - start)
+        expected = expected or results
+        baselines = baselines or timings
+        assert abs(results[0] - expected[0]) < 1e-9 * expected[0] and results[1] == expected[1]
+        print(f"{name:<24}" + "    ".join(f"{seconds * 1000:10.1f} ms {baseline / seconds:6.1f}x"
+                                        for seconds, baseline in zip(timings, baselines)))
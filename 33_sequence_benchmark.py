@@ -0,0 +1,221 @@
+"""
+- Numbers for 1_sequence_type.py
+  1_sequence_type.py says what sequences CAN do (index, slice, concatenate, deque can't
+  be sliced), but not what it costs. This benchmark measures, for every container and
+  size (10 ... 10^7 elements):
+
+    len        len(seq)
+    index      seq[i] at random positions        (deque walks its blocks: O(n))
+    slice      seq[n/4:3n/4]                     (a copy for list/tuple, a view for range
+                                                  and the sequences of files 29-31)
+    iterate    for x in seq                      ns per ELEMENT
+    concat     seq + seq                         (TypeError for range, MySeq, ...)
+    contains   last element in seq               (a full scan, O(1) for range)
+
+  and how many bytes one element costs (Python heap, measured with tracemalloc while the
+  container is built; MMapSeq keeps its data in the mapped file, that is reported as
+  mapped_bytes_per_element). The cost of calling the timed function itself is measured
+  once and subtracted.
+
+- Containers: list, tuple, range, deque, MySeq and the sequence types of the later
+  files: TypedSeq (29), MMapSeq (30), ChainSeq (31), VecSeq (32). A new one only needs
+  an entry in CONTAINERS.
+
+- The report is JSON like 26_smtp_benchmark.py and 28_http_benchmark.py:
+
+    python 33_sequence_benchmark.py --output today.json        (~3 minutes, most of it n=10^7)
+    python 33_sequence_benchmark.py --baseline today.json     -> exit code 1 on a regression
+    python 33_sequence_benchmark.py --sizes 10 1000 --containers list deque MySeq
+"""
+
+import argparse
+import gc
+import importlib
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+
+MySeq = importlib.import_module("1_sequence_type").MySeq
+TypedSeq = importlib.import_module("29_typed_sequence").TypedSeq
+mmap_sequence = importlib.import_module("30_mmap_sequence")
+ChainSeq = importlib.import_module("31_chained_sequence").ChainSeq
+VecSeq = importlib.import_module("32_vectorized_sequence").VecSeq
+
+CHAIN_CHUNK = 1024  # ChainSeq is built like a stream of appended chunks
+
+
+def build_mmap(n, directory):
+    path = os.path.join(directory, f"seq-{n}.seq")
+    mmap_sequence.write_records(path, "<q", range(n))
+    return mmap_sequence.MMapSeq(path)
+
+
+# name -> function(n, directory) that builds the container with the elements 0 .. n-1
+CONTAINERS = {
+    "list": lambda n, directory: list(range(n)),
+    "tuple": lambda n, directory: tuple(range(n)),
+    "range": lambda n, directory: range(n),
+    "deque": lambda n, directory: deque(range(n)),
+    "MySeq": lambda n, directory: MySeq(range(n)),
+    "TypedSeq": lambda n, directory: TypedSeq(range(n), "q"),
+    "MMapSeq": build_mmap,
+    "ChainSeq": lambda n, directory: ChainSeq(*(list(range(start, min(start + CHAIN_CHUNK, n)))
+                                                for start in range(0, n, CHAIN_CHUNK))),
+    "VecSeq": lambda n, directory: VecSeq(range(n)),
+}
+
+NOT_SUPPORTED = {
+    # (container, operation) -> why we don't measure it, where the operation exists but means something else
+    ("VecSeq", "concat"): "+ adds elementwise",
+}
+
+
+def iterate(seq):
+    for _ in seq:
+        pass
+
+
+# name -> function(seq, n, indexes) returning (callable, operations per call)
+OPERATIONS = {
+    "len": lambda seq, n, indexes: (lambda: len(seq), 1),
+    "index": lambda seq, n, indexes: (lambda: [seq[i] for i in indexes], len(indexes)),
+    "slice": lambda seq, n, indexes: (lambda: seq[n // 4:3 * n // 4], 1),
+    "iterate": lambda seq, n, indexes: (lambda: iterate(seq), n),
+    "concat": lambda seq, n, indexes: (lambda: seq + seq, 1),
+    "contains": lambda seq, n, indexes: (lambda: n - 1 in seq, 1),
+}
+
+
+def measure(func, operations, min_time, repeat):
+    """ns per operation: the best of `repeat` rounds, each at least `min_time` seconds long."""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 1_000_000:
+            break
+        loops *= 10 if elapsed < min_time / 10 else 2
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        best = min(best, time.perf_counter() - start)
+    return best / loops / operations * 1e9
+
+
+def memory(build, n, directory):
+    """(the container, bytes it holds on the Python heap)."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    seq = build(n, directory)
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return seq, size
+
+
+def run(containers, sizes, operations, min_time, repeat):
+    # calling the timed lambda costs something too, it is taken off every measurement
+    overhead = measure(lambda: None, 1, min_time, repeat)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for n in sizes:
+            rng = random.Random(n)
+            indexes = [rng.randrange(n) for _ in range(min(n, 1000))]
+            for name in containers:
+                seq, heap_bytes = memory(CONTAINERS[name], n, directory)
+                result = {"container": name, "size": n, "bytes_per_element": round(heap_bytes / n, 2), "ns_per_op": {}}
+                if isinstance(seq, mmap_sequence.MMapSeq):
+                    result["mapped_bytes_per_element"] = round(seq.nbytes / n, 2)
+                for operation in operations:
+                    if (name, operation) in NOT_SUPPORTED:
+                        result["ns_per_op"][operation] = None
+                        result.setdefault("not_supported", {})[operation] = NOT_SUPPORTED[name, operation]
+                        continue
+                    func, count = OPERATIONS[operation](seq, n, indexes)
+                    try:
+                        func()
+                    except TypeError as err:  # deque[1:2], range + range, ...
+                        result["ns_per_op"][operation] = None
+                        result.setdefault("not_supported", {})[operation] = f"TypeError: {err}"
+                        continue
+                    per_op = measure(func, count, min_time, repeat) - overhead / count
+                    result["ns_per_op"][operation] = round(max(per_op, 0.0), 2)
+                results.append(result)
+                print(f"{name:<9}{n:>10,}  {result['bytes_per_element']:7.1f} B/el  " + "  ".join(
+                    f"{operation} {'-' if value is None else format(value, '.1f')}"
+                    for operation, value in result["ns_per_op"].items()), file=sys.stderr)
+                if hasattr(seq, "close"):
+                    seq.close()
+                del seq
+                func = None  # the lambdas keep the container alive too
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Operations that got slower than the baseline by more than `tolerance` (0.3 = 30%)."""
+    before = {(result["container"], result["size"]): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = before.get((result["container"], result["size"]))
+        if old is None:
+            continue
+        for operation, value in result["ns_per_op"].items():
+            old_value = old["ns_per_op"].get(operation)
+            if value is not None and old_value is not None and value > old_value * (1 + tolerance):
+                regressions.append(f"{result['container']} n={result['size']} {operation}: "
+                                   f"{old_value} -> {value} ns/op")
+        if result["bytes_per_element"] > old["bytes_per_element"] * (1 + tolerance) + 1:
+            regressions.append(f"{result['container']} n={result['size']}: "
+                               f"{old['bytes_per_element']} -> {result['bytes_per_element']} bytes/element")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip("- \n"))
+    parser.add_argument("--containers", nargs="+", choices=list(CONTAINERS), default=list(CONTAINERS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 1000, 100_000, 10_000_000])
+    parser.add_argument("--operations", nargs="+", choices=list(OPERATIONS), default=list(OPERATIONS))
+    parser.add_argument("--min-time", type=float, default=0.05, help="seconds per timing round")
+    parser.add_argument("--repeat", type=int, default=3, help="timing rounds, the best one counts")
+    parser.add_argument("--output", help="write the JSON report to this file (default: stdout)")
+    parser.add_argument("--baseline", help="JSON report to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.3)
+    args = parser.parse_args()
+    if min(args.sizes) < 1:
+        parser.error("--sizes must be at least 1")
+
+    results = run(args.containers, args.sizes, args.operations, args.min_time, args.repeat)
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION", regression, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+- LatencyHistogram: percentiles without keeping every measurement
+  Made for 18_request_timing.py, shared by the benchmarks (26_smtp_benchmark.py,
+  28_http_benchmark.py), which shouldn't need requests/urllib3 just for this.
+
+  Like HdrHistogram we count measurements in buckets: for every power of two we have 32
+  buckets, so a value is stored with ~3% precision, and the histogram needs only a
+  few hundred counters for anything from 1 microsecond to hours.
+
+    histogram = LatencyHistogram()
+    histogram.record(0.0123)           # seconds
+    histogram.percentile(99)           -> seconds, None while it is empty
+    histogram.snapshot()               -> {"count": ..., "p50_ms": ..., "p99_ms": ..., ...}
+
+  Not thread-safe: callers that record from several threads hold a lock.
+"""
+
+
+class LatencyHistogram:
+    """Log-linear histogram of durations in microseconds, ~3% precision (HdrHistogram style)."""
+
+    SUB_BUCKET_BITS = 5
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    @classmethod
+    def index(cls, micros):
+        if micros < cls.SUB_BUCKETS:
+            return micros
+        exponent = micros.bit_length() - cls.SUB_BUCKET_BITS - 1
+        return (exponent + 1) * cls.SUB_BUCKETS + (micros >> exponent) - cls.SUB_BUCKETS
+
+    @classmethod
+    def value_at(cls, index):
+        # the middle of the bucket
+        if index < cls.SUB_BUCKETS:
+            return index
+        exponent = index // cls.SUB_BUCKETS - 1
+        lowest = (index % cls.SUB_BUCKETS + cls.SUB_BUCKETS) << exponent
+        return lowest + (1 << exponent) / 2
+
+    def record(self, seconds):
+        micros = max(int(seconds * 1_000_000), 0)
+        index = self.index(micros)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def percentile(self, percent):
+        if not self.count:
+            return None
+        wanted = max(1, round(self.count * percent / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= wanted:
+                return min(self.value_at(index) / 1_000_000, self.max)
+        return self.max
+
+    def snapshot(self):
+        if not self.count:
+            return {"count": 0}
+        ms = lambda seconds: round(seconds * 1000, 3)
+        return {
+            "count": self.count,
+            "min_ms": ms(self.min),
+            "mean_ms": ms(self.total / self.count),
+            "p50_ms": ms(self.percentile(50)),
+            "p95_ms": ms(self.percentile(95)),
+            "p99_ms": ms(self.percentile(99)),
+            "max_ms": ms(self.max),
+        }
+
+
+if __name__ == "__main__":
+    import random
+    import sys
+    import time
+
+    N = 1_000_000
+    samples = [random.lognormvariate(-5, 1) for _ in range(N)]  # ~7 ms typical, a long slow tail
+
+    histogram = LatencyHistogram()
+    start = time.perf_counter()
+    for seconds in samples:
+        histogram.record(seconds)
+    elapsed = time.perf_counter() - start
+
+    exact = sorted(samples)
+    for percent in (50, 95, 99, 99.9):
+        wanted = exact[round(N * percent / 100) - 1]
+        print(f"p{percent:<5} exact {wanted * 1000:8.3f} ms  histogram {histogram.percentile(percent) * 1000:8.3f} ms")
+    print(f"{len(histogram.counts)} buckets ({sys.getsizeof(histogram.counts) // 1024} KB) instead of {N:,} floats, "
+          f"{elapsed / N * 1e9:.0f} ns per record()")
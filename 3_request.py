@@ -42,12 +42,16 @@ for url in URLS:
     else:
         print("Success!")
 
+# This loop checks one URL after another. For many URLs, check them concurrently
+# instead, see 8_concurrent_requests.py
+
 
 # The response of a GET request often has some valuable information, 
 # known as a payload, in the message body.
 # sometimes, we want response body in Bytes as well, in case of text or image or a file
 # to get the response in bytes - we can get it with response.content
 print(response.content) # so, this gives raw bytes
+# .content keeps the whole body in memory, for big files stream it instead (see 12_streaming_download.py)
 
 # if we want it in text format, then we have
 print(response.text) # converting this byte will require encoding schema, request tries to guess the encoding based on the response’s headers if you don’t specify one.
@@ -61,6 +65,8 @@ print(response.text)
 
 # Dealing with JSON object
 print(response.json()) # deserialize JSON - converting into Python Dict
+# For very big (or paginated) JSON lists we can decode item by item while the body
+# arrives, see 13_streaming_json.py
 
 # we can also get the URL like this
 print(response.url)
@@ -165,6 +171,9 @@ You can view the PreparedRequest object by accessing .request on a Response obje
 b'{"key": "value"}'
 """
 
+# response.elapsed tells us the total time, to see where it went (dns, connect, tls,
+# waiting for the server, body) see 18_request_timing.py
+
 # --------------------------
 # Authentication:
 # We can even authenticate ourself using requests by passing creds
@@ -223,6 +232,9 @@ token = response.json().get('access_token')
 headers = {'Authorization': f'Bearer {token}'}
 response = requests.get('https://api.example.com/data', headers=headers)
 
+# The token is valid for `expires_in` seconds, so don't fetch a new one for every call.
+# See 15_oauth_token_cache.py for a cached, auto-refreshing token used as auth=BearerAuth(...)
+
 
 # ----------
 # API Keys:
@@ -255,6 +267,9 @@ InsecureRequestWarning: Unverified HTTPS request is being made to host
 <Response [200]>
 """
 
+# Every new HTTPS connection loads the whole CA bundle and makes a full TLS handshake;
+# see 27_tls_session_cache.py for one shared SSLContext with TLS session resumption.
+
 # ----------
 # Max retries:
 # requests uses urllib3 internally, 
@@ -268,10 +283,13 @@ from urllib3.util.retry import Retry
 retry_strategy = Retry(
     total=3,  # Total number of retries
     status_forcelist=[429, 500, 502, 503, 504],  # Status codes to retry
-    method_whitelist=["HEAD", "GET", "OPTIONS"],  # HTTP methods to retry
+    allowed_methods=["HEAD", "GET", "OPTIONS"],  # HTTP methods to retry (called method_whitelist before urllib3 1.26)
     backoff_factor=1  # Backoff factor to apply between attempts
 )
 
+# Careful: if the server is down, every client retries and makes the outage worse.
+# See 16_retry_backoff.py for jittered backoff, Retry-After, retry budgets and a circuit breaker.
+
 # Apply the retry strategy to all HTTP requests
 adapter = HTTPAdapter(max_retries=retry_strategy)
 session = requests.Session()
@@ -282,6 +300,12 @@ session.mount("http://", adapter)
 response = session.get('https://api.example.com/data')
 print(response.status_code)
 
+# A Session also keeps connections open and reuses them (keep-alive), so repeated calls
+# to the same API skip the TCP/TLS handshake. requests.get() opens a new connection every time.
+# See 9_session_client.py for one shared, pooled client used by all the examples above.
+# How much that matters (requests/s, p99, client CPU for requests.get(), a Session and asyncio):
+# run 28_http_benchmark.py.
+
 
 # --------------------------------------------------------------------
 # POST:
@@ -323,11 +347,14 @@ print(response.text)
 import requests
 
 url = 'https://api.example.com/upload'
-files = {'file': open('file.txt', 'rb')}  # Open the file in binary mode
-
-response = requests.post(url, files=files)
+with open('file.txt', 'rb') as file:  # Open the file in binary mode, `with` closes it again
+    files = {'file': file}
+    response = requests.post(url, files=files)
 print(response.text)
 
+# requests builds the whole multipart body in memory, for big files stream it from disk
+# instead, see 14_streaming_upload.py
+
 """
 HTTP different status:
     1xx: An informational response which indicates that the request was received and understood.
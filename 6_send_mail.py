@@ -78,6 +78,8 @@ Subject: Hi there
 
 This message is sent from Python."""
 
+# (create the context once and reuse it, every call loads all CA certificates again:
+#  27_tls_session_cache.py also resumes the TLS session on the next connection)
 context = ssl.create_default_context()
 with smtplib.SMTP_SSL(smtp_server, port, context=context) as server:
     server.login(sender_email, password)
@@ -150,6 +152,7 @@ html = """\
 """
 
 # Turn these into plain/html MIMEText objects
+# (sending this to many people with their own name in it? see 22_mail_merge.py)
 part1 = MIMEText(text, "plain")
 part2 = MIMEText(html, "html")
 
@@ -191,7 +194,7 @@ message = MIMEMultipart()
 message["From"] = sender_email
 message["To"] = receiver_email
 message["Subject"] = subject
-message["Bcc"] = receiver_email  # Recommended for mass emails
+message["Bcc"] = receiver_email  # Recommended for mass emails (many receivers per message: 25_smtp_pipelining.py)
 
 # Add body to email
 message.attach(MIMEText(body, "plain"))
@@ -205,7 +208,8 @@ with open(filename, "rb") as attachment:
     part = MIMEBase("application", "octet-stream")
     part.set_payload(attachment.read())
 
-# Encode file in ASCII characters to send by email    
+# Encode file in ASCII characters to send by email
+# (the same file to many people? encode it only once, see 23_attachment_cache.py)
 encoders.encode_base64(part)
 
 # Add header as key/value pair to attachment part
@@ -215,6 +219,7 @@ part.add_header(
 )
 
 # Add attachment to message and convert message to string
+# (as_string() keeps the whole message in memory several times, 24_streaming_smtp.py streams it instead)
 message.attach(part)
 text = message.as_string()
 
@@ -250,4 +255,9 @@ yag.send(
 
 #####
 # If you plan to send a large volume of emails, want to see email statistics, and want to ensure
-# reliable delivery, it may be worth looking into transactional email services.
\ No newline at end of file
+# reliable delivery, it may be worth looking into transactional email services.
+#
+# To try the examples without a Gmail account, run the local test server in 19_local_smtp_server.py.
+# To measure them (messages/s, p99, CPU, memory) against that server with TLS: 26_smtp_benchmark.py.
+# To send many emails over a few reused, logged-in connections, see 20_bulk_smtp.py.
+# A small "transactional email service" of our own (durable queue, retries, bounces): 21_smtp_delivery_queue.py.
\ No newline at end of file
@@ -0,0 +1,444 @@
+"""
+- Why do we need a local HTTP server?
+  All the examples in 3_request.py talk to real APIs (api.github.com, api.example.com).
+  That is fine for learning, but when we want to measure something (how fast is my code?
+  how many connections did it open?) the internet adds noise: latency changes every second,
+  APIs rate-limit us and some of the example URLs don't even exist.
+
+  So, for experiments we spin up a tiny HTTP server on our own machine (127.0.0.1),
+  and we decide how slow it is and what it returns.
+
+- Python already ships a HTTP server in the standard library: http.server
+    >>> python -m http.server 8000   # serves the current directory
+
+  Here we use the same module, but with our own request handler, so every path
+  behaves like a small fake API endpoint:
+
+    GET  /get                -> 200 with a small JSON body
+    GET  /status/<code>      -> responds with that status code (e.g. /status/404)
+    POST /post               -> echoes the received body back as JSON
+    GET  /cached             -> cacheable resource with ETag/Last-Modified, answers 304 to
+                                If-None-Match/If-Modified-Since (?max_age=, ?cache_control=, ?size=)
+    GET  /bytes/<n>          -> streams n bytes (byte i is i % 256), supports Range requests,
+                                ?fail_after=<k> drops the connection after k bytes (not for Range requests)
+    GET  /records/<n>        -> a JSON array of n records, generated and sent chunked while streaming
+    GET  /items              -> one page of a paginated list with a Link: rel="next" header
+                                (?page=, ?per_page=, ?total=)
+    POST /upload             -> reads the request body in chunks without keeping it, answers
+                                with its size and sha256
+    POST /token              -> OAuth 2.0 client credentials token endpoint (?expires_in=<seconds>)
+    GET  /protected          -> 200 with a valid (not expired) Bearer token from /token, 401 otherwise
+    GET  /flaky              -> fails the first ?fail=<n> requests per ?key= with ?status= (default 503)
+                                and an optional Retry-After: ?retry_after=<seconds>, then 200
+    GET  /limited            -> rate limited API: ?limit= requests per ?window= seconds for each API key
+                                (Authorization header), sends X-RateLimit-* headers and 429 when exceeded
+
+  Every endpoint accepts ?delay=<seconds>, so we can simulate a slow upstream.
+
+  LocalServer(tls=(certfile, keyfile)) serves HTTPS instead, with a certificate from
+  make_certificate() in 19_local_smtp_server.py.
+
+- Usage:
+    with LocalServer() as server:
+        requests.get(server.url + "/get?delay=0.1")
+"""
+
+import hashlib
+import json
+import ssl
+import threading
+import time
+import uuid
+from collections import Counter
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# path prefix -> function(handler), filled by the @route decorator below
+ROUTES = {}
+
+
+def route(method, prefix):
+    def register(func):
+        ROUTES[(method, prefix)] = func
+        return func
+    return register
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps the connection open between requests (keep-alive),
+    # the same way real API servers behave.
+    protocol_version = "HTTP/1.1"
+    # send the headers and the body in one packet, otherwise keep-alive connections
+    # wait ~40ms for a delayed TCP ACK on every response
+    disable_nagle_algorithm = True
+    wbufsize = -1
+
+    def log_message(self, format, *args):
+        pass  # keep the demo output quiet
+
+    def end_headers(self):
+        # "Connection: close" from the client: say that we close too, so the client
+        # doesn't put the connection back into its pool
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        super().end_headers()
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_HEAD(self):
+        self.dispatch("HEAD")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def dispatch(self, method):
+        parts = urlsplit(self.path)
+        self.route_path = parts.path
+        self.query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        self.server.count_hit(parts.path)
+
+        delay = float(self.query.get("delay", 0))
+        if delay:
+            time.sleep(delay)
+
+        prefix = "/" + parts.path.strip("/").split("/")[0]
+        func = ROUTES.get((method, prefix))
+        if func is None and method == "HEAD":
+            func = ROUTES.get(("GET", prefix))  # HEAD is GET without the body
+        if func is None:
+            self.send_json(404, {"error": f"no route for {method} {parts.path}"})
+            return
+        func(self)
+
+    def iter_body(self, chunk_size=64 * 1024):
+        # yields the request body piece by piece, for both Content-Length and chunked bodies
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return  # the client went away in the middle of the body
+                size = int(line.split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return
+                while size:
+                    data = self.rfile.read(min(size, chunk_size))
+                    if not data:
+                        return
+                    size -= len(data)
+                    yield data
+                self.rfile.readline()
+        remaining = int(self.headers.get("Content-Length", 0))
+        while remaining:
+            data = self.rfile.read(min(remaining, chunk_size))
+            if not data:
+                return
+            remaining -= len(data)
+            yield data
+
+    def read_body(self):
+        return b"".join(self.iter_body())
+
+    def send_body(self, status, body=b"", content_type="application/octet-stream", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def send_chunked(self, status, chunks, content_type="application/octet-stream", headers=None):
+        # Transfer-Encoding: chunked, for bodies whose size we don't know in advance
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+        for chunk in chunks:
+            if chunk:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def send_json(self, status, data, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_body(status, body, "application/json", headers)
+
+
+# --------------------------
+# Endpoints
+# --------------------------
+STARTED_AT = formatdate(time.time(), usegmt=True)  # Last-Modified of /cached
+
+@route("GET", "/get")
+def get_endpoint(handler):
+    handler.send_json(200, {"url": handler.path, "args": handler.query, "headers": dict(handler.headers)})
+
+
+@route("GET", "/status")
+def status_endpoint(handler):
+    code = int(handler.route_path.rsplit("/", 1)[-1])
+    handler.send_json(code, {"status": code})
+
+
+@route("POST", "/post")
+def post_endpoint(handler):
+    body = handler.read_body()
+    handler.send_json(200, {
+        "args": handler.query,
+        "headers": dict(handler.headers),
+        "data": body.decode("utf-8", "replace"),
+    })
+
+
+@route("GET", "/cached")
+def cached_endpoint(handler):
+    body = json.dumps({"path": handler.path, "data": "x" * int(handler.query.get("size", 100))}).encode("utf-8")
+    headers = {
+        "ETag": '"%s"' % hashlib.sha1(body).hexdigest(),
+        "Last-Modified": STARTED_AT,
+        "Cache-Control": handler.query.get("cache_control", "max-age=" + handler.query.get("max_age", "60")),
+    }
+    if handler.headers.get("If-None-Match") == headers["ETag"] or handler.headers.get("If-Modified-Since") == STARTED_AT:
+        handler.send_body(304, headers=headers)
+        return
+    handler.send_body(200, body, "application/json", headers)
+
+
+BLOCK = bytes(range(256)) * 256  # 64 KB of the /bytes pattern
+
+
+@route("GET", "/bytes")
+def bytes_endpoint(handler):
+    size = int(handler.route_path.rsplit("/", 1)[-1])
+    start, end = 0, size - 1
+    status, headers = 200, {"Accept-Ranges": "bytes"}
+    range_header = handler.headers.get("Range", "")
+    if range_header.startswith("bytes="):
+        first, _, last = range_header[len("bytes="):].partition("-")
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start >= size:
+            handler.send_body(416, headers={"Content-Range": f"bytes */{size}"})
+            return
+        status = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    length = end - start + 1
+
+    handler.send_response(status)
+    handler.send_header("Content-Type", "application/octet-stream")
+    handler.send_header("Content-Length", str(length))
+    for name, value in headers.items():
+        handler.send_header(name, value)
+    handler.end_headers()
+    if handler.command == "HEAD":
+        return
+
+    to_send = length if range_header else min(length, int(handler.query.get("fail_after", length)))
+    position = start
+    while position < start + to_send:
+        offset = position % 256
+        piece = BLOCK[offset:offset + start + to_send - position]
+        handler.wfile.write(piece)
+        position += len(piece)
+    if to_send < length:
+        handler.close_connection = True  # the client sees the connection drop mid-body
+
+
+@route("POST", "/upload")
+def upload_endpoint(handler):
+    digest = hashlib.sha256()
+    size = 0
+    for data in handler.iter_body():
+        digest.update(data)
+        size += len(data)
+    handler.send_json(200, {
+        "bytes": size,
+        "sha256": digest.hexdigest(),
+        "content_type": handler.headers.get("Content-Type"),
+        "chunked": handler.headers.get("Transfer-Encoding") == "chunked",
+    })
+
+
+# access token -> expiry time, shared by /token and /protected
+TOKENS = {}
+TOKENS_LOCK = threading.Lock()
+
+
+@route("POST", "/token")
+def token_endpoint(handler):
+    handler.read_body()
+    expires_in = int(handler.query.get("expires_in", 3600))
+    token = uuid.uuid4().hex
+    with TOKENS_LOCK:
+        TOKENS[token] = time.monotonic() + expires_in
+    handler.send_json(200, {"access_token": token, "token_type": "bearer", "expires_in": expires_in})
+
+
+@route("GET", "/protected")
+def protected_endpoint(handler):
+    scheme, _, token = handler.headers.get("Authorization", "").partition(" ")
+    with TOKENS_LOCK:
+        valid = scheme.lower() == "bearer" and TOKENS.get(token, 0) > time.monotonic()
+    if not valid:
+        handler.send_json(401, {"error": "invalid_token"}, {"WWW-Authenticate": 'Bearer error="invalid_token"'})
+        return
+    handler.send_json(200, {"ok": True})
+
+
+FLAKY_CALLS = Counter()  # ?key= of /flaky -> requests seen
+FLAKY_LOCK = threading.Lock()
+
+
+@route("GET", "/flaky")
+def flaky_endpoint(handler):
+    key = handler.query.get("key", "")
+    with FLAKY_LOCK:
+        FLAKY_CALLS[key] += 1
+        call = FLAKY_CALLS[key]
+    if call <= int(handler.query.get("fail", 1)):
+        status = int(handler.query.get("status", 503))
+        headers = {"Retry-After": handler.query["retry_after"]} if "retry_after" in handler.query else None
+        handler.send_json(status, {"call": call, "status": status}, headers)
+        return
+    handler.send_json(200, {"call": call})
+
+
+RATE_WINDOWS = {}  # (api key, limit, window) -> [window start, requests in this window]
+
+
+@route("GET", "/limited")
+def limited_endpoint(handler):
+    limit = int(handler.query.get("limit", 10))
+    window = float(handler.query.get("window", 1))
+    key = (handler.headers.get("Authorization", ""), limit, window)
+    now = time.time()
+    with FLAKY_LOCK:
+        state = RATE_WINDOWS.setdefault(key, [now, 0])
+        if now - state[0] >= window:
+            state[:] = [now, 0]
+        state[1] += 1
+        used, reset_at = state[1], state[0] + window
+    headers = {
+        "X-RateLimit-Limit": str(limit),
+        "X-RateLimit-Remaining": str(max(limit - used, 0)),
+        "X-RateLimit-Reset": str(int(reset_at) + 1),  # epoch seconds, like GitHub
+        "X-RateLimit-Reset-After": f"{reset_at - now:.3f}",  # seconds, more precise
+    }
+    if used > limit:
+        headers["Retry-After"] = str(int(reset_at - now) + 1)
+        handler.send_json(429, {"error": "rate limit exceeded"}, headers)
+        return
+    handler.send_json(200, {"ok": True}, headers)
+
+
+def make_record(i):
+    return {"id": i, "name": f"record-{i}", "value": i * 0.5, "tags": ["a", "b"]}
+
+
+@route("GET", "/records")
+def records_endpoint(handler):
+    count = int(handler.route_path.rsplit("/", 1)[-1])
+
+    def chunks(batch=1000):
+        yield b"["
+        for first in range(0, count, batch):
+            records = (json.dumps(make_record(i)) for i in range(first, min(first + batch, count)))
+            yield ((b"," if first else b"") + ",".join(records).encode("utf-8"))
+        yield b"]"
+
+    handler.send_chunked(200, chunks(), "application/json")
+
+
+@route("GET", "/items")
+def items_endpoint(handler):
+    page = int(handler.query.get("page", 1))
+    per_page = int(handler.query.get("per_page", 100))
+    total = int(handler.query.get("total", 1000))
+    first = (page - 1) * per_page
+    items = [make_record(i) for i in range(first, min(first + per_page, total))]
+    headers = {}
+    if first + per_page < total:
+        host = handler.headers.get("Host")
+        headers["Link"] = f'<http://{host}/items?page={page + 1}&per_page={per_page}&total={total}>; rel="next"'
+    handler.send_json(200, {"page": page, "total": total, "items": items}, headers)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # a bigger listen backlog, so benchmarks with many parallel connections are not refused
+    request_queue_size = 128
+    tls_context = None  # an ssl.SSLContext makes it an HTTPS server
+
+    def finish_request(self, request, client_address):
+        if self.tls_context is None:
+            super().finish_request(request, client_address)
+            return
+        # the handshake runs here, in the thread of the connection, not in the accept loop
+        try:
+            request = self.tls_context.wrap_socket(request, server_side=True)
+        except (ssl.SSLError, OSError):
+            return
+        try:
+            super().finish_request(request, client_address)
+        finally:
+            request.close()
+
+    def server_activate(self):
+        super().server_activate()
+        self.hits = Counter()  # path -> number of requests, handy for assertions
+        self.hits_lock = threading.Lock()
+
+    def count_hit(self, path):
+        with self.hits_lock:
+            self.hits[path] += 1
+
+
+class LocalServer:
+    """Runs a StubHandler server on 127.0.0.1 in a background thread."""
+
+    def __init__(self, host="127.0.0.1", port=0, tls=None):
+        self.httpd = StubServer((host, port), StubHandler)
+        if tls:
+            self.httpd.tls_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            self.httpd.tls_context.load_cert_chain(*tls)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        scheme = "http" if self.httpd.tls_context is None else "https"
+        return f"{scheme}://{host}:{port}"
+
+    @property
+    def hits(self):
+        return self.httpd.hits
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import urllib.request
+
+    with LocalServer() as server:
+        print("Serving on", server.url)
+        with urllib.request.urlopen(server.url + "/get?name=python") as response:
+            print(response.status, response.read())
@@ -0,0 +1,150 @@
+"""
+- What is wrong with the URL-checking loop in 3_request.py?
+
+    for url in URLS:
+        response = requests.get(url)
+        response.raise_for_status()
+
+  Every request waits for the previous one to finish. If each URL takes 200ms,
+  then 100 URLs take 100 * 200ms = 20 seconds, and during almost all of that time
+  our program is doing nothing, it is just waiting for the network.
+
+- Fan-out
+  Waiting for the network is I/O, and Python threads release the GIL while waiting
+  for I/O. So we can start many requests at the same time with a thread pool:
+
+    concurrent.futures.ThreadPoolExecutor(max_workers=10)
+
+  With 10 workers the same 100 URLs take about 100 * 200ms / 10 = 2 seconds.
+
+- But be polite with servers
+  If all our URLs point to the same host, 10 parallel connections may look like an
+  attack (or get us rate-limited). So we also keep a per-host limit: at most
+  `per_host` requests in flight to one host, while other hosts can still use the
+  free workers.
+
+- Results as they complete
+  fetch_all() is a generator: it yields every result as soon as that request
+  finishes, so we can print/process fast URLs while slow ones are still running.
+"""
+
+import time
+from collections import Counter, deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import HTTPError
+
+# outcome is one of "success", "http_error" (4xx/5xx) or "other_error" (DNS, timeout, ...)
+FetchResult = namedtuple("FetchResult", ["url", "status_code", "outcome", "error", "elapsed"])
+
+
+def check_url(session, url, timeout=10):
+    # same classification as the loop in 3_request.py, but returned instead of printed
+    start = time.perf_counter()
+    try:
+        response = session.get(url, timeout=timeout)
+        response.raise_for_status()
+    except HTTPError as http_err:
+        status_code = http_err.response.status_code if http_err.response is not None else None
+        return FetchResult(url, status_code, "http_error", http_err, time.perf_counter() - start)
+    except Exception as err:
+        return FetchResult(url, None, "other_error", err, time.perf_counter() - start)
+    else:
+        return FetchResult(url, response.status_code, "success", None, time.perf_counter() - start)
+
+
+def fetch_all(urls, max_workers=10, per_host=4, timeout=10, session=None):
+    """Check all urls concurrently and yield a FetchResult for each one as it completes."""
+    if session is None:
+        # one connection pool per host, big enough for every worker
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=max_workers)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+    # group the urls by host, so we can respect per_host
+    pending = {}
+    for url in urls:
+        pending.setdefault(urlsplit(url).netloc, deque()).append(url)
+
+    active = Counter()  # host -> requests in flight
+    in_flight = {}      # future -> host
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+
+        def submit_more():
+            # round-robin over the hosts, one url at a time, until every worker is busy
+            # or every host has reached its per_host limit
+            progress = True
+            while progress and len(in_flight) < max_workers:
+                progress = False
+                for host, queue in pending.items():
+                    if queue and active[host] < per_host and len(in_flight) < max_workers:
+                        future = pool.submit(check_url, session, queue.popleft(), timeout)
+                        in_flight[future] = host
+                        active[host] += 1
+                        progress = True
+
+        try:
+            submit_more()
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    active[in_flight.pop(future)] -= 1
+                    yield future.result()
+                submit_more()
+        finally:
+            # the caller may stop iterating early, don't start anything new
+            for future in in_flight:
+                future.cancel()
+
+
+if __name__ == "__main__":
+    import importlib
+
+    LocalServer = importlib.import_module("7_local_http_server").LocalServer
+
+    N = 40
+    LATENCY = 0.1
+    CONCURRENCY = 10
+
+    with LocalServer() as server:
+        # half of the urls go to "127.0.0.1" and half to "localhost",
+        # so the per-host limit has two hosts to balance
+        port = server.httpd.server_address[1]
+        urls = [
+            f"http://{host}:{port}/get?delay={LATENCY}&i={i}"
+            for i in range(N // 2)
+            for host in ("127.0.0.1", "localhost")
+        ]
+        urls.append(f"http://127.0.0.1:{port}/status/404")
+
+        # --------------------------
+        # The loop from 3_request.py
+        # --------------------------
+        start = time.perf_counter()
+        session = requests.Session()
+        for url in urls:
+            check_url(session, url)
+        sequential = time.perf_counter() - start
+
+        # --------------------------
+        # Fan-out
+        # --------------------------
+        start = time.perf_counter()
+        outcomes = Counter()
+        for result in fetch_all(urls, max_workers=CONCURRENCY, per_host=CONCURRENCY // 2):
+            outcomes[result.outcome] += 1
+            if result.outcome == "http_error":
+                print(f"HTTP error occurred: {result.error}")
+            elif result.outcome == "other_error":
+                print(f"Other error occurred: {result.error}")
+        concurrent = time.perf_counter() - start
+
+    print(outcomes)
+    print(f"sequential: {sequential:.2f}s (expected ~ N x latency = {len(urls) * LATENCY:.2f}s)")
+    print(f"fan-out:    {concurrent:.2f}s (expected ~ latency x N / concurrency = "
+          f"{len(urls) * LATENCY / CONCURRENCY:.2f}s)")
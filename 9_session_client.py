@@ -0,0 +1,231 @@
+"""
+- Why is requests.get() slow when we call it many times?
+  requests.get() is a shortcut for:
+
+    with requests.Session() as session:
+        return session.get(url)
+
+  So every call creates a new Session, opens a new TCP connection (and for https a
+  new TLS handshake, which costs a few round-trips and some CPU), sends ONE request
+  and then closes everything again.
+
+- Session + HTTPAdapter = connection pool
+  A Session keeps its connections open (keep-alive) and reuses them for the next
+  request to the same host. The pool is configured on the HTTPAdapter:
+
+    pool_connections - for how many different hosts we keep a pool
+    pool_maxsize     - how many connections we keep open to ONE host
+                       (this should be >= the number of threads using the session)
+
+- HTTPClient below is one shared object for all the examples of 3_request.py
+  (GET, params, headers, auth, API keys, POST form/json, file upload).
+  It has the same get/post/... methods as requests, and it counts:
+
+    hits   - requests that reused an already open connection
+    misses - requests that had to open a new connection
+
+  Different hosts can get different pool sizes with configure_host().
+"""
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+class PoolStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+
+    def record_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def record_new_connection(self):
+        with self.lock:
+            self.new_connections += 1
+
+    @property
+    def misses(self):
+        return self.new_connections
+
+    @property
+    def hits(self):
+        return max(self.requests - self.new_connections, 0)
+
+    def as_dict(self):
+        return {"requests": self.requests, "hits": self.hits, "misses": self.misses}
+
+
+class _CountingPoolMixin:
+    # a connection without a socket opens a new one: a brand new connection object, but also
+    # a pooled one whose socket was closed (Connection: close, or dropped by the server)
+    stats = None
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        if conn.sock is None:
+            self.stats.record_new_connection()
+        return conn
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter that counts connection pool hits and misses."""
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, max_retries=0, pool_block=False):
+        self.stats = PoolStats()
+        super().__init__(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=max_retries,
+            pool_block=pool_block,
+        )
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        stats = self.stats
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": type("CountingHTTPConnectionPool", (_CountingPoolMixin, HTTPConnectionPool), {"stats": stats}),
+            "https": type("CountingHTTPSConnectionPool", (_CountingPoolMixin, HTTPSConnectionPool), {"stats": stats}),
+        }
+
+    def send(self, request, **kwargs):
+        self.stats.record_request()
+        return super().send(request, **kwargs)
+
+
+class HTTPClient:
+    """One requests.Session with pooled, keep-alive connections, shared by all callers."""
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, max_retries=0, timeout=30, headers=None,
+                 adapter_class=PooledAdapter):
+        self.timeout = timeout
+        self.adapter_class = adapter_class
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        self.adapters = {}
+        for prefix in ("https://", "http://"):
+            self.mount(prefix, adapter_class(pool_connections, pool_maxsize, max_retries))
+
+    def mount(self, prefix, adapter):
+        self.adapters[prefix] = adapter
+        self.session.mount(prefix, adapter)
+
+    def configure_host(self, base_url, pool_maxsize=10, pool_connections=1, max_retries=0):
+        # requests picks the adapter with the longest matching prefix,
+        # so this host gets its own pool and the rest keep the default one
+        self.mount(base_url, self.adapter_class(pool_connections, pool_maxsize, max_retries))
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, params=None, **kwargs):
+        return self.request("GET", url, params=params, **kwargs)
+
+    def head(self, url, **kwargs):
+        kwargs.setdefault("allow_redirects", False)
+        return self.request("HEAD", url, **kwargs)
+
+    def post(self, url, data=None, json=None, **kwargs):
+        return self.request("POST", url, data=data, json=json, **kwargs)
+
+    def put(self, url, data=None, **kwargs):
+        return self.request("PUT", url, data=data, **kwargs)
+
+    def patch(self, url, data=None, **kwargs):
+        return self.request("PATCH", url, data=data, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def stats(self):
+        per_prefix = {prefix: adapter.stats.as_dict() for prefix, adapter in self.adapters.items()}
+        total = {key: sum(stats[key] for stats in per_prefix.values()) for key in ("requests", "hits", "misses")}
+        return {"total": total, "adapters": per_prefix}
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# --------------------------
+# The shared client
+# Use these module level functions the same way as requests.get/requests.post
+# --------------------------
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def default_client():
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = HTTPClient()
+        return _default_client
+
+
+def get(url, params=None, **kwargs):
+    return default_client().get(url, params=params, **kwargs)
+
+
+def post(url, data=None, json=None, **kwargs):
+    return default_client().post(url, data=data, json=json, **kwargs)
+
+
+if __name__ == "__main__":
+    import importlib
+    import io
+    import time
+
+    from requests.auth import HTTPBasicAuth, HTTPDigestAuth
+
+    LocalServer = importlib.import_module("7_local_http_server").LocalServer
+
+    with LocalServer() as server:
+        base = server.url
+        client = default_client()
+
+        # --------------------------
+        # every example from 3_request.py, through the one shared client
+        # --------------------------
+        client.get(base + "/get")
+        client.get(base + "/get", params={"key1": "value1", "key2": "value2"})
+        client.get(base + "/get", headers={"User-Agent": "MyCustomUserAgent/1.0", "Accept": "application/json"})
+        client.get(base + "/get", auth=("username", "password"))
+        client.get(base + "/get", auth=HTTPBasicAuth("username", "password"))
+        client.get(base + "/get", auth=HTTPDigestAuth("username", "password"))
+        client.get(base + "/get", headers={"Authorization": "Bearer YOUR_OAUTH_TOKEN"})
+        client.get(base + "/get", headers={"Authorization": "ApiKey YOUR_API_KEY"})
+        client.post(base + "/post", data={"name": "John Doe", "email": "john.doe@example.com"})
+        client.post(base + "/post", json={"key": "value", "key2": "value2"})
+        client.post(base + "/post", files={"file": ("file.txt", io.BytesIO(b"hello"))})
+        print("shared client:", client.stats()["total"])
+
+        # --------------------------
+        # one-shot requests.get vs the pooled client
+        # --------------------------
+        N = 300
+        start = time.perf_counter()
+        for _ in range(N):
+            requests.get(base + "/get")
+        one_shot = time.perf_counter() - start
+
+        with HTTPClient() as pooled:
+            start = time.perf_counter()
+            for _ in range(N):
+                pooled.get(base + "/get")
+            reused = time.perf_counter() - start
+            stats = pooled.stats()["total"]
+
+        print(f"requests.get: {N} requests, {N} connections, {one_shot:.2f}s")
+        print(f"HTTPClient:   {N} requests, {stats['misses']} connection(s), {reused:.2f}s, {stats}")